@@ -0,0 +1,22 @@
+# common/config/minio_client.py
+from io import BytesIO
+from minio import Minio
+from common.config.settings import settings
+
+
+def get_minio_client() -> Minio:
+    """Client for code shared by both services; each service also has its own minio_client."""
+    return Minio(
+        endpoint=settings.MINIO_ENDPOINT,
+        access_key=settings.MINIO_ACCESS_KEY,
+        secret_key=settings.MINIO_SECRET_KEY,
+        secure=False
+    )
+
+
+def put_bytes(object_name: str, data: bytes, content_type: str = "application/octet-stream",
+              bucket: str = None) -> str:
+    """Upload bytes and return the "bucket/object" path."""
+    bucket = bucket or settings.MINIO_BUCKET
+    get_minio_client().put_object(bucket, object_name, BytesIO(data), length=len(data), content_type=content_type)
+    return f"{bucket}/{object_name}"
@@ -0,0 +1,22 @@
+import redis
+from common.config.settings import settings
+
+_clients = {}
+
+
+def get_redis(db: int = None) -> redis.Redis:
+    """
+    Shared Redis client. db defaults to REDIS_STATE_DB (application state);
+    the Celery broker lives in db 0 and the result backend in db 1.
+    """
+    db = settings.REDIS_STATE_DB if db is None else db
+    client = _clients.get(db)
+    if client is None:
+        client = redis.Redis(
+            host=settings.REDIS_HOST,
+            port=settings.REDIS_PORT,
+            db=db,
+            decode_responses=True,
+        )
+        _clients[db] = client
+    return client
@@ -19,6 +19,167 @@ class Settings(BaseSettings):
     # Redis Configuration
     REDIS_HOST: str
     REDIS_PORT: int
+    REDIS_STATE_DB: int = 2  # application state; 0/1 are the Celery broker/backend
+
+    # Ingestion
+    UPLOAD_CONCURRENCY: int = 8  # max parallel MinIO uploads per /upload batch
+    CHUNKED_UPLOAD_MAX_BYTES: int = 500 * 1024 * 1024
+    CHUNKED_UPLOAD_CHUNK_SIZE: int = 8 * 1024 * 1024  # MinIO parts must be ≥ 5 MiB
+    CHUNKED_UPLOAD_TTL_S: int = 24 * 3600  # resumable window after the last chunk
+    CHUNKED_UPLOAD_BYTES_PER_PAGE_ESTIMATE: int = 300 * 1024  # admission estimate for PDFs
+
+    # Ingestion — admission control on /upload
+    ADMISSION_ENABLED: bool = True
+    ADMISSION_MAX_QUEUE_DEPTH: int = 200  # queued preprocess jobs in the broker
+    ADMISSION_MAX_INFLIGHT_PAGES: int = 5000  # accepted but not yet preprocessed pages
+    ADMISSION_LOW_PRIORITY_MAX_QUEUE_DEPTH: int = 2000  # hard cap even for low-priority batches
+    ADMISSION_THROUGHPUT_WINDOW_S: int = 900  # window for observed pages/sec
+    ADMISSION_INFLIGHT_TTL_S: int = 6 * 3600  # forget batches that never reported back
+    ADMISSION_RETRY_AFTER_MIN_S: int = 5
+    ADMISSION_RETRY_AFTER_MAX_S: int = 3600
+    ADMISSION_RETRY_AFTER_DEFAULT_S: int = 60  # used before any throughput is observed
+
+    # Ingestion — fair-share scheduling of preprocess jobs (fair_scheduler.py)
+    FAIR_SCHEDULING_ENABLED: bool = True  # False = straight to Celery, FIFO
+    FAIR_TENANT_KEY: str = "branch_id"  # branch_id | uploader_id; the other one is the fallback
+    FAIR_TENANT_WEIGHTS: str = ""  # e.g. "BR-0042=2,BR-0107=0.5"; unlisted tenants weigh 1
+    FAIR_QUANTUM_PAGES: int = 20  # pages a weight-1 tenant earns per round-robin turn
+    FAIR_LOW_PRIORITY_WEIGHT: float = 0.25  # all low-priority batches share one tenant of this weight
+    FAIR_INTERACTIVE_MAX_PAGES: int = 5  # single-file uploads up to this size are interactive
+    FAIR_MAX_DISPATCHED: int = 16  # jobs handed to Celery and not finished; ≈ total worker concurrency
+    FAIR_INTERACTIVE_RESERVED: int = 4  # of those, slots bulk jobs may not take
+    FAIR_DISPATCHED_TTL_S: int = 2 * 3600  # free slots of jobs that never reported finishing
+    FAIR_DISPATCH_INTERVAL_S: float = 1.0  # safety-net dispatcher loop
+    FAIR_WAIT_SAMPLES: int = 500  # recent queue waits kept per class and tenant for /scheduler
+    FAIR_METRICS_TTL_S: int = 24 * 3600  # idle tenants drop out of /scheduler after this
+
+    # Celery worker (see WORKER_PROFILES in services/ingestion_service/celery_app.py)
+    CELERY_WORKER_PROFILE: str = "threads"  # solo | prefork | threads
+    CELERY_WORKER_CONCURRENCY: int = 0  # 0 = derive from the profile and CPU count
+    CELERY_PREFETCH_MULTIPLIER: int = 0  # 0 = the profile's (threads 4, solo / prefork 1)
+    CELERY_TASK_SOFT_TIME_LIMIT: int = 1800  # seconds; prefork only, see celery_app.py
+    CELERY_TASK_TIME_LIMIT: int = 1900  # seconds, hard kill; prefork only
+    CELERY_MAX_MEMORY_PER_CHILD_KB: int = 512000  # prefork only
+    CELERY_MAX_TASKS_PER_CHILD: int = 200  # prefork only
+    PREPROCESS_MAX_RETRIES: int = 5
+    PREPROCESS_RETRY_BACKOFF_S: int = 30  # doubles each retry
+
+    # Ingestion — bulk ZIP / PDF export (export.py, routers/export_router.py)
+    EXPORT_PREFETCH_OBJECTS: int = 4  # objects read concurrently ahead of the writer
+    EXPORT_PREFETCH_CHUNKS: int = 4  # chunks buffered per object in flight
+    EXPORT_CHUNK_BYTES: int = 1024 * 1024
+    EXPORT_MAX_ENTRIES: int = 100_000  # files per export; larger date ranges get 413
+    EXPORT_CRC_TTL_S: int = 7 * 24 * 3600  # cached CRCs let resumed ZIP downloads skip re-reads
+    EXPORT_PDF_DPI: int = 150  # enhanced pages' resolution, sets the PDF page size
+
+    # Status events (preprocessing_service/outbox.py → ingestion_service/outbox_consumer.py)
+    STATUS_STREAM: str = "docintel:status_events"  # Redis stream in REDIS_STATE_DB
+    STATUS_STREAM_MAXLEN: int = 1_000_000  # approximate cap; trimming also drops unconsumed entries
+    STATUS_CONSUMER_GROUP: str = "ingestion"
+    STATUS_CONSUMER_BATCH: int = 200  # entries read and applied per DB transaction
+    STATUS_CONSUMER_BLOCK_MS: int = 2000
+    STATUS_CLAIM_IDLE_MS: int = 60_000  # pending entries idle this long are taken over from dead consumers
+    STATUS_MAX_DELIVERIES: int = 5  # then the entry is moved to STATUS_DEAD_LETTER_STREAM
+    STATUS_DEAD_LETTER_STREAM: str = "docintel:status_events:dead"
+
+    # Pipeline version, stored with every page result: bump it when enhancement or
+    # classification output changes, and services/scripts/backfill.py reprocesses older pages
+    PIPELINE_VERSION: str = "1"
+
+    # Bulk reprocessing (services/scripts/backfill.py)
+    BACKFILL_RATE: float = 2.0  # jobs handed out per second
+    BACKFILL_MAX_QUEUE_DEPTH: int = 50  # celery mode pauses while this many jobs wait to run
+    BACKFILL_MAX_FILES_PER_JOB: int = 20  # documents of one batch grouped into a job
+    BACKFILL_CHECKPOINT_INTERVAL_S: float = 5.0
+    BACKFILL_REPORT_INTERVAL_S: float = 30.0  # throughput / ETA log line
+
+    # Preprocessing — per-page checkpoints for resumable batches
+    CHECKPOINT_TTL_S: int = 7 * 24 * 3600
+
+    # Preprocessing — image-quality gate
+    QUALITY_GATE_ENABLED: bool = True
+    QUALITY_ANALYSIS_MAX_SIDE: int = 512  # longest side of the downsampled analysis copy
+    QUALITY_BLUR_THRESHOLD: float = 100.0  # Laplacian variance below this → deblur (sharpen)
+    QUALITY_MIN_DEBLUR_MEGAPIXELS: float = 0.2  # ... unless the page is smaller than this
+    QUALITY_CONTRAST_THRESHOLD: float = 40.0  # grayscale std-dev below this → CLAHE
+    QUALITY_DYNAMIC_RANGE_THRESHOLD: int = 150  # p98 - p2 below this → CLAHE
+    QUALITY_SKEW_THRESHOLD_DEG: float = 0.5  # |skew| at or above this → deskew
+    QUALITY_SKEW_MAX_DEG: float = 15.0  # ... but not beyond this
+
+    # Preprocessing — enhancement engine (processor/engine.py)
+    ENHANCE_STAGES: str = "deblur,clahe,deskew"  # any of: deblur, wiener, clahe, deskew, limit_width
+    ENHANCE_CLAHE_CLIP_LIMIT: float = 7.68  # = skimage clip_limit 0.03 × 256 bins
+    ENHANCE_CLAHE_TILES: int = 8
+    ENHANCE_WIENER_BALANCE: float = 0.1
+    ENHANCE_SHARPEN_SIGMA: float = 1.0  # deblur: unsharp-mask Gaussian sigma in px
+    ENHANCE_SHARPEN_AMOUNT: float = 1.0  # deblur: weight of the added detail
+    ENHANCE_MAX_WIDTH: int = 1800  # used by the limit_width stage
+    ENHANCE_CROP: bool = True  # cut photographed documents out of their background (not PDF pages)
+    CROP_ANALYSIS_MAX_SIDE: int = 640  # boundary detection runs on a copy this size
+    CROP_MIN_AREA_RATIO: float = 0.15  # smaller outlines are not the document
+    CROP_MAX_AREA_RATIO: float = 0.9  # the document already fills the frame — don't crop
+    ENHANCE_TILE_SIZE: int = 1024  # tile edge in px for large pages; 0 disables tiling
+    ENHANCE_TILE_MIN_PIXELS: int = 12_000_000  # only pages at least this big are tiled
+    ENHANCE_TILE_WORKERS: int = 0  # 0 = one thread per core
+
+    # Preprocessing — native PDF page content (processor/pdf_analyzer.py)
+    PDF_NATIVE_EXTRACTION: bool = True  # False = render every PDF page at 2x, as before
+    PDF_IMAGE_MIN_COVERAGE: float = 0.9  # one image covering this much of the page is the scan
+    PDF_NATIVE_MAX_SCALE: float = 2.5  # embedded scans larger than this × the 2x render are rendered down
+    PDF_TEXT_MIN_CHARS: int = 50  # a text layer this long makes a page digital (no enhancement stages)
+
+    # Preprocessing — memory-budget page scheduler (scheduler.py)
+    WORKER_MEMORY_BUDGET_BYTES: int = 0  # per process; 0 = WORKER_MEMORY_BUDGET_FRACTION of the memory limit
+    WORKER_MEMORY_BUDGET_FRACTION: float = 0.6  # of the cgroup limit (or MemTotal)
+    PAGE_MEMORY_SAFETY_FACTOR: float = 1.3  # multiplier on the bytes-per-pixel estimate
+    PAGE_MEMORY_OVERHEAD_BYTES: int = 32 * 1024 ** 2  # fixed per-page cost (classifier input, encoders)
+    RSS_SAMPLE_INTERVAL_S: float = 0.05
+
+    # Preprocessing — overlapped fetch / render / enhance / upload in process_batch (pipeline.py)
+    PIPELINE_PREFETCH_FILES: int = 1  # input files fetched ahead of the one being enhanced; 0 = inline
+    PIPELINE_RENDER_AHEAD: int = 2  # PDF pages rendered ahead of enhancement; 0 = inline
+    PIPELINE_UPLOADS_IN_FLIGHT: int = 4  # per file; enhancement waits when this many pages are pending
+    PIPELINE_UPLOAD_WORKERS: int = 8  # upload threads per process, shared by all batches
+
+    # Preprocessing — node-local MinIO object cache (object_cache.py)
+    OBJECT_CACHE_ENABLED: bool = True
+    OBJECT_CACHE_DIR: str = "cache/objects"  # one pid<N> subdirectory per process
+    OBJECT_CACHE_DISK_BYTES: int = 2 * 1024 ** 3  # per process
+    OBJECT_CACHE_MEMORY_BYTES: int = 256 * 1024 ** 2  # per process
+    OBJECT_CACHE_MEMORY_MAX_ITEM_BYTES: int = 4 * 1024 ** 2  # larger objects are cached on disk only
+    OBJECT_CACHE_MMAP_MIN_BYTES: int = 16 * 1024 ** 2  # inputs this large are decoded from an mmap, not read into memory
+    OBJECT_CACHE_REVALIDATE_S: float = 300  # re-check the ETag of entries older than this
+
+    # Preprocessing — near-duplicate detection (dedup.py, processor/phash.py)
+    DEDUP_ENABLED: bool = True
+    DEDUP_MAX_DISTANCE: int = 3  # pHash Hamming radius; ≤ 3 keeps the 4-chunk index exact
+    DEDUP_DHASH_MAX_DISTANCE: int = 8  # dHash must agree too, to reject pHash collisions
+    DEDUP_MAX_CANDIDATES: int = 1000  # lookups examining more index rows than this are logged
+
+    # Preprocessing — document classifier
+    CLASSIFIER_BACKEND: str = "pytorch"  # pytorch | onnx | onnx-int8
+    CLASSIFIER_ONNX_DIR: str = "models/onnx"
+    CLASSIFIER_ONNX_THREADS: int = 0  # 0 = let ONNX Runtime decide
+    MODEL_CACHE_DIR: str = "models/hf"  # local Hugging Face cache for from_pretrained
+    MODEL_OFFLINE: bool = False  # True → never hit the Hub, load only from MODEL_CACHE_DIR
+
+    # Reaper (services/scripts/reaper.py)
+    REAPER_TEMP_MAX_AGE_S: int = 2 * 3600  # docintel_* temp files older than this are stale (> task time limit)
+    REAPER_ORPHAN_RETENTION_S: int = 7 * 24 * 3600  # never delete enhanced objects younger than this
+    REAPER_DELETE_BATCH_SIZE: int = 1000  # keys per bulk-delete request (S3 maximum)
+    REAPER_INTERVAL_S: int = 3600  # period of --loop
+
+    # Profiling (common/utils/profiling.py) — per request with X-Profile, per task with profile=
+    PROFILE_SAMPLE_RATE: float = 0.0  # fraction of executions profiled without being asked
+    PROFILE_DEFAULT_MODE: str = "cprofile"  # cprofile | sample; used for "X-Profile: 1" and sampling
+    PROFILE_SAMPLE_INTERVAL_S: float = 0.005  # stack sampling period of the sample mode
+    PROFILE_TOP_N: int = 50  # functions in the .txt summary of a cprofile run
+
+    # Logging (common/utils/logger.py)
+    LOG_LEVEL: str = "INFO"
+    LOG_FORMAT: str = "json"  # json | text
+    LOG_QUEUE_SIZE: int = 10_000  # records buffered for the writer thread; overflow is dropped
+    LOG_PAGE_SAMPLE_RATE: float = 0.1  # fraction of per-page INFO records kept
 
     # Environment
     ENV: str = "development"
@@ -1,11 +1,173 @@
+import atexit
+import contextvars
+import json
 import logging
+import os
+import queue
+import random
+import sys
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from common.config.settings import settings
 
-def get_logger(name: str):
+# Loggers returned by get_logger never write to stderr themselves: records are put on a
+# bounded in-memory queue and a single listener thread formats and writes them. A full
+# queue drops records (counted in dropped_records()) instead of blocking a hot loop.
+#
+# Context set with log_context(batch_id=..., page=...) is attached to every record logged
+# inside the block (contextvars, so it follows asyncio tasks and run_in_threadpool calls).
+
+_context = contextvars.ContextVar("log_context", default={})
+
+# LogRecord attributes that are not user-supplied `extra` fields
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "context"}
+
+
+@contextmanager
+def log_context(**fields):
+    """Attach fields (batch_id, page, ...) to every record logged inside the block."""
+    token = _context.set({**_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, message, context and extra fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update(getattr(record, "context", None) or {})
+        entry.update({k: v for k, v in vars(record).items() if k not in _RESERVED})
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    """The original human-readable format, with context fields appended."""
+
+    def __init__(self):
+        super().__init__("%(asctime)s [%(levelname)s] - %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        context = getattr(record, "context", None)
+        if context:
+            line += " " + " ".join(f"{k}={v}" for k, v in context.items())
+        return line
+
+
+class SamplingFilter(logging.Filter):
+    """Keep a fraction of records below WARNING; warnings and errors always pass."""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.WARNING or random.random() < self.rate
+
+
+class _AsyncQueueHandler(QueueHandler):
+    """
+    Captures context and renders the message in the calling thread (args may be mutable),
+    then hands the record to the listener without blocking.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = logging.makeLogRecord(vars(record))
+        record.context = _context.get()
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_handler = None
+_listener = None
+_lock = threading.Lock()
+
+
+def _start_listener():
+    """Give _handler a fresh queue and start the listener thread that drains it."""
+    global _listener
+    log_queue = queue.Queue(maxsize=settings.LOG_QUEUE_SIZE)
+    stream = logging.StreamHandler(sys.stderr)
+    stream.setFormatter(JsonFormatter() if settings.LOG_FORMAT == "json" else TextFormatter())
+    _handler.queue = log_queue
+    _listener = QueueListener(log_queue, stream, respect_handler_level=True)
+    _listener.start()
+
+
+def _stop_listener():
+    # flush whatever is still queued on interpreter exit
+    if _listener is not None:
+        _listener.stop()
+
+
+def _get_handler() -> _AsyncQueueHandler:
+    global _handler
+    with _lock:
+        if _handler is None:
+            _handler = _AsyncQueueHandler(None)
+            _start_listener()
+            atexit.register(_stop_listener)
+    return _handler
+
+
+def _after_fork_in_child():
+    # A forked worker (Celery prefork, gunicorn/uvicorn workers) inherits the handler
+    # but not the listener thread; without a new one its records would never be written.
+    # The parent's unwritten records stay behind with the old queue.
+    global _lock
+    _lock = threading.Lock()
+    if _handler is not None:
+        _handler.dropped = 0
+        _start_listener()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def dropped_records() -> int:
+    """Records discarded because the log queue was full."""
+    return _handler.dropped if _handler else 0
+
+
+def get_logger(name: str, sample_rate: float = None):
+    """
+    Logger writing through the shared async queue handler. With `sample_rate` only that
+    fraction of its DEBUG/INFO records is kept — meant for per-page messages.
+    """
     logger = logging.getLogger(name)
     if not logger.handlers:
-        handler = logging.StreamHandler()
-        formatter = logging.Formatter("%(asctime)s [%(levelname)s] - %(message)s")
-        handler.setFormatter(formatter)
-        logger.addHandler(handler)
-        logger.setLevel(logging.INFO)
+        logger.addHandler(_get_handler())
+        logger.setLevel(settings.LOG_LEVEL)
+        logger.propagate = False
+        if sample_rate is not None and sample_rate < 1.0:
+            logger.addFilter(SamplingFilter(sample_rate))
     return logger
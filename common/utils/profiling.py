@@ -0,0 +1,167 @@
+import asyncio
+import cProfile
+import io
+import marshal
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import asynccontextmanager, contextmanager
+from typing import Optional
+from common.config.settings import settings
+from common.utils.logger import get_logger
+
+logger = get_logger("profiling")
+
+# Opt-in profiling of one upload_files / preprocess_job / process_batch execution.
+#
+# Turned on per request with the X-Profile header, per task with the `profile` kwarg, or
+# for a PROFILE_SAMPLE_RATE fraction of executions. When it is off, the only cost is the
+# requested_mode() check. The artifact is stored in MinIO under <batch_id>/profiles/ and
+# its path is returned to the caller; a profile requested on /upload is passed down the
+# chain, so one header profiles the upload, the Celery job and the preprocessing run.
+#
+#   cprofile  deterministic cProfile of the calling thread → .prof (pstats / snakeviz)
+#             plus a .txt summary of the top PROFILE_TOP_N functions by cumulative time
+#   sample    every thread's stack every PROFILE_SAMPLE_INTERVAL_S → .collapsed
+#             (flamegraph.pl / speedscope); covers worker threads, at lower overhead
+#
+# Both see the whole process: concurrent requests show up in the profile too. Coroutines
+# use profiled_async(), which always samples: cProfile on the event loop thread would
+# charge every request the loop interleaves to this one. It also stores the artifact from
+# a worker thread, so the MinIO upload doesn't block the loop.
+
+HEADER = "X-Profile"
+MODES = ("cprofile", "sample")
+_ON = ("1", "true", "yes", "on")
+
+
+def requested_mode(value=None) -> Optional[str]:
+    """Profile mode for this execution, or None: an explicit request wins, else sampling."""
+    if value is not None and value != "":
+        value = str(value).strip().lower()
+        if value in MODES:
+            return value
+        return settings.PROFILE_DEFAULT_MODE if value in _ON else None
+    if settings.PROFILE_SAMPLE_RATE > 0 and random.random() < settings.PROFILE_SAMPLE_RATE:
+        return settings.PROFILE_DEFAULT_MODE
+    return None
+
+
+class _StackSampler:
+    def __init__(self, interval_s: float):
+        self.interval_s = interval_s
+        self.stacks = Counter()
+        self.samples = 0
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self) -> bytes:
+        self._done.set()
+        self._thread.join()
+        lines = [f"{stack} {count}" for stack, count in self.stacks.most_common()]
+        return ("\n".join(lines) + "\n").encode()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._done.wait(self.interval_s):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+
+class Profile:
+    """A running profile; `path` is where the artifact will be stored."""
+
+    def __init__(self, mode: str, batch_id: str, name: str):
+        stamp = time.strftime("%Y%m%dT%H%M%S", time.gmtime())
+        ext = "prof" if mode == "cprofile" else "collapsed"
+        self.mode = mode
+        self.object_name = f"{batch_id}/profiles/{name}-{stamp}-{os.getpid()}.{ext}"
+        self.path = f"{settings.MINIO_BUCKET}/{self.object_name}"
+        self._profiler = None
+        self._sampler = None
+
+    def start(self):
+        if self.mode == "cprofile":
+            self._profiler = cProfile.Profile()
+            try:
+                self._profiler.enable()
+                return
+            except ValueError as e:
+                # another profiler is already active in this interpreter
+                logger.warning("cProfile unavailable (%s); sampling instead", e)
+                self._profiler = None
+                self.mode = "sample"
+        self._sampler = _StackSampler(settings.PROFILE_SAMPLE_INTERVAL_S)
+        self._sampler.start()
+
+    def stop_and_store(self, wall_s: float):
+        from common.config.minio_client import put_bytes
+
+        if self._profiler is not None:
+            self._profiler.disable()
+            self._profiler.create_stats()
+            put_bytes(self.object_name, marshal.dumps(self._profiler.stats))
+            summary = io.StringIO()
+            summary.write(f"wall time {wall_s:.3f}s\n")
+            pstats.Stats(self._profiler, stream=summary).sort_stats("cumulative").print_stats(settings.PROFILE_TOP_N)
+            put_bytes(self.object_name.rsplit(".", 1)[0] + ".txt", summary.getvalue().encode(), "text/plain")
+        else:
+            put_bytes(self.object_name, self._sampler.stop(), "text/plain")
+
+
+@contextmanager
+def profiled(mode: Optional[str], batch_id: str, name: str):
+    """
+    Profile the block if mode is set; yields the Profile (for its .path) or None.
+    The artifact is stored on exit, also when the block raises.
+    """
+    if mode is None:
+        yield None
+        return
+    profile = Profile(mode, batch_id, name)
+    t0 = time.perf_counter()
+    profile.start()
+    try:
+        yield profile
+    finally:
+        _store(profile, batch_id, name, time.perf_counter() - t0)
+
+
+@asynccontextmanager
+async def profiled_async(mode: Optional[str], batch_id: str, name: str):
+    """profiled() for a block that awaits: sampled, and stored off the event loop."""
+    if mode is None:
+        yield None
+        return
+    profile = Profile("sample", batch_id, name)
+    t0 = time.perf_counter()
+    profile.start()
+    try:
+        yield profile
+    finally:
+        await asyncio.to_thread(_store, profile, batch_id, name, time.perf_counter() - t0)
+
+
+def _store(profile: Profile, batch_id: str, name: str, wall_s: float):
+    try:
+        profile.stop_and_store(wall_s)
+        logger.info("Stored %s profile of %s (%.2fs) at %s", profile.mode, name, wall_s, profile.path)
+    except Exception as e:
+        logger.warning("Could not store profile of %s for batch %s: %s", name, batch_id, e)
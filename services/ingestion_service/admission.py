@@ -0,0 +1,150 @@
+# services/ingestion_service/admission.py
+import math
+import re
+import time
+from common.config.redis_client import get_redis
+from common.config.settings import settings
+from common.utils.logger import get_logger
+from .celery_app import DEFAULT_QUEUE, PRIORITY_STEPS, LOW_PRIORITY
+from . import fair_scheduler
+
+logger = get_logger("ingestion_admission")
+
+INFLIGHT_PAGES_KEY = "docintel:admission:inflight_pages"  # hash batch_id → pages
+INFLIGHT_SINCE_KEY = "docintel:admission:inflight_since"  # zset batch_id → enqueue time
+COMPLETED_KEY_PREFIX = "docintel:admission:completed:"  # per-minute completed-page counters
+
+_PDF_PAGE_RE = re.compile(rb"/Type\s*/Page(?![a-zA-Z])")
+
+
+def _pdf_page_count(content: bytes):
+    """/Count of the page tree, or None if PyMuPDF is missing or can't open the file."""
+    try:
+        import fitz  # PyMuPDF — imported lazily to keep service startup fast
+
+        with fitz.open(stream=content, filetype="pdf") as doc:
+            return doc.page_count
+    except Exception as e:
+        logger.debug("PDF page tree unreadable, counting /Type /Page instead: %s", e)
+        return None
+
+
+def estimate_pages(content: bytes, content_type: str) -> int:
+    """
+    Page count of an upload. PDFs are read from the page tree, which also covers page
+    objects packed into compressed object streams (PDF >= 1.5); the /Type /Page regex is
+    only the fallback for files the parser rejects.
+    """
+    if content_type == "application/pdf":
+        count = _pdf_page_count(content)
+        if count:
+            return count
+        return max(1, len(_PDF_PAGE_RE.findall(content)))
+    return 1
+
+
+def broker_queue_depth() -> int:
+    """
+    Jobs waiting to run: those in the Celery broker, summed over every priority list, plus
+    those fair_scheduler is still holding back.
+    """
+    broker = get_redis(db=0)
+    keys = [DEFAULT_QUEUE if step == 0 else f"{DEFAULT_QUEUE}:{step}" for step in PRIORITY_STEPS]
+    pipe = broker.pipeline(transaction=False)
+    for key in keys:
+        pipe.llen(key)
+    return sum(pipe.execute()) + fair_scheduler.queued_jobs()
+
+
+def _inflight(r) -> tuple:
+    """(pages, batches) accepted but not yet reported back; stale batches are dropped."""
+    expired = r.zrangebyscore(INFLIGHT_SINCE_KEY, 0, time.time() - settings.ADMISSION_INFLIGHT_TTL_S)
+    if expired:
+        pipe = r.pipeline()
+        pipe.hdel(INFLIGHT_PAGES_KEY, *expired)
+        pipe.zrem(INFLIGHT_SINCE_KEY, *expired)
+        pipe.execute()
+    pages = r.hvals(INFLIGHT_PAGES_KEY)
+    return sum(int(p) for p in pages), len(pages)
+
+
+def observed_throughput(r) -> float:
+    """Pages/sec completed over the last ADMISSION_THROUGHPUT_WINDOW_S."""
+    now_min = int(time.time() // 60)
+    minutes = max(1, settings.ADMISSION_THROUGHPUT_WINDOW_S // 60)
+    counts = r.mget([f"{COMPLETED_KEY_PREFIX}{m}" for m in range(now_min - minutes + 1, now_min + 1)])
+    return sum(int(c) for c in counts if c) / float(minutes * 60)
+
+
+def check_admission(num_pages: int, low_priority: bool = False) -> dict:
+    """
+    Decide whether a new batch of `num_pages` may be enqueued now.
+    Returns {"admitted", "priority", "retry_after", ...}; priority is LOW_PRIORITY when the
+    batch was only accepted because the caller opted into low-priority mode.
+    """
+    decision = {"admitted": True, "priority": None, "retry_after": None}
+    if not settings.ADMISSION_ENABLED:
+        return decision
+
+    try:
+        r = get_redis()
+        depth = broker_queue_depth()
+        inflight_pages, inflight_batches = _inflight(r)
+        throughput = observed_throughput(r)
+    except Exception as e:
+        # never refuse work because the bookkeeping is unavailable
+        logger.warning(f"Admission check skipped, Redis unavailable: {e}")
+        return decision
+
+    decision.update({
+        "queue_depth": depth,
+        "inflight_pages": inflight_pages,
+        "throughput_pages_per_s": round(throughput, 3),
+    })
+
+    pages_excess = inflight_pages + num_pages - settings.ADMISSION_MAX_INFLIGHT_PAGES
+    jobs_excess = depth + 1 - settings.ADMISSION_MAX_QUEUE_DEPTH
+    if pages_excess <= 0 and jobs_excess <= 0:
+        return decision
+
+    if low_priority and depth < settings.ADMISSION_LOW_PRIORITY_MAX_QUEUE_DEPTH:
+        decision["priority"] = LOW_PRIORITY
+        return decision
+
+    # Time until enough backlog has drained for this batch to fit
+    avg_pages_per_batch = inflight_pages / inflight_batches if inflight_batches else num_pages
+    backlog_pages = max(pages_excess, jobs_excess * avg_pages_per_batch, 1)
+    if throughput > 0:
+        retry_after = math.ceil(backlog_pages / throughput)
+    else:
+        retry_after = settings.ADMISSION_RETRY_AFTER_DEFAULT_S
+    decision["admitted"] = False
+    decision["retry_after"] = min(max(retry_after, settings.ADMISSION_RETRY_AFTER_MIN_S),
+                                  settings.ADMISSION_RETRY_AFTER_MAX_S)
+    return decision
+
+
+def track_enqueued(batch_id: str, pages: int):
+    try:
+        r = get_redis()
+        pipe = r.pipeline()
+        pipe.hset(INFLIGHT_PAGES_KEY, batch_id, pages)
+        pipe.zadd(INFLIGHT_SINCE_KEY, {batch_id: time.time()})
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"Could not record in-flight batch {batch_id}: {e}")
+
+
+def track_completed(batch_id: str, pages: int):
+    """Batch finished preprocessing: release its in-flight pages and count them as throughput."""
+    try:
+        r = get_redis()
+        key = f"{COMPLETED_KEY_PREFIX}{int(time.time() // 60)}"
+        pipe = r.pipeline()
+        pipe.hdel(INFLIGHT_PAGES_KEY, batch_id)
+        pipe.zrem(INFLIGHT_SINCE_KEY, batch_id)
+        pipe.incrby(key, pages)
+        pipe.expire(key, settings.ADMISSION_THROUGHPUT_WINDOW_S + 120)
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"Could not record completion of batch {batch_id}: {e}")
@@ -0,0 +1,51 @@
+"""add page_hash table
+
+Revision ID: c4e8f1a2b7d3
+Revises: a90de66d3ee5
+Create Date: 2026-10-19 10:05:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4e8f1a2b7d3'
+down_revision = 'a90de66d3ee5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('page_hash',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('batch_id', sa.String(), nullable=True),
+    sa.Column('minio_path', sa.String(), nullable=True),
+    sa.Column('page', sa.Integer(), nullable=True),
+    sa.Column('enhanced_path', sa.String(), nullable=True),
+    sa.Column('phash', sa.BigInteger(), nullable=True),
+    sa.Column('dhash', sa.BigInteger(), nullable=True),
+    sa.Column('h0', sa.Integer(), nullable=True),
+    sa.Column('h1', sa.Integer(), nullable=True),
+    sa.Column('h2', sa.Integer(), nullable=True),
+    sa.Column('h3', sa.Integer(), nullable=True),
+    sa.Column('doc_type', sa.String(), nullable=True),
+    sa.Column('confidence', sa.Float(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('minio_path', 'page', name='uq_page_hash_minio_path_page')
+    )
+    op.create_index(op.f('ix_page_hash_batch_id'), 'page_hash', ['batch_id'], unique=False)
+    op.create_index(op.f('ix_page_hash_h0'), 'page_hash', ['h0'], unique=False)
+    op.create_index(op.f('ix_page_hash_h1'), 'page_hash', ['h1'], unique=False)
+    op.create_index(op.f('ix_page_hash_h2'), 'page_hash', ['h2'], unique=False)
+    op.create_index(op.f('ix_page_hash_h3'), 'page_hash', ['h3'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_page_hash_h3'), table_name='page_hash')
+    op.drop_index(op.f('ix_page_hash_h2'), table_name='page_hash')
+    op.drop_index(op.f('ix_page_hash_h1'), table_name='page_hash')
+    op.drop_index(op.f('ix_page_hash_h0'), table_name='page_hash')
+    op.drop_index(op.f('ix_page_hash_batch_id'), table_name='page_hash')
+    op.drop_table('page_hash')
@@ -1,3 +1,4 @@
+import os
 from celery import Celery
 from common.config.settings import settings
 
@@ -10,12 +11,63 @@ celery = Celery(
     backend=backend,
 )
 
+CPU_COUNT = os.cpu_count() or 1
+
+DEFAULT_QUEUE = "celery"
+PRIORITY_STEPS = [0, 3, 6, 9]
+LOW_PRIORITY = 9
+
+# Worker profiles selected with CELERY_WORKER_PROFILE.
+#  - solo:    one task at a time in the main process (debugging / Windows)
+#  - prefork: one process per core; isolates crashes and leaks, recycled on memory growth
+#  - threads: preprocess_job mostly waits on HTTP, so several threads per core keep
+#             more batches in flight at a fraction of prefork's memory. With a prefetch
+#             of 1 the pool kept only one or two of its threads busy (README benchmark),
+#             so it reserves 4 jobs per thread; the fair scheduler's FAIR_MAX_DISPATCHED
+#             still bounds how many jobs are handed to Celery at all.
+# Only the prefork pool enforces task time limits. Under threads and solo each attempt
+# of preprocess_job is bounded by its HTTP timeout instead (tasks.py).
+WORKER_PROFILES = {
+    "solo": {"pool": "solo", "concurrency": 1, "prefetch": 1},
+    "prefork": {"pool": "prefork", "concurrency": CPU_COUNT, "prefetch": 1},
+    "threads": {"pool": "threads", "concurrency": CPU_COUNT * 4, "prefetch": 4},
+}
+
+if settings.CELERY_WORKER_PROFILE not in WORKER_PROFILES:
+    raise ValueError(f"Unknown CELERY_WORKER_PROFILE: {settings.CELERY_WORKER_PROFILE}")
+worker_profile = WORKER_PROFILES[settings.CELERY_WORKER_PROFILE]
+
 celery.conf.update(
     task_serializer="json",
     accept_content=["json"],
     result_serializer="json",
     task_track_started=True,
     result_expires=3600,
+
+    # --- Worker profile ---
+    worker_pool=worker_profile["pool"],
+    worker_concurrency=settings.CELERY_WORKER_CONCURRENCY or worker_profile["concurrency"],
+    # Batches are long-running: solo and prefork take one job per slot so a worker doesn't
+    # hoard queued jobs other workers could start (threads: see WORKER_PROFILES)
+    worker_prefetch_multiplier=settings.CELERY_PREFETCH_MULTIPLIER or worker_profile["prefetch"],
+    # Recycle prefork children whose RSS grows past the limit (KiB) after their current task
+    worker_max_memory_per_child=settings.CELERY_MAX_MEMORY_PER_CHILD_KB,
+    worker_max_tasks_per_child=settings.CELERY_MAX_TASKS_PER_CHILD,
+
+    # --- Delivery guarantees ---
+    # Ack only after the task finished, and requeue it if the worker process dies mid-task
+    task_acks_late=True,
+    task_reject_on_worker_lost=True,
+    task_soft_time_limit=settings.CELERY_TASK_SOFT_TIME_LIMIT,
+    task_time_limit=settings.CELERY_TASK_TIME_LIMIT,
+    # Redis re-delivers unacked tasks after the visibility timeout; it must outlast the hard limit.
+    # Priorities map onto one Redis list per step ("celery", "celery:3", ...), 0 served first.
+    broker_transport_options={
+        "visibility_timeout": settings.CELERY_TASK_TIME_LIMIT + 300,
+        "queue_order_strategy": "priority",
+        "priority_steps": PRIORITY_STEPS,
+        "sep": ":",
+    },
 )
 
 # ✅ Let Celery automatically discover tasks in this module
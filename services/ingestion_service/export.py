@@ -0,0 +1,580 @@
+# services/ingestion_service/export.py
+"""
+Bulk export of a batch (or a created_at range) as one streamed ZIP or combined PDF.
+
+ZIP  Entries are stored, not deflated: the payload is PNG/JPEG/PDF, already compressed,
+     and stored entries have sizes known from the object listing. The whole archive
+     layout (every offset, and the total length) is therefore fixed before the first
+     byte is read, which is what makes Range requests and resumed downloads possible.
+     CRCs go in data descriptors after each entry. They are cached per object and ETag,
+     so a resumed request that needs the central directory only re-reads objects whose
+     CRC no earlier request computed. Sizes and offsets past 4 GiB use ZIP64.
+
+PDF  One page per image (JPEG passed through as DCTDecode, PNG IDAT passed through as
+     FlateDecode with PNG predictors), written object by object with the page tree and
+     xref at the end. Its length isn't known up front, so there is no Range support.
+
+Objects are read by a bounded prefetcher: up to EXPORT_PREFETCH_OBJECTS objects are in
+flight ahead of the writer, each buffering at most EXPORT_PREFETCH_CHUNKS chunks of
+EXPORT_CHUNK_BYTES, so memory stays constant whatever the export size.
+
+Every read is conditional on the ETag the object was listed with. An object replaced
+after the listing would no longer match the layout, the CRC cache or the manifest, so
+the stream fails with ExportChanged instead. The headers are sent by then, so the
+client sees a download cut short of its Content-Length, and a retry lists afresh and
+gets a new export ETag, so If-Range won't splice old and new bytes.
+"""
+import hashlib
+import json
+import os
+import queue
+import struct
+import threading
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from minio.error import S3Error
+from sqlalchemy import select
+from common.config.redis_client import get_redis
+from common.config.settings import settings
+from common.utils.logger import get_logger
+from .minio_client import list_prefix, iter_object
+from .models import FileMetadata
+
+logger = get_logger("ingestion_export")
+
+CRC_KEY_PREFIX = "docintel:export:crc:"
+LISTING_WORKERS = 8
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+
+
+class ExportEntry:
+    """One file of an export: an object in MinIO, or inline bytes (the manifest)."""
+    __slots__ = ("name", "path", "size", "etag", "mtime", "data", "crc")
+
+    def __init__(self, name: str, path: str = None, size: int = 0, etag: str = None,
+                 mtime: datetime = None, data: bytes = None):
+        self.name = name
+        self.path = path
+        self.size = len(data) if data is not None else size
+        self.etag = etag
+        self.mtime = mtime
+        self.data = data
+        self.crc = zlib.crc32(data) if data is not None else None
+
+
+class ExportNotFound(Exception):
+    pass
+
+
+class ExportTooLarge(Exception):
+    pass
+
+
+class ExportChanged(Exception):
+    """An object changed between listing it and reading it."""
+
+
+# ---------------- RESOLVING WHAT TO EXPORT ----------------
+
+def _wanted(record, include: tuple) -> list:
+    """(entry name, "bucket/object") pairs of one FileMetadata row, in export order."""
+    meta = record.additional_meta or {}
+    wanted = []
+    if "originals" in include and record.minio_path:
+        wanted.append((f"{record.batch_id}/original/{os.path.basename(record.minio_path)}", record.minio_path))
+    if "enhanced" in include:
+        pages = meta.get("pages") or {}
+        paths = [p["enhanced_path"] for _, p in sorted(pages.items(), key=lambda kv: int(kv[0]))
+                 if p.get("enhanced_path")]
+        if not paths and meta.get("enhanced_path"):
+            paths = [meta["enhanced_path"]]
+        wanted.extend((f"{record.batch_id}/enhanced/{os.path.basename(p)}", p) for p in paths)
+    return wanted
+
+
+def _list_objects(paths: set) -> dict:
+    """"bucket/object" → listing entry, one LIST per directory instead of one HEAD per object."""
+    prefixes = {}
+    for path in paths:
+        bucket, object_name = path.split("/", 1)
+        prefixes.setdefault((bucket, os.path.dirname(object_name) + "/"), set()).add(object_name)
+
+    found = {}
+    with ThreadPoolExecutor(max_workers=LISTING_WORKERS) as pool:
+        listings = pool.map(lambda key: (key[0], list_prefix(*key)), prefixes)
+        for bucket, objects in listings:
+            for obj in objects:
+                found[f"{bucket}/{obj.object_name}"] = obj
+    return {path: found[path] for path in paths if path in found}
+
+
+def resolve_export(db, batch_id: str = None, date_from: datetime = None, date_to: datetime = None,
+                   include: tuple = ("originals", "enhanced")) -> list:
+    """
+    Entries for every record of the batch / range, oldest first, preceded by manifest.json
+    describing the records and any object that no longer exists. Deterministic for
+    unchanged data, so repeated requests produce byte-identical archives.
+    """
+    stmt = select(FileMetadata).order_by(FileMetadata.created_at, FileMetadata.id)
+    if batch_id:
+        stmt = stmt.where(FileMetadata.batch_id == batch_id)
+    if date_from:
+        stmt = stmt.where(FileMetadata.created_at >= date_from)
+    if date_to:
+        stmt = stmt.where(FileMetadata.created_at < date_to)
+
+    records, wanted = [], []
+    for record in db.execute(stmt.execution_options(yield_per=500)).scalars():
+        pairs = _wanted(record, include)
+        records.append((record, pairs))
+        wanted.extend(pairs)
+        if len(wanted) > settings.EXPORT_MAX_ENTRIES:
+            raise ExportTooLarge(f"More than {settings.EXPORT_MAX_ENTRIES} files; narrow the date range")
+    if not records:
+        raise ExportNotFound("No records match")
+
+    listed = _list_objects({path for _, path in wanted})
+    entries, seen, files = [], set(), []
+    for record, pairs in records:
+        item = {"id": record.id, "batch_id": record.batch_id, "file_name": record.file_name,
+                "status": record.status, "entries": [], "missing": []}
+        pages = (record.additional_meta or {}).get("pages") or {}
+        for name, path in pairs:
+            obj = listed.get(path)
+            if obj is None:
+                item["missing"].append(path)
+                continue
+            if name in seen:
+                continue
+            seen.add(name)
+            entries.append(ExportEntry(name, path, obj.size, (obj.etag or "").strip('"'), obj.last_modified))
+            item["entries"].append({"name": name, "source": path, "size": obj.size, "etag": entries[-1].etag})
+        item["pages"] = {n: {"type": p.get("type"), "confidence": p.get("confidence")} for n, p in pages.items()}
+        files.append(item)
+
+    manifest = json.dumps({"batch_id": batch_id, "date_from": date_from and date_from.isoformat(),
+                           "date_to": date_to and date_to.isoformat(), "include": list(include),
+                           "files": files}, sort_keys=True, indent=1).encode()
+    newest = max((e.mtime for e in entries), default=None)
+    return [ExportEntry("manifest.json", data=manifest, mtime=newest)] + entries
+
+
+def export_etag(entries: list) -> str:
+    """Strong validator for If-Range: the manifest lists every entry with its size and ETag."""
+    return '"' + hashlib.sha256(entries[0].data).hexdigest()[:32] + '"'
+
+
+# ---------------- CRC CACHE ----------------
+
+def _crc_key(entry: ExportEntry) -> str:
+    return CRC_KEY_PREFIX + hashlib.sha1(f"{entry.path}:{entry.etag}".encode()).hexdigest()
+
+
+def load_crcs(entries: list):
+    """Fill entry.crc from the cache where an earlier export computed it."""
+    pending = [e for e in entries if e.crc is None]
+    if not pending:
+        return
+    try:
+        values = get_redis().mget([_crc_key(e) for e in pending])
+    except Exception as e:
+        logger.warning(f"CRC cache unavailable: {e}")
+        return
+    for entry, value in zip(pending, values):
+        if value is not None:
+            entry.crc = int(value)
+
+
+def _save_crc(entry: ExportEntry):
+    try:
+        get_redis().set(_crc_key(entry), entry.crc, ex=settings.EXPORT_CRC_TTL_S)
+    except Exception as e:
+        logger.warning(f"Could not cache CRC of {entry.path}: {e}")
+
+
+# ---------------- PREFETCH ----------------
+
+_END = object()
+
+
+class _Prefetcher:
+    """
+    Reads (entry, offset, length) ranges in order, up to `window` of them concurrently
+    ahead of the consumer; each buffers at most `depth` chunks. Iterating yields
+    (read, chunk iterator); every chunk iterator must be exhausted before the next one.
+    """
+
+    def __init__(self, reads, window: int = None, depth: int = None, chunk_size: int = None):
+        self.reads = iter(reads)
+        self.window = window or settings.EXPORT_PREFETCH_OBJECTS
+        self.depth = depth or settings.EXPORT_PREFETCH_CHUNKS
+        self.chunk_size = chunk_size or settings.EXPORT_CHUNK_BYTES
+        self._stop = threading.Event()
+
+    def _put(self, q: queue.Queue, item) -> bool:
+        """Blocking put that gives up once the consumer has gone away."""
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _produce(self, read, q: queue.Queue):
+        entry, offset, length = read
+        try:
+            if entry.data is not None:
+                chunks = [entry.data[offset:offset + length]]
+            elif length:
+                bucket, object_name = entry.path.split("/", 1)
+                chunks = iter_object(bucket, object_name, offset, length, self.chunk_size, etag=entry.etag)
+            else:
+                chunks = []
+            for chunk in chunks:
+                if not self._put(q, chunk):
+                    return
+            self._put(q, _END)
+        except S3Error as e:
+            if e.code == "PreconditionFailed":
+                logger.warning(f"{entry.path} changed since it was listed (ETag {entry.etag}); aborting export")
+                e = ExportChanged(f"{entry.path} changed during the export; retry it")
+            self._put(q, e)
+        except Exception as e:
+            self._put(q, e)
+
+    @staticmethod
+    def _drain(q: queue.Queue):
+        while True:
+            item = q.get()
+            if item is _END:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    def __iter__(self):
+        in_flight = deque()
+        pool = ThreadPoolExecutor(max_workers=self.window, thread_name_prefix="export-prefetch")
+        try:
+            def _submit():
+                read = next(self.reads, None)
+                if read is None:
+                    return False
+                q = queue.Queue(maxsize=self.depth)
+                pool.submit(self._produce, read, q)
+                in_flight.append((read, q))
+                return True
+
+            while len(in_flight) < self.window and _submit():
+                pass
+            while in_flight:
+                read, q = in_flight.popleft()
+                _submit()
+                yield read, self._drain(q)
+        finally:
+            # client went away or an error: stop the producers blocked on full queues
+            self._stop.set()
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+# ---------------- ZIP ----------------
+
+_FLAGS = 0x0008 | 0x0800  # sizes/CRC in a data descriptor, UTF-8 names
+_U32 = 0xFFFFFFFF
+_U16 = 0xFFFF
+
+
+def _dos_datetime(ts: datetime) -> tuple:
+    if ts is None or ts.year < 1980:
+        return 0, (0 << 9) | (1 << 5) | 1
+    return (ts.hour << 11) | (ts.minute << 5) | (ts.second // 2), ((ts.year - 1980) << 9) | (ts.month << 5) | ts.day
+
+
+class ZipLayout:
+    """Byte layout of a stored-entry ZIP of `entries`; serves any byte range of it."""
+
+    def __init__(self, entries: list):
+        self.entries = entries
+        self.offsets = []  # per entry: (local header offset, data offset, data end, descriptor end)
+        pos = 0
+        for entry in entries:
+            header = len(self._local_header(entry))
+            data_end = pos + header + entry.size
+            self.offsets.append((pos, pos + header, data_end, data_end + (24 if self._zip64(entry) else 16)))
+            pos = self.offsets[-1][3]
+        self.cd_offset = pos
+        self.cd_size = sum(46 + len(e.name.encode()) + len(self._cd_extra(e, o[0]))
+                           for e, o in zip(entries, self.offsets))
+        self.total = self.cd_offset + self.cd_size + len(self._end_records())
+
+    @staticmethod
+    def _zip64(entry) -> bool:
+        return entry.size >= _U32
+
+    def _local_header(self, entry) -> bytes:
+        name = entry.name.encode()
+        dtime, ddate = _dos_datetime(entry.mtime)
+        if self._zip64(entry):
+            extra = struct.pack("<HHQQ", 1, 16, 0, 0)
+            return struct.pack("<IHHHHHIIIHH", 0x04034b50, 45, _FLAGS, 0, dtime, ddate, 0, _U32, _U32,
+                               len(name), len(extra)) + name + extra
+        return struct.pack("<IHHHHHIIIHH", 0x04034b50, 20, _FLAGS, 0, dtime, ddate, 0, 0, 0, len(name), 0) + name
+
+    def _descriptor(self, entry) -> bytes:
+        if self._zip64(entry):
+            return struct.pack("<IIQQ", 0x08074b50, entry.crc, entry.size, entry.size)
+        return struct.pack("<IIII", 0x08074b50, entry.crc, entry.size, entry.size)
+
+    @staticmethod
+    def _cd_extra(entry, offset: int) -> bytes:
+        fields = []
+        if entry.size >= _U32:
+            fields += [entry.size, entry.size]
+        if offset >= _U32:
+            fields.append(offset)
+        if not fields:
+            return b""
+        return struct.pack(f"<HH{len(fields)}Q", 1, 8 * len(fields), *fields)
+
+    def _central_directory(self) -> bytes:
+        parts = []
+        for entry, (offset, *_rest) in zip(self.entries, self.offsets):
+            name = entry.name.encode()
+            extra = self._cd_extra(entry, offset)
+            dtime, ddate = _dos_datetime(entry.mtime)
+            needed = 45 if extra else 20
+            size32 = _U32 if entry.size >= _U32 else entry.size
+            parts.append(struct.pack(
+                "<IHHHHHHIIIHHHHHII", 0x02014b50, (3 << 8) | 45, needed, _FLAGS, 0, dtime, ddate,
+                entry.crc, size32, size32, len(name), len(extra), 0, 0, 0, 0o100644 << 16,
+                min(offset, _U32),
+            ) + name + extra)
+        return b"".join(parts)
+
+    def _end_records(self) -> bytes:
+        n = len(self.entries)
+        records = b""
+        if n >= _U16 or self.cd_offset >= _U32 or self.cd_size >= _U32:
+            eocd64_offset = self.cd_offset + self.cd_size
+            records += struct.pack("<IQHHIIQQQQ", 0x06064b50, 44, 45, 45, 0, 0, n, n, self.cd_size, self.cd_offset)
+            records += struct.pack("<IIQI", 0x07064b50, 0, eocd64_offset, 1)
+        return records + struct.pack("<IHHHHIIH", 0x06054b50, 0, 0, min(n, _U16), min(n, _U16),
+                                     min(self.cd_size, _U32), min(self.cd_offset, _U32), 0)
+
+    def iter_range(self, start: int = 0, end: int = None):
+        """Yield bytes [start, end) of the archive (end defaults to the total length)."""
+        end = self.total if end is None else end
+        needs_cd = end > self.cd_offset
+        load_crcs(self.entries)
+
+        def _reads():
+            # which part of each object to fetch: the requested slice, or all of it when
+            # its CRC is still unknown and the range includes its descriptor or the CD
+            for entry, (_, data_start, data_end, desc_end) in zip(self.entries, self.offsets):
+                wants_data = start < data_end and end > data_start
+                wants_crc = entry.crc is None and (needs_cd or (start < desc_end and end > data_end))
+                if wants_crc:
+                    yield entry, 0, entry.size
+                elif wants_data:
+                    lo, hi = max(start, data_start) - data_start, min(end, data_end) - data_start
+                    yield entry, lo, hi - lo
+
+        def _clip(blob: bytes, blob_start: int):
+            lo, hi = max(start, blob_start), min(end, blob_start + len(blob))
+            if lo < hi:
+                yield blob[lo - blob_start:hi - blob_start]
+
+        reads = iter(_Prefetcher(_reads()))
+        try:
+            pending = next(reads, None)
+            for entry, (header_start, data_start, data_end, desc_end) in zip(self.entries, self.offsets):
+                if header_start >= end:
+                    break
+                yield from _clip(self._local_header(entry), header_start)
+
+                if pending is not None and pending[0][0] is entry:
+                    # the prefetcher's chunk iterator has to be exhausted before the next read
+                    (_, offset, length), chunks = pending
+                    full = offset == 0 and length == entry.size and entry.crc is None
+                    crc, pos = 0, data_start + offset
+                    for chunk in chunks:
+                        if full:
+                            crc = zlib.crc32(chunk, crc)
+                        yield from _clip(chunk, pos)
+                        pos += len(chunk)
+                    if full:
+                        entry.crc = crc
+                        _save_crc(entry)
+                    pending = next(reads, None)
+
+                if data_end < end and desc_end > start:
+                    yield from _clip(self._descriptor(entry), data_end)
+
+            if needs_cd:
+                yield from _clip(self._central_directory() + self._end_records(), self.cd_offset)
+        finally:
+            reads.close()
+
+
+# ---------------- PDF ----------------
+
+class _ByteReader:
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buf = b""
+
+    def read(self, n: int) -> bytes:
+        while len(self._buf) < n:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buf += chunk
+        out, self._buf = self._buf[:n], self._buf[n:]
+        return out
+
+    def rest(self):
+        if self._buf:
+            yield self._buf
+            self._buf = b""
+        yield from self._chunks
+
+
+class UnsupportedImage(Exception):
+    pass
+
+
+def _png_image(reader: _ByteReader) -> tuple:
+    """(image dict entries, IDAT byte iterator) for 8-bit non-interlaced gray/RGB PNGs."""
+    if reader.read(8) != b"\x89PNG\r\n\x1a\n":
+        raise UnsupportedImage("not a PNG")
+    length, kind = struct.unpack(">I4s", reader.read(8))
+    if kind != b"IHDR":
+        raise UnsupportedImage("PNG without IHDR")
+    width, height, depth, color, _, _, interlace = struct.unpack(">IIBBBBB", reader.read(length))
+    reader.read(4)
+    if depth != 8 or color not in (0, 2) or interlace:
+        raise UnsupportedImage(f"PNG depth={depth} color={color} interlace={interlace}")
+    colors = 1 if color == 0 else 3
+    params = (f"/Width {width} /Height {height} /ColorSpace /{'DeviceGray' if colors == 1 else 'DeviceRGB'} "
+              f"/BitsPerComponent 8 /Filter /FlateDecode "
+              f"/DecodeParms << /Predictor 15 /Colors {colors} /BitsPerComponent 8 /Columns {width} >>")
+
+    def _idat():
+        while True:
+            head = reader.read(8)
+            if len(head) < 8:
+                return
+            length, kind = struct.unpack(">I4s", head)
+            if kind == b"IEND":
+                return
+            remaining = length
+            while remaining:
+                piece = reader.read(min(remaining, settings.EXPORT_CHUNK_BYTES))
+                if not piece:
+                    return
+                remaining -= len(piece)
+                if kind == b"IDAT":
+                    yield piece
+            reader.read(4)  # chunk CRC
+
+    return width, height, params, _idat()
+
+
+_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def _jpeg_image(reader: _ByteReader) -> tuple:
+    """(image dict entries, JPEG byte iterator) — the file itself is the DCTDecode stream."""
+    head = [reader.read(2)]
+    if head[0] != b"\xff\xd8":
+        raise UnsupportedImage("not a JPEG")
+    while True:
+        marker = reader.read(2)
+        head.append(marker)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            raise UnsupportedImage("corrupt JPEG header")
+        if 0xD0 <= marker[1] <= 0xD9 or marker[1] == 0x01:
+            continue
+        raw_length = reader.read(2)
+        segment = reader.read(struct.unpack(">H", raw_length)[0] - 2)
+        head += [raw_length, segment]
+        if marker[1] in _SOF_MARKERS:
+            height, width, components = struct.unpack(">HHB", segment[1:6])
+            break
+    space = {1: "DeviceGray", 3: "DeviceRGB", 4: "DeviceCMYK"}.get(components)
+    if space is None:
+        raise UnsupportedImage(f"JPEG with {components} components")
+    params = f"/Width {width} /Height {height} /ColorSpace /{space} /BitsPerComponent 8 /Filter /DCTDecode"
+
+    def _stream():
+        yield b"".join(head)
+        yield from reader.rest()
+
+    return width, height, params, _stream()
+
+
+def pdf_entries(entries: list) -> list:
+    return [e for e in entries if e.path and e.path.lower().endswith(IMAGE_EXTENSIONS)]
+
+
+def iter_pdf(entries: list, dpi: int = None):
+    """Stream one PDF page per image entry; unreadable images are skipped and logged."""
+    dpi = dpi or settings.EXPORT_PDF_DPI
+    pos = 0
+    xref = {}  # object number → byte offset
+    kids = []
+    next_num = 3  # 1 = catalog, 2 = page tree (written last)
+
+    def _out(data: bytes):
+        nonlocal pos
+        pos += len(data)
+        return data
+
+    def _obj(num: int, body: bytes):
+        xref[num] = pos
+        return _out(f"{num} 0 obj\n".encode() + body + b"\nendobj\n")
+
+    yield _out(b"%PDF-1.7\n%\xe2\xe3\xcf\xd3\n")
+    yield _obj(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+
+    for (entry, _, _), chunks in _Prefetcher((e, 0, e.size) for e in entries):
+        reader = _ByteReader(chunks)
+        try:
+            parse = _png_image if entry.path.lower().endswith(".png") else _jpeg_image
+            width, height, params, data = parse(reader)
+        except (UnsupportedImage, struct.error) as e:
+            logger.warning(f"Skipping {entry.path} in PDF export: {e}")
+            for _ in reader.rest():
+                pass
+            continue
+
+        image_num, length_num, content_num, page_num = next_num, next_num + 1, next_num + 2, next_num + 3
+        next_num += 4
+        xref[image_num] = pos
+        yield _out(f"{image_num} 0 obj\n<< /Type /XObject /Subtype /Image {params} "
+                   f"/Length {length_num} 0 R >>\nstream\n".encode())
+        length = 0
+        for chunk in data:
+            length += len(chunk)
+            yield _out(chunk)
+        for _ in reader.rest():  # trailing chunks after IEND
+            pass
+        yield _out(b"\nendstream\nendobj\n")
+        yield _obj(length_num, str(length).encode())
+
+        page_w, page_h = width * 72 / dpi, height * 72 / dpi
+        content = f"q {page_w:.2f} 0 0 {page_h:.2f} 0 0 cm /Im0 Do Q".encode()
+        yield _obj(content_num, f"<< /Length {len(content)} >>\nstream\n".encode() + content + b"\nendstream")
+        yield _obj(page_num, (f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {page_w:.2f} {page_h:.2f}] "
+                              f"/Resources << /XObject << /Im0 {image_num} 0 R >> >> "
+                              f"/Contents {content_num} 0 R >>").encode())
+        kids.append(page_num)
+
+    yield _obj(2, f"<< /Type /Pages /Kids [{' '.join(f'{k} 0 R' for k in kids)}] /Count {len(kids)} >>".encode())
+    xref_offset = pos
+    rows = [b"0000000000 65535 f \n"] + [f"{xref[n]:010d} 00000 n \n".encode() for n in range(1, next_num)]
+    yield _out(f"xref\n0 {next_num}\n".encode() + b"".join(rows))
+    yield _out(f"trailer\n<< /Size {next_num} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n".encode())
@@ -0,0 +1,372 @@
+"""
+Fair-share scheduling of preprocess jobs across branches (or uploaders).
+
+Jobs are not sent to Celery when they are accepted. Instead they wait in per-tenant
+Redis lists, and a dispatcher moves them to the broker only while fewer than
+FAIR_MAX_DISPATCHED are in flight. That keeps the broker queue short, so the order in
+which work runs is decided here rather than by FIFO arrival.
+
+Two classes, served in strict order:
+
+  interactive  a single file of at most FAIR_INTERACTIVE_MAX_PAGES pages (a KYC upload);
+               may use all FAIR_MAX_DISPATCHED slots and is sent at Celery priority 0
+  bulk         everything else; may use FAIR_MAX_DISPATCHED - FAIR_INTERACTIVE_RESERVED
+               slots, so a freed slot is always there for the next interactive job
+
+Within a class, tenants share the slots by deficit round-robin over pages: each turn
+adds FAIR_QUANTUM_PAGES × weight to a tenant's deficit, and a job is sent once the
+deficit covers its pages. A branch uploading 10,000 pages gets the same page rate as a
+branch uploading 10, not 1,000 times more. Low-priority batches (see admission.py) all
+share one pseudo-tenant in the bulk class with FAIR_LOW_PRIORITY_WEIGHT.
+
+dispatch() runs after every submit and after every finished job. The loop below is a
+safety net for jobs nobody woke up for (a dispatch that failed, an expired slot):
+
+    python -m services.ingestion_service.fair_scheduler
+"""
+import argparse
+import json
+import math
+import time
+import uuid
+import redis
+from common.config.redis_client import get_redis
+from common.config.settings import settings
+from common.utils.logger import get_logger
+from .celery_app import LOW_PRIORITY
+
+logger = get_logger("ingestion_fair_scheduler")
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+CLASSES = (INTERACTIVE, BULK)
+CELERY_PRIORITY = {INTERACTIVE: 0, BULK: 3}
+LOW_PRIORITY_TENANT = "~low-priority"
+UNASSIGNED_TENANT = "~unassigned"
+
+PREFIX = "docintel:fair:"
+LOCK_KEY = PREFIX + "lock"
+WAKE_KEY = PREFIX + "wake"
+DISPATCHED_KEY = PREFIX + "dispatched"  # zset task_id → dispatch time
+LOCK_TTL_MS = 10_000
+
+
+def _queue_key(cls: str, tenant: str) -> str:
+    return f"{PREFIX}queue:{cls}:{tenant}"
+
+
+def _ring_key(cls: str) -> str:
+    return f"{PREFIX}ring:{cls}"  # list: round-robin order, head = tenant whose turn it is
+
+
+def _members_key(cls: str) -> str:
+    return f"{PREFIX}members:{cls}"  # set: tenants currently in the ring
+
+
+def _deficit_key(cls: str) -> str:
+    return f"{PREFIX}deficit:{cls}"  # hash tenant → pages
+
+
+def _seen_key(cls: str) -> str:
+    return f"{PREFIX}seen:{cls}"  # zset tenant → last submit, for the metrics
+
+
+def _dispatched_total_key(cls: str) -> str:
+    return f"{PREFIX}dispatched_total:{cls}"  # hash tenant → jobs
+
+
+def _waits_key(cls: str, tenant: str = None) -> str:
+    return f"{PREFIX}waits:{cls}" + (f":{tenant}" if tenant else "")
+
+
+_weights = None
+
+
+def weight(tenant: str) -> float:
+    global _weights
+    if _weights is None:
+        parsed = {}
+        for item in settings.FAIR_TENANT_WEIGHTS.split(","):
+            name, _, value = item.partition("=")
+            if name.strip() and value.strip():
+                parsed[name.strip()] = float(value)
+        _weights = parsed
+    if tenant == LOW_PRIORITY_TENANT:
+        return settings.FAIR_LOW_PRIORITY_WEIGHT
+    return max(_weights.get(tenant, 1.0), 0.01)
+
+
+def tenant_of(branch_id, uploader_id) -> str:
+    if settings.FAIR_TENANT_KEY == "uploader_id":
+        return uploader_id or branch_id or UNASSIGNED_TENANT
+    return branch_id or uploader_id or UNASSIGNED_TENANT
+
+
+def classify(num_files: int, pages: int, priority) -> tuple:
+    """(class, Celery priority) of a new job."""
+    if priority == LOW_PRIORITY:
+        return BULK, LOW_PRIORITY
+    if num_files == 1 and pages <= settings.FAIR_INTERACTIVE_MAX_PAGES:
+        return INTERACTIVE, CELERY_PRIORITY[INTERACTIVE]
+    return BULK, CELERY_PRIORITY[BULK]
+
+
+def submit(batch_id: str, files: list, pages: int, kwargs: dict, tenant: str, cls: str, priority: int) -> str:
+    """Queue a preprocess job for `tenant`; returns the Celery task id it will run under."""
+    r = get_redis()
+    job = {
+        "task_id": str(uuid.uuid4()),
+        "batch_id": batch_id,
+        "files": files,
+        "pages": max(1, int(pages)),
+        "kwargs": kwargs,
+        "tenant": tenant,
+        "priority": priority,
+        "submitted_at": time.time(),
+    }
+    pipe = r.pipeline()
+    pipe.rpush(_queue_key(cls, tenant), json.dumps(job))
+    pipe.sadd(_members_key(cls), tenant)
+    pipe.zadd(_seen_key(cls), {tenant: job["submitted_at"]})
+    joined = pipe.execute()[1]
+    if joined:
+        # a tenant enters the ring once; _retire takes it out when its queue is empty
+        r.rpush(_ring_key(cls), tenant)
+    try:
+        dispatch(r)
+    except Exception as e:
+        # the job is queued; the dispatcher loop sends it once Celery is reachable again
+        logger.warning("Dispatch after submitting batch %s failed: %s", batch_id, e)
+    return job["task_id"]
+
+
+def _retire(r, cls: str, tenant: str) -> bool:
+    """Take a tenant with an empty queue out of the ring, unless a job just arrived."""
+    queue = _queue_key(cls, tenant)
+    with r.pipeline() as pipe:
+        try:
+            pipe.watch(queue)
+            if pipe.llen(queue):
+                return False
+            pipe.multi()
+            pipe.srem(_members_key(cls), tenant)
+            pipe.lrem(_ring_key(cls), 0, tenant)
+            pipe.hdel(_deficit_key(cls), tenant)
+            pipe.execute()
+            return True
+        except redis.WatchError:
+            return False
+
+
+def _pick(tenants: list, deficits: list, costs: list) -> tuple:
+    """
+    Deficit round-robin over one ring, done arithmetically instead of one visit at a time.
+    tenants[0] is mid-turn (already credited), every other tenant is credited when reached.
+    Returns (steps, winner index, credits per tenant): after `steps` moves of the ring,
+    tenants[winner] is at the head and can afford its next job.
+    """
+    n = len(tenants)
+    quanta = [settings.FAIR_QUANTUM_PAGES * weight(t) for t in tenants]
+    if deficits[0] >= costs[0]:
+        return 0, 0, [0] * n
+    steps = []
+    for j in range(n):
+        visits = max(1, math.ceil((costs[j] - deficits[j]) / quanta[j]))
+        steps.append(visits * n if j == 0 else j + (visits - 1) * n)
+    winner = min(range(n), key=steps.__getitem__)
+    s = steps[winner]
+    credits = [(s // n if j == 0 else (s - j) // n + 1 if s >= j else 0) * quanta[j] for j in range(n)]
+    return s, winner, credits
+
+
+def _next_job(r, cls: str):
+    """
+    Choose the next job of a class under deficit round-robin, or None if the class is
+    empty. Nothing is popped here: _commit applies the choice once the job is sent.
+    """
+    ring = _ring_key(cls)
+    while True:
+        tenants = r.lrange(ring, 0, -1)
+        if not tenants:
+            return None
+        pipe = r.pipeline(transaction=False)
+        for tenant in tenants:
+            pipe.lindex(_queue_key(cls, tenant), 0)
+        pipe.hmget(_deficit_key(cls), tenants)
+        *heads, deficits = pipe.execute()
+        empty = [t for t, head in zip(tenants, heads) if head is None]
+        if empty:
+            for tenant in empty:
+                _retire(r, cls, tenant)
+            continue  # ring changed; look again
+        jobs = [json.loads(head) for head in heads]
+        deficits = [float(d or 0) for d in deficits]
+        steps, winner, credits = _pick(tenants, deficits, [job["pages"] for job in jobs])
+        return tenants, steps, winner, credits, jobs[winner]
+
+
+def _commit(r, cls: str, picked, now: float):
+    """Apply a _pick decision once its job has been sent."""
+    tenants, steps, winner, credits, job = picked
+    tenant = tenants[winner]
+    pipe = r.pipeline()
+    for t, credit in zip(tenants, credits):
+        if credit:
+            pipe.hincrbyfloat(_deficit_key(cls), t, credit)
+    pipe.hincrbyfloat(_deficit_key(cls), tenant, -job["pages"])
+    for _ in range(steps % len(tenants)):
+        pipe.lmove(_ring_key(cls), _ring_key(cls), "LEFT", "RIGHT")
+    pipe.lpop(_queue_key(cls, tenant))
+    pipe.zadd(DISPATCHED_KEY, {job["task_id"]: now})
+    wait = round(now - job["submitted_at"], 3)
+    for key in (_waits_key(cls, tenant), _waits_key(cls)):
+        pipe.lpush(key, wait)
+        pipe.ltrim(key, 0, settings.FAIR_WAIT_SAMPLES - 1)
+        pipe.expire(key, settings.FAIR_METRICS_TTL_S)
+    pipe.hincrby(_dispatched_total_key(cls), tenant, 1)
+    pipe.execute()
+    # standard DRR: a tenant that runs out of work loses its leftover deficit
+    _retire(r, cls, tenant)
+
+
+def _in_flight(r) -> int:
+    r.zremrangebyscore(DISPATCHED_KEY, 0, time.time() - settings.FAIR_DISPATCHED_TTL_S)
+    return r.zcard(DISPATCHED_KEY)
+
+
+def _drain(r) -> int:
+    from .tasks import preprocess_job
+
+    sent = 0
+    in_flight = _in_flight(r)
+    limits = {
+        INTERACTIVE: settings.FAIR_MAX_DISPATCHED,
+        BULK: settings.FAIR_MAX_DISPATCHED - settings.FAIR_INTERACTIVE_RESERVED,
+    }
+    while True:
+        for cls in CLASSES:
+            if in_flight >= limits[cls]:
+                continue
+            picked = _next_job(r, cls)
+            if picked:
+                break
+        else:
+            return sent
+        job = picked[-1]
+        preprocess_job.apply_async((job["batch_id"], job["files"]), job["kwargs"],
+                                   task_id=job["task_id"], priority=job["priority"])
+        _commit(r, cls, picked, time.time())
+        in_flight += 1
+        sent += 1
+        logger.info("Dispatched %s job %s for batch %s (tenant %s, %d page(s))",
+                    cls, job["task_id"], job["batch_id"], job["tenant"], job["pages"])
+
+
+def dispatch(r=None) -> int:
+    """
+    Send queued jobs to Celery while slots are free; returns how many were sent.
+    Only one process dispatches at a time. A caller that finds the lock taken leaves a
+    wake-up flag, and the lock holder checks the flag after releasing, so no submit is
+    left waiting for the next dispatcher-loop tick.
+    """
+    r = r or get_redis()
+    r.set(WAKE_KEY, "1")
+    sent = 0
+    while r.get(WAKE_KEY):
+        token = uuid.uuid4().hex
+        if not r.set(LOCK_KEY, token, nx=True, px=LOCK_TTL_MS):
+            break
+        try:
+            r.delete(WAKE_KEY)
+            sent += _drain(r)
+        finally:
+            if r.get(LOCK_KEY) == token:
+                r.delete(LOCK_KEY)
+    return sent
+
+
+def job_finished(task_id: str):
+    """A dispatched job is done (not retrying): free its slot and hand it on."""
+    try:
+        r = get_redis()
+        r.zrem(DISPATCHED_KEY, task_id)
+        dispatch(r)
+    except Exception as e:
+        logger.warning("Could not release scheduler slot of job %s: %s", task_id, e)
+
+
+def queued_jobs() -> int:
+    """Jobs accepted but not yet sent to Celery, over every class and tenant."""
+    r = get_redis()
+    pipe = r.pipeline(transaction=False)
+    for cls in CLASSES:
+        for tenant in r.smembers(_members_key(cls)):
+            pipe.llen(_queue_key(cls, tenant))
+    return sum(pipe.execute())
+
+
+def _percentile(values: list, q: float):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def _waits(r, key: str) -> dict:
+    samples = [float(v) for v in r.lrange(key, 0, -1)]
+    return {"wait_p50_s": _percentile(samples, 0.5), "wait_p95_s": _percentile(samples, 0.95),
+            "wait_samples": len(samples)}
+
+
+def metrics() -> dict:
+    """Per-class and per-tenant queue depth, oldest waiting job and recent queue waits."""
+    r = get_redis()
+    now = time.time()
+    report = {"in_flight": _in_flight(r), "max_dispatched": settings.FAIR_MAX_DISPATCHED, "classes": {}}
+    for cls in CLASSES:
+        r.zremrangebyscore(_seen_key(cls), 0, now - settings.FAIR_METRICS_TTL_S)
+        tenants = sorted(set(r.zrange(_seen_key(cls), 0, -1)) | r.smembers(_members_key(cls)))
+        deficits = r.hgetall(_deficit_key(cls))
+        dispatched = r.hgetall(_dispatched_total_key(cls))
+        per_tenant = {}
+        for tenant in tenants:
+            queue = _queue_key(cls, tenant)
+            head = r.lindex(queue, 0)
+            per_tenant[tenant] = {
+                "queued": r.llen(queue),
+                "oldest_wait_s": round(now - json.loads(head)["submitted_at"], 3) if head else 0.0,
+                "weight": weight(tenant),
+                "deficit_pages": float(deficits.get(tenant, 0)),
+                "dispatched": int(dispatched.get(tenant, 0)),
+                **_waits(r, _waits_key(cls, tenant)),
+            }
+        report["classes"][cls] = {
+            "queued": sum(t["queued"] for t in per_tenant.values()),
+            **_waits(r, _waits_key(cls)),
+            "tenants": per_tenant,
+        }
+    return report
+
+
+def run(once: bool = False):
+    while True:
+        try:
+            sent = dispatch()
+            if sent:
+                logger.info("Dispatcher loop sent %d job(s)", sent)
+        except Exception:
+            logger.exception("Dispatch failed")
+        if once:
+            return
+        time.sleep(settings.FAIR_DISPATCH_INTERVAL_S)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--once", action="store_true", help="dispatch what fits now, then exit")
+    args = parser.parse_args(argv)
+    run(once=args.once)
+
+
+if __name__ == "__main__":
+    main()
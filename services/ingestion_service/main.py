@@ -1,102 +1,163 @@
 # services/ingestion_service/main.py
 import uuid
-import mimetypes
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Body
+import time
+import asyncio
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Body, Header
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import JSONResponse
 from typing import List, Optional
 from common.utils.logger import get_logger
+from common.utils import profiling
 from common.config.settings import settings
-from .minio_client import upload_bytes
+from .minio_client import upload_bytes, delete_objects
 from .db import SessionLocal
 from .models import FileMetadata
-from .tasks import preprocess_job
+from .admission import check_admission, estimate_pages
+from . import fair_scheduler
+from .status_updates import apply_events, mark_completed
+from .utils.file_handler import (
+    ALLOWED_MIMES, resolve_content_type, metadata_row, insert_metadata, enqueue_preprocess,
+)
+from .routers.upload_router import router as chunked_upload_router
+from .routers.export_router import router as export_router
 
 app = FastAPI(title="Ingestion Service")
+app.include_router(chunked_upload_router)
+app.include_router(export_router)
 logger = get_logger("ingestion_service")
 
-ALLOWED_MIMES = {"image/jpeg", "image/png", "application/pdf", "image/jpg"}
-MAX_FILE_SIZE_BYTES = 10 * 1024 * 1024  # 10 MB
+MAX_FILE_SIZE_BYTES = 10 * 1024 * 1024  # 10 MB — larger files go through /uploads (chunked)
 
 @app.get("/health")
 def health_check():
     logger.info("Health check called")
     return {"status": "ok"}
 
+
+@app.get("/scheduler")
+def scheduler_metrics():
+    """Fair-scheduler queue depth, oldest waiting job and recent queue waits per class and tenant."""
+    return fair_scheduler.metrics()
+
+
+async def upload_all(items: List[dict]) -> List[str]:
+    """
+    Upload every item to MinIO concurrently, at most UPLOAD_CONCURRENCY at a time.
+    If any upload fails, the objects that did make it are removed before re-raising.
+    """
+    semaphore = asyncio.Semaphore(settings.UPLOAD_CONCURRENCY)
+
+    async def _put(item):
+        async with semaphore:
+            return await run_in_threadpool(
+                upload_bytes, item["content"], item["object_name"], item["content_type"]
+            )
+
+    outcomes = await asyncio.gather(*(_put(i) for i in items), return_exceptions=True)
+    errors = [o for o in outcomes if isinstance(o, BaseException)]
+    if errors:
+        uploaded = [o for o in outcomes if not isinstance(o, BaseException)]
+        if uploaded:
+            failed = await run_in_threadpool(delete_objects, uploaded)
+            if failed:
+                logger.warning(f"Could not clean up {len(failed)} orphaned object(s): {failed}")
+        raise errors[0]
+    return outcomes
+
+
 @app.post("/upload")
 async def upload_files(
     files: List[UploadFile] = File(...),
     branch_id: Optional[str] = Form(None),
     uploader_id: Optional[str] = Form(None),
+    low_priority: bool = Form(False),
+    x_profile: Optional[str] = Header(None),
 ):
     if not files:
         raise HTTPException(status_code=400, detail="No files uploaded")
 
     batch_id = str(uuid.uuid4())
-    saved_records = []
-    db = SessionLocal()
+    # X-Profile profiles this upload (sampled, as it runs on the event loop) and is passed
+    # on as requested to the Celery job and process_batch
+    profile_mode = profiling.requested_mode(x_profile)
+    async with profiling.profiled_async(profile_mode, batch_id, "upload_files") as profile:
+        response = await _upload_batch(batch_id, files, branch_id, uploader_id, low_priority, profile_mode)
+    if profile:
+        response["profile"] = profile.path
+    return JSONResponse(response)
+
+
+async def _upload_batch(batch_id: str, files: List[UploadFile], branch_id: Optional[str],
+                        uploader_id: Optional[str], low_priority: bool, profile_mode: Optional[str]) -> dict:
+    items = []
+
+    # --- Step 1: Read & validate everything before touching MinIO ---
+    for f in files:
+        content = await f.read()
+        size = len(content)
+
+        # size limit check
+        if size > MAX_FILE_SIZE_BYTES:
+            raise HTTPException(status_code=400, detail=f"File {f.filename} exceeds size limit")
+
+        # detect MIME type
+        content_type = resolve_content_type(f.filename, f.content_type)
+        if content_type not in ALLOWED_MIMES:
+            raise HTTPException(status_code=400, detail=f"Unsupported file type: {content_type} ({f.filename})")
+
+        items.append({
+            "file_name": f.filename,
+            "content": content,
+            "content_type": content_type,
+            "object_name": f"{batch_id}/{uuid.uuid4().hex}_{f.filename}",
+            "size": size,
+            # opening a large PDF takes a while: keep it off the event loop
+            "pages": await run_in_threadpool(estimate_pages, content, content_type),
+        })
+
+    # --- Step 1b: Admission control against broker backlog & in-flight pages ---
+    total_pages = sum(item["pages"] for item in items)
+    admission = await run_in_threadpool(check_admission, total_pages, low_priority)
+    if not admission["admitted"]:
+        logger.warning(f"Rejected batch of {total_pages} page(s): backlog too deep ({admission})")
+        raise HTTPException(
+            status_code=429,
+            detail="Preprocessing backlog is full, retry later",
+            headers={"Retry-After": str(admission["retry_after"])},
+        )
 
+    db = SessionLocal()
+    minio_paths = []
+    committed = False
     try:
-        for f in files:
-            content = await f.read()
-            size = len(content)
-
-            # size limit check
-            if size > MAX_FILE_SIZE_BYTES:
-                raise HTTPException(status_code=400, detail=f"File {f.filename} exceeds size limit")
-
-            # detect MIME type
-            content_type = f.content_type or mimetypes.guess_type(f.filename)[0]
-            if content_type not in ALLOWED_MIMES:
-                raise HTTPException(status_code=400, detail=f"Unsupported file type: {content_type} ({f.filename})")
-
-            # upload to MinIO
-            object_name = f"{batch_id}/{uuid.uuid4().hex}_{f.filename}"
-            minio_path = upload_bytes(content, object_name, content_type)
-
-            # determine file type
-            mime_type, _ = mimetypes.guess_type(f.filename)
-            file_type = mime_type.split("/")[0] if mime_type else "unknown"
-
-            name_low = f.filename.lower()
-            if "aadhaar" in name_low or "aadhar" in name_low:
-                file_type = "aadhaar"
-            elif "pan" in name_low:
-                file_type = "pan"
-            elif "selfie" in name_low or "photo" in name_low:
-                file_type = "photo"
-
-            meta = FileMetadata(
-                batch_id=batch_id,
-                file_name=f.filename,
-                minio_path=minio_path,
-                uploader_id=uploader_id,
-                branch_id=branch_id,
-                file_type=file_type,
-                size_bytes=size,
-                status="uploaded",
-                additional_meta={"content_type": content_type},
-            )
-            db.add(meta)
-            db.flush()
-            saved_records.append({
-                "id": meta.id,
-                "file_name": f.filename,
-                "file_type": file_type,
-                "status": meta.status,
-                "minio_path": minio_path,
-            })
-
+        # --- Step 2: Upload to MinIO concurrently ---
+        minio_paths = await upload_all(items)
+
+        # --- Step 3: Single bulk INSERT ... RETURNING id for the whole batch ---
+        rows = [
+            metadata_row(batch_id, item["file_name"], path, item["size"], item["content_type"],
+                         uploader_id=uploader_id, branch_id=branch_id)
+            for item, path in zip(items, minio_paths)
+        ]
+        saved_records = insert_metadata(db, rows)
         db.commit()
+        committed = True
 
         # Automatically trigger enhancement (Celery)
-        task = preprocess_job.delay(batch_id, [r["minio_path"] for r in saved_records])
-        logger.info(f"Enqueued preprocess job {task.id} for batch {batch_id}")
+        job = enqueue_preprocess(batch_id, minio_paths, total_pages, admission["priority"], profile=profile_mode,
+                                 branch_id=branch_id, uploader_id=uploader_id)
 
-        return JSONResponse({"batch_id": batch_id, "job_id": task.id, "files": saved_records})
+        return {"batch_id": batch_id, **job, "files": saved_records}
 
     except Exception as e:
         db.rollback()
         logger.exception("Error during upload")
+        # objects are only orphaned if the upload succeeded but the insert did not
+        if minio_paths and not committed:
+            try:
+                await run_in_threadpool(delete_objects, minio_paths)
+            except Exception:
+                logger.exception(f"Cleanup of {len(minio_paths)} uploaded object(s) failed")
         raise HTTPException(status_code=500, detail=str(e))
     finally:
         db.close()
@@ -104,53 +165,28 @@ async def upload_files(
 @app.post("/preprocess_callback")
 def preprocess_callback(payload: dict = Body(...)):
     """
-    Called by preprocessing_service after enhancement.
+    Called by preprocessing_service after enhancement when it could not publish the
+    batch to the status stream (see outbox_consumer.py, which normally applies it).
     Example payload:
     {
         "batch_id": "...",
         "results": [
-            {"original": "documents/...jpg", "enhanced": "documents/enhanced/...jpg"}
+            {"original": "documents/...jpg", "enhanced": "documents/enhanced/...jpg",
+             "page": 1, "quality": {...}, "stages": ["clahe"]}
         ]
     }
     """
     db = SessionLocal()
     try:
         batch_id = payload.get("batch_id")
-        results = payload.get("results", [])
-        logger.info(f"Preprocess callback received for {batch_id}")
-
-        updated = 0
-        for r in results:
-            original_path = r.get("original")
-            enhanced_path = r.get("enhanced")
-
-            if not original_path or not enhanced_path:
-                continue
-
-            # Try exact match first
-            record = db.query(FileMetadata).filter(FileMetadata.minio_path == original_path).first()
-
-            # Fallback: try partial match (for cases where path prefixes differ)
-            if not record:
-                record = (
-                    db.query(FileMetadata)
-                    .filter(FileMetadata.minio_path.ilike(f"%{original_path.split('/')[-1]}"))
-                    .first()
-                )
-
-            if record:
-                record.status = "enhanced"
-                record.additional_meta = record.additional_meta or {}
-                record.additional_meta["enhanced_path"] = enhanced_path
-                db.add(record)
-                updated += 1
-            else:
-                logger.warning(f"No match found in DB for {original_path}")
+        logger.info("Preprocess callback received for %s", batch_id)
 
+        applied = apply_events(db, [dict(payload, type="batch")])
         db.commit()
-        logger.info(f"Callback updated {updated} records for batch {batch_id}")
+        mark_completed(applied["completed"])
+        logger.info("Callback updated %d records for batch %s", applied["updated"], batch_id)
 
-        return {"status": "success", "batch_id": batch_id, "updated_records": updated}
+        return {"status": "success", "batch_id": batch_id, "updated_records": applied["updated"]}
     except Exception as e:
         db.rollback()
         logger.exception("Error in preprocess callback")
@@ -169,17 +205,32 @@ def batch_status(batch_id: str):
             raise HTTPException(status_code=404, detail="Batch not found")
 
         result = []
+        near_duplicates = 0
         for r in records:
+            pages = (r.additional_meta or {}).get("pages") or {}
+            duplicates = [
+                {"page": int(n), "match": p["near_duplicate"]}
+                for n, p in sorted(pages.items(), key=lambda kv: int(kv[0]))
+                if p.get("near_duplicate")
+            ]
+            near_duplicates += len(duplicates)
             result.append({
                 "id": r.id,
                 "file_name": r.file_name,
                 "file_type": r.file_type,
                 "status": r.status,
+                "error": (r.additional_meta or {}).get("error"),
                 "minio_path": r.minio_path,
                 "enhanced_path": (r.additional_meta or {}).get("enhanced_path"),
+                "pages_done": (r.additional_meta or {}).get("pages_done", 0),
                 "uploaded_at": str(r.created_at),
+                "timings": (r.additional_meta or {}).get("timings"),
+                "memory": (r.additional_meta or {}).get("memory"),
+                "near_duplicates": duplicates,
             })
-        return {"batch_id": batch_id, "files": result}
+        return {"batch_id": batch_id, "near_duplicate_pages": near_duplicates, "files": result}
+    except HTTPException:
+        raise
     except Exception as e:
         logger.exception("Error fetching batch status")
         raise HTTPException(status_code=500, detail=str(e))
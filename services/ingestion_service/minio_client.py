@@ -1,5 +1,7 @@
 # services/ingestion_service/minio_client.py
 from minio import Minio
+from minio.datatypes import Part
+from minio.deleteobjects import DeleteObject
 from io import BytesIO
 from common.config.settings import settings
 
@@ -19,3 +21,120 @@ def upload_bytes(file_bytes: bytes, object_name: str, content_type: str):
     stream.seek(0)
     client.put_object(bucket_name=bucket, object_name=object_name, data=stream, length=len(file_bytes), content_type=content_type)
     return f"{bucket}/{object_name}"
+
+def delete_objects(minio_paths: list):
+    """Bulk-delete objects given as "bucket/object" paths; returns the paths that failed."""
+    client = get_minio_client()
+    by_bucket = {}
+    for path in minio_paths:
+        bucket, object_name = path.split("/", 1)
+        by_bucket.setdefault(bucket, []).append(DeleteObject(object_name))
+
+    failed = []
+    for bucket, objects in by_bucket.items():
+        # remove_objects is lazy — errors are only reported while iterating
+        for err in client.remove_objects(bucket, objects):
+            failed.append(f"{bucket}/{err.name}")
+    return failed
+
+# ---------------- MULTIPART (resumable chunked uploads) ----------------
+# minio-py has no public API for a multipart upload whose parts arrive in separate
+# requests: put_object drives one from a single stream, and compose_object needs every
+# chunk stored as an object of its own first. These wrappers call put_object's private
+# helpers instead, and are the only place that does. Their signatures are those of the
+# minio==7.2.7 pinned in requirements.txt; _check_multipart_api() refuses to run against a
+# version where they differ, and tests/test_chunked_upload.py checks the pinned one.
+# Revisit both before changing the pin.
+
+MULTIPART_API = {
+    "_create_multipart_upload": ("bucket_name", "object_name", "headers"),
+    "_upload_part": ("bucket_name", "object_name", "data", "headers", "upload_id", "part_number"),
+    "_complete_multipart_upload": ("bucket_name", "object_name", "upload_id", "parts"),
+    "_abort_multipart_upload": ("bucket_name", "object_name", "upload_id"),
+}
+_multipart_api_checked = False
+
+
+def _check_multipart_api(client):
+    global _multipart_api_checked
+    if _multipart_api_checked:
+        return
+    import inspect
+    import minio
+
+    for name, expected in MULTIPART_API.items():
+        method = getattr(client, name, None)
+        params = tuple(inspect.signature(method).parameters) if method else None
+        if params != expected:
+            raise RuntimeError(
+                f"minio {minio.__version__}: {name}{params} is not the private multipart API "
+                f"minio_client.py was written against (minio==7.2.7: {name}{expected})"
+            )
+    _multipart_api_checked = True
+
+
+def create_multipart_upload(object_name: str, content_type: str) -> str:
+    client = get_minio_client()
+    _check_multipart_api(client)
+    return client._create_multipart_upload(
+        settings.MINIO_BUCKET, object_name, {"Content-Type": content_type}
+    )
+
+
+def upload_part(object_name: str, upload_id: str, part_number: int, data: bytes) -> str:
+    """Upload one part (1-based part_number) and return its ETag."""
+    client = get_minio_client()
+    return client._upload_part(
+        settings.MINIO_BUCKET, object_name, data, None, upload_id, part_number
+    )
+
+
+def complete_multipart_upload(object_name: str, upload_id: str, etags: dict) -> str:
+    """etags: part_number → ETag. Returns the "bucket/object" path of the assembled object."""
+    client = get_minio_client()
+    parts = [Part(number, etags[number]) for number in sorted(etags)]
+    client._complete_multipart_upload(settings.MINIO_BUCKET, object_name, upload_id, parts)
+    return f"{settings.MINIO_BUCKET}/{object_name}"
+
+
+def abort_multipart_upload(object_name: str, upload_id: str):
+    client = get_minio_client()
+    client._abort_multipart_upload(settings.MINIO_BUCKET, object_name, upload_id)
+
+
+def object_size(object_name: str):
+    """Size of an object in MINIO_BUCKET, or None if it doesn't exist."""
+    from minio.error import S3Error
+
+    try:
+        return get_minio_client().stat_object(settings.MINIO_BUCKET, object_name).size
+    except S3Error as e:
+        if e.code in ("NoSuchKey", "NoSuchObject"):
+            return None
+        raise
+
+
+# ---------------- STREAMED READS (exports) ----------------
+
+def list_prefix(bucket: str, prefix: str) -> list:
+    """Objects directly under prefix, with size, etag and last_modified (one paged LIST)."""
+    client = get_minio_client()
+    return [o for o in client.list_objects(bucket, prefix=prefix) if not o.is_dir]
+
+
+def iter_object(bucket: str, object_name: str, offset: int = 0, length: int = 0, chunk_size: int = 1024 * 1024,
+                etag: str = None):
+    """
+    Yield an object (or length bytes of it from offset; 0 = to the end) in chunks. With
+    etag, the GET is conditional (If-Match): if the object has changed since, MinIO
+    answers 412 and get_object raises S3Error with code PreconditionFailed.
+    """
+    client = get_minio_client()
+    # minio==7.2.7's get_object has no match_etag argument, so the header is set directly
+    headers = {"If-Match": f'"{etag}"'} if etag else None
+    response = client.get_object(bucket, object_name, offset=offset, length=length, request_headers=headers)
+    try:
+        yield from response.stream(chunk_size)
+    finally:
+        response.close()
+        response.release_conn()
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, JSON, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, BigInteger, Float, String, JSON, DateTime, ForeignKey, UniqueConstraint
 from sqlalchemy.sql import func
 from .db import Base
 
@@ -16,3 +16,28 @@ class FileMetadata(Base):
     status = Column(String, default="uploaded")  # ✅ <-- ADD THIS LINE
     additional_meta = Column(JSON, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class PageHash(Base):
+    """
+    Perceptual hashes of enhanced pages for near-duplicate lookups across batches.
+    The 64-bit pHash is also stored as four 16-bit chunks (h0..h3), each indexed: two
+    hashes within Hamming distance 3 share at least one chunk exactly (multi-index hashing).
+    """
+    __tablename__ = "page_hash"
+    __table_args__ = (UniqueConstraint("minio_path", "page", name="uq_page_hash_minio_path_page"),)
+
+    id = Column(Integer, primary_key=True)
+    batch_id = Column(String, index=True)
+    minio_path = Column(String)  # original object
+    page = Column(Integer)
+    enhanced_path = Column(String, nullable=True)
+    phash = Column(BigInteger)  # stored signed; see processor/phash.py
+    dhash = Column(BigInteger)
+    h0 = Column(Integer, index=True)
+    h1 = Column(Integer, index=True)
+    h2 = Column(Integer, index=True)
+    h3 = Column(Integer, index=True)
+    doc_type = Column(String, nullable=True)
+    confidence = Column(Float, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
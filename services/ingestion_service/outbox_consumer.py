@@ -0,0 +1,164 @@
+"""
+Applies preprocessing status events from the STATUS_STREAM Redis stream to FileMetadata.
+
+Entries are read through the STATUS_CONSUMER_GROUP consumer group, up to
+STATUS_CONSUMER_BATCH at a time, applied in one DB transaction and acknowledged only
+after the commit, so delivery is at-least-once; status_updates.apply_events makes
+re-applying an entry harmless. If a read batch fails to apply, its entries are retried
+one by one so a single bad entry doesn't hold up the rest.
+
+Entries left pending by a consumer that died are taken over with XAUTOCLAIM once idle
+for STATUS_CLAIM_IDLE_MS. After STATUS_MAX_DELIVERIES attempts an entry is copied to
+STATUS_DEAD_LETTER_STREAM and acknowledged.
+
+    python -m services.ingestion_service.outbox_consumer
+    python -m services.ingestion_service.outbox_consumer --once    # drain and exit
+
+Several consumers may run side by side; each needs a distinct --name (default: hostname).
+"""
+import argparse
+import json
+import socket
+import time
+import redis
+from common.config.redis_client import get_redis
+from common.config.settings import settings
+from common.utils.logger import get_logger
+from .db import SessionLocal
+from .status_updates import apply_events, mark_completed
+
+logger = get_logger("ingestion_outbox_consumer")
+
+
+def ensure_group(r):
+    try:
+        r.xgroup_create(settings.STATUS_STREAM, settings.STATUS_CONSUMER_GROUP, id="0", mkstream=True)
+    except redis.ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+
+def _dead_letter(r, entry_id: str, fields: dict, reason: str):
+    logger.error("Dead-lettering status event %s: %s", entry_id, reason)
+    pipe = r.pipeline()
+    pipe.xadd(settings.STATUS_DEAD_LETTER_STREAM, dict(fields, source_id=entry_id, reason=reason[:500]))
+    pipe.xack(settings.STATUS_STREAM, settings.STATUS_CONSUMER_GROUP, entry_id)
+    pipe.execute()
+
+
+def _apply(events: list) -> dict:
+    db = SessionLocal()
+    try:
+        applied = apply_events(db, events)
+        db.commit()
+        return applied
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def handle(r, entries: list) -> int:
+    """Apply and acknowledge a list of (id, fields); returns how many were applied."""
+    events, ids = [], []
+    for entry_id, fields in entries:
+        try:
+            events.append(json.loads(fields["data"]))
+            ids.append(entry_id)
+        except (KeyError, ValueError) as e:
+            _dead_letter(r, entry_id, fields, f"malformed entry: {e}")
+    if not events:
+        return 0
+
+    try:
+        applied = _apply(events)
+        done = list(zip(ids, events))
+        completed = applied["completed"]
+    except Exception as e:
+        logger.warning("Applying %d status events failed (%s); retrying them one by one", len(events), e)
+        done, completed = [], {}
+        for entry_id, event in zip(ids, events):
+            try:
+                completed.update(_apply([event])["completed"])
+                done.append((entry_id, event))
+            except Exception:
+                # stays pending; reclaimed (and eventually dead-lettered) by claim_stale
+                logger.exception("Status event %s for batch %s failed", entry_id, event.get("batch_id"))
+
+    if done:
+        r.xack(settings.STATUS_STREAM, settings.STATUS_CONSUMER_GROUP, *[entry_id for entry_id, _ in done])
+    mark_completed(completed)
+    return len(done)
+
+
+def claim_stale(r, consumer: str) -> int:
+    """Take over entries other consumers left pending; dead-letter those retried too often."""
+    pending = r.xpending_range(settings.STATUS_STREAM, settings.STATUS_CONSUMER_GROUP, min="-", max="+",
+                               count=settings.STATUS_CONSUMER_BATCH, idle=settings.STATUS_CLAIM_IDLE_MS)
+    exhausted = [p["message_id"] for p in pending if p["times_delivered"] >= settings.STATUS_MAX_DELIVERIES]
+    for entry_id in exhausted:
+        entries = r.xrange(settings.STATUS_STREAM, min=entry_id, max=entry_id)
+        fields = entries[0][1] if entries else {}
+        _dead_letter(r, entry_id, fields, f"not applied after {settings.STATUS_MAX_DELIVERIES} deliveries")
+
+    applied, start = 0, "0-0"
+    while True:
+        start, entries, *_ = r.xautoclaim(settings.STATUS_STREAM, settings.STATUS_CONSUMER_GROUP, consumer,
+                                          min_idle_time=settings.STATUS_CLAIM_IDLE_MS, start_id=start,
+                                          count=settings.STATUS_CONSUMER_BATCH)
+        # entries trimmed from the stream come back as None
+        entries = [e for e in entries if e and e[1] is not None]
+        if entries:
+            logger.info("Claimed %d stale status event(s)", len(entries))
+            applied += handle(r, entries)
+        if start in ("0-0", b"0-0"):
+            return applied
+
+
+def _replay_own(r, consumer: str):
+    """Entries delivered to this consumer name before a restart but never acknowledged."""
+    start = "0"
+    while True:
+        response = r.xreadgroup(settings.STATUS_CONSUMER_GROUP, consumer, {settings.STATUS_STREAM: start},
+                                count=settings.STATUS_CONSUMER_BATCH)
+        entries = [e for e in (response[0][1] if response else []) if e[1]]
+        if not entries:
+            return
+        handle(r, entries)
+        start = entries[-1][0]
+
+
+def run(consumer: str, once: bool = False):
+    r = get_redis()
+    ensure_group(r)
+    _replay_own(r, consumer)
+    claim_stale(r, consumer)
+    last_claim = time.monotonic()
+    while True:
+        response = r.xreadgroup(settings.STATUS_CONSUMER_GROUP, consumer, {settings.STATUS_STREAM: ">"},
+                                count=settings.STATUS_CONSUMER_BATCH,
+                                block=None if once else settings.STATUS_CONSUMER_BLOCK_MS)
+        entries = response[0][1] if response else []
+        if entries:
+            applied = handle(r, entries)
+            logger.info("Applied %d/%d status event(s)", applied, len(entries))
+        elif once:
+            return
+        # pick up what other (dead) consumers left behind
+        if time.monotonic() - last_claim >= settings.STATUS_CLAIM_IDLE_MS / 1000:
+            last_claim = time.monotonic()
+            claim_stale(r, consumer)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--name", default=socket.gethostname(),
+                        help="consumer name; keep it stable across restarts so pending entries are replayed")
+    parser.add_argument("--once", action="store_true", help="apply what is queued, then exit")
+    args = parser.parse_args(argv)
+    run(args.name, once=args.once)
+
+
+if __name__ == "__main__":
+    main()
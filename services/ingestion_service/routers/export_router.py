@@ -0,0 +1,119 @@
+# services/ingestion_service/routers/export_router.py
+"""
+Bulk export of originals and enhanced outputs, streamed straight from MinIO.
+
+    GET|HEAD /exports/zip?batch_id=...                      one batch as a ZIP
+    GET|HEAD /exports/zip?date_from=...&date_to=...         every batch uploaded in [from, to)
+    GET      /exports/pdf?batch_id=...                      enhanced pages as one PDF
+
+include = all | enhanced | originals (zip default: all, pdf default: enhanced).
+
+The ZIP has a fixed layout for unchanged data, so it supports Range / If-Range: an
+interrupted download resumes with `Range: bytes=<received>-` and the ETag it got first.
+"""
+from datetime import datetime
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+from common.utils.logger import get_logger
+from ..db import SessionLocal
+from ..export import ExportNotFound, ExportTooLarge, ZipLayout, export_etag, iter_pdf, pdf_entries, resolve_export
+
+router = APIRouter(prefix="/exports", tags=["exports"])
+logger = get_logger("ingestion_export_router")
+
+INCLUDE = {"all": ("originals", "enhanced"), "enhanced": ("enhanced",), "originals": ("originals",)}
+
+
+def _resolve(batch_id: Optional[str], date_from: Optional[datetime], date_to: Optional[datetime],
+             include: str) -> list:
+    if include not in INCLUDE:
+        raise HTTPException(status_code=400, detail=f"include must be one of {', '.join(INCLUDE)}")
+    if not batch_id and not (date_from and date_to):
+        raise HTTPException(status_code=400, detail="Give batch_id, or both date_from and date_to")
+    db = SessionLocal()
+    try:
+        return resolve_export(db, batch_id, date_from, date_to, INCLUDE[include])
+    except ExportNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ExportTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    finally:
+        db.close()
+
+
+def _byte_range(header: Optional[str], total: int):
+    """(start, end) of a single "bytes=" range, end exclusive; None to send everything."""
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None  # multi-range requests get the whole archive, which RFC 9110 allows
+    first, _, last = header[len("bytes="):].strip().partition("-")
+    try:
+        if first:
+            start, end = int(first), int(last) + 1 if last else total
+        else:
+            start, end = max(0, total - int(last)), total
+    except ValueError:
+        return None
+    end = min(end, total)
+    if start >= end:
+        raise HTTPException(status_code=416, detail="Range not satisfiable",
+                            headers={"Content-Range": f"bytes */{total}"})
+    return start, end
+
+
+def _filename(batch_id: Optional[str], date_from: Optional[datetime], date_to: Optional[datetime], ext: str) -> str:
+    if batch_id:
+        return f"{batch_id}.{ext}"
+    return f"export_{date_from:%Y%m%d}-{date_to:%Y%m%d}.{ext}"
+
+
+@router.api_route("/zip", methods=["GET", "HEAD"])
+def export_zip(
+    request: Request,
+    batch_id: Optional[str] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    include: str = "all",
+):
+    entries = _resolve(batch_id, date_from, date_to, include)
+    layout = ZipLayout(entries)
+    etag = export_etag(entries)
+    headers = {
+        "Accept-Ranges": "bytes",
+        "ETag": etag,
+        "Content-Disposition": f'attachment; filename="{_filename(batch_id, date_from, date_to, "zip")}"',
+    }
+
+    span = _byte_range(request.headers.get("range"), layout.total)
+    # If-Range: resume only if the archive is still the one the client started on
+    if span and request.headers.get("if-range") not in (None, etag):
+        span = None
+    start, end = span or (0, layout.total)
+    headers["Content-Length"] = str(end - start)
+    status = 206 if span else 200
+    if span:
+        headers["Content-Range"] = f"bytes {start}-{end - 1}/{layout.total}"
+
+    if request.method == "HEAD":
+        return Response(status_code=status, headers=headers, media_type="application/zip")
+    logger.info("Exporting %d file(s) as ZIP, bytes %d-%d of %d", len(entries) - 1, start, end, layout.total)
+    return StreamingResponse(layout.iter_range(start, end), status_code=status, headers=headers,
+                             media_type="application/zip")
+
+
+@router.get("/pdf")
+def export_pdf(
+    batch_id: Optional[str] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    include: str = "enhanced",
+):
+    entries = pdf_entries(_resolve(batch_id, date_from, date_to, include))
+    if not entries:
+        raise HTTPException(status_code=404, detail="No images to export")
+    logger.info("Exporting %d image(s) as one PDF", len(entries))
+    headers = {
+        "Accept-Ranges": "none",
+        "Content-Disposition": f'attachment; filename="{_filename(batch_id, date_from, date_to, "pdf")}"',
+    }
+    return StreamingResponse(iter_pdf(entries), headers=headers, media_type="application/pdf")
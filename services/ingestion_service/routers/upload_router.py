@@ -0,0 +1,352 @@
+# services/ingestion_service/routers/upload_router.py
+"""
+Resumable chunked uploads for documents larger than the single-shot /upload limit.
+
+    POST   /uploads                         create → upload_id, chunk_size, total_chunks
+    PUT    /uploads/{upload_id}/chunks/{i}  upload chunk i (0-based, any order, re-PUT is safe)
+    GET    /uploads/{upload_id}             received / missing chunks and contiguous offset
+    POST   /uploads/{upload_id}/complete    assemble, register FileMetadata, start preprocessing
+    DELETE /uploads/{upload_id}             abort
+
+Every chunk is forwarded straight to MinIO as one multipart part, so chunks PUT concurrently
+by the client are uploaded to MinIO in parallel and nothing larger than a chunk is buffered.
+
+/complete moves an upload through uploading → assembled → registered → completed and
+records each step before taking the next, so a retried /complete picks up where a failed
+one stopped instead of completing the multipart upload twice. Uploads not yet registered
+are listed in OPEN_KEY, which outlives their TTL'd state. reap_abandoned() (run by
+services/scripts/reaper.py) aborts the multipart upload of an abandoned one, freeing its
+parts, or deletes its object if it was assembled but never registered.
+"""
+import json
+import math
+import time
+import uuid
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel
+from sqlalchemy import select
+from common.config.redis_client import get_redis
+from common.config.settings import settings
+from common.utils.logger import get_logger
+from ..db import SessionLocal
+from ..minio_client import (
+    create_multipart_upload, upload_part, complete_multipart_upload, abort_multipart_upload,
+    object_size, delete_objects,
+)
+from ..models import FileMetadata
+from ..admission import check_admission
+from ..utils.file_handler import (
+    ALLOWED_MIMES, resolve_content_type, metadata_row, insert_metadata, enqueue_preprocess,
+)
+
+router = APIRouter(prefix="/uploads", tags=["chunked-uploads"])
+logger = get_logger("ingestion_chunked_upload")
+
+KEY_PREFIX = "docintel:upload:"
+OPEN_KEY = "docintel:upload:open"  # zset upload_id → last activity, until registered
+OPEN_TARGETS_KEY = "docintel:upload:open:targets"  # hash upload_id → what to clean up if abandoned
+
+
+class CreateUploadRequest(BaseModel):
+    file_name: str
+    total_size: int
+    content_type: Optional[str] = None
+    branch_id: Optional[str] = None
+    uploader_id: Optional[str] = None
+    low_priority: bool = False
+
+
+def _meta_key(upload_id: str) -> str:
+    return f"{KEY_PREFIX}{upload_id}"
+
+
+def _parts_key(upload_id: str) -> str:
+    return f"{KEY_PREFIX}{upload_id}:parts"
+
+
+def _load(upload_id: str) -> dict:
+    raw = get_redis().get(_meta_key(upload_id))
+    if not raw:
+        raise HTTPException(status_code=404, detail="Upload not found or expired")
+    return json.loads(raw)
+
+
+def _store(upload_id: str, meta: dict):
+    get_redis().set(_meta_key(upload_id), json.dumps(meta), ex=settings.CHUNKED_UPLOAD_TTL_S)
+
+
+def _received(upload_id: str) -> dict:
+    """part_number → {"etag", "size"} for every chunk stored so far."""
+    raw = get_redis().hgetall(_parts_key(upload_id))
+    return {int(k): json.loads(v) for k, v in raw.items()}
+
+
+def _track_open(meta: dict):
+    target = {"object_name": meta["object_name"], "minio_upload_id": meta["minio_upload_id"],
+              "minio_path": meta.get("minio_path")}
+    pipe = get_redis().pipeline()
+    pipe.zadd(OPEN_KEY, {meta["upload_id"]: time.time()})
+    pipe.hset(OPEN_TARGETS_KEY, meta["upload_id"], json.dumps(target))
+    pipe.execute()
+
+
+def _untrack_open(upload_id: str):
+    pipe = get_redis().pipeline()
+    pipe.zrem(OPEN_KEY, upload_id)
+    pipe.hdel(OPEN_TARGETS_KEY, upload_id)
+    pipe.execute()
+
+
+def _clean_up(target: dict):
+    """Free what an abandoned upload left in MinIO: its parts, or its unregistered object."""
+    if not target.get("minio_path"):
+        try:
+            abort_multipart_upload(target["object_name"], target["minio_upload_id"])
+        except Exception as e:
+            if getattr(e, "code", None) != "NoSuchUpload":
+                raise
+        return
+    with SessionLocal() as db:
+        registered = db.execute(
+            select(FileMetadata.id).where(FileMetadata.minio_path == target["minio_path"]).limit(1)
+        ).first()
+    if not registered:
+        failed = delete_objects([target["minio_path"]])
+        if failed:
+            raise RuntimeError(f"could not delete {failed[0]}")
+
+
+def reap_abandoned(max_idle_s: int = None, dry_run: bool = False) -> dict:
+    """
+    Clean up uploads idle for longer than max_idle_s (default CHUNKED_UPLOAD_TTL_S) whose
+    Redis state has expired. Without this the parts of a multipart upload stay in MinIO,
+    invisible to listings, until the server's own stale-upload cleanup runs.
+    """
+    r = get_redis()
+    max_idle_s = settings.CHUNKED_UPLOAD_TTL_S if max_idle_s is None else max_idle_s
+    stats = {"abandoned": 0, "cleaned": 0, "failed": 0}
+    for upload_id in r.zrangebyscore(OPEN_KEY, 0, time.time() - max_idle_s):
+        if r.exists(_meta_key(upload_id)):
+            continue  # still resumable: its TTL was refreshed after the score
+        stats["abandoned"] += 1
+        if dry_run:
+            continue
+        raw = r.hget(OPEN_TARGETS_KEY, upload_id)
+        try:
+            if raw:
+                _clean_up(json.loads(raw))
+        except Exception as e:
+            stats["failed"] += 1
+            logger.warning("Could not clean up abandoned upload %s: %s", upload_id, e)
+            continue
+        _untrack_open(upload_id)
+        stats["cleaned"] += 1
+    return stats
+
+
+def _progress(meta: dict, received: dict) -> dict:
+    total_chunks = meta["total_chunks"]
+    missing = [i for i in range(total_chunks) if i + 1 not in received]
+    contiguous = missing[0] if missing else total_chunks
+    return {
+        "upload_id": meta["upload_id"],
+        "batch_id": meta["batch_id"],
+        "chunk_size": meta["chunk_size"],
+        "total_size": meta["total_size"],
+        "total_chunks": total_chunks,
+        "received_chunks": len(received),
+        "missing_chunks": missing,
+        # bytes that can be skipped when resuming sequentially from the start
+        "offset": min(contiguous * meta["chunk_size"], meta["total_size"]),
+        "status": meta["status"],
+    }
+
+
+@router.post("")
+def create_upload(req: CreateUploadRequest):
+    content_type = resolve_content_type(req.file_name, req.content_type)
+    if content_type not in ALLOWED_MIMES:
+        raise HTTPException(status_code=400, detail=f"Unsupported file type: {content_type} ({req.file_name})")
+    if req.total_size <= 0 or req.total_size > settings.CHUNKED_UPLOAD_MAX_BYTES:
+        raise HTTPException(status_code=400, detail=f"File {req.file_name} exceeds size limit")
+
+    # the PDF isn't here yet, so its page count is estimated from its size
+    pages = 1
+    if content_type == "application/pdf":
+        pages = max(1, req.total_size // settings.CHUNKED_UPLOAD_BYTES_PER_PAGE_ESTIMATE)
+    admission = check_admission(pages, req.low_priority)
+    if not admission["admitted"]:
+        raise HTTPException(
+            status_code=429,
+            detail="Preprocessing backlog is full, retry later",
+            headers={"Retry-After": str(admission["retry_after"])},
+        )
+
+    batch_id = str(uuid.uuid4())
+    object_name = f"{batch_id}/{uuid.uuid4().hex}_{req.file_name}"
+    chunk_size = settings.CHUNKED_UPLOAD_CHUNK_SIZE
+    meta = {
+        "upload_id": uuid.uuid4().hex,
+        "minio_upload_id": create_multipart_upload(object_name, content_type),
+        "batch_id": batch_id,
+        "object_name": object_name,
+        "file_name": req.file_name,
+        "content_type": content_type,
+        "total_size": req.total_size,
+        "chunk_size": chunk_size,
+        "total_chunks": math.ceil(req.total_size / chunk_size),
+        "pages": pages,
+        "priority": admission["priority"],
+        "branch_id": req.branch_id,
+        "uploader_id": req.uploader_id,
+        "status": "uploading",
+    }
+    _store(meta["upload_id"], meta)
+    _track_open(meta)
+    logger.info(f"Created chunked upload {meta['upload_id']} for {req.file_name} ({meta['total_chunks']} chunks)")
+    return _progress(meta, {})
+
+
+@router.put("/{upload_id}/chunks/{index}")
+async def put_chunk(upload_id: str, index: int, request: Request):
+    meta = await run_in_threadpool(_load, upload_id)
+    if meta["status"] != "uploading":
+        raise HTTPException(status_code=409, detail=f"Upload is {meta['status']}")
+    if index < 0 or index >= meta["total_chunks"]:
+        raise HTTPException(status_code=400, detail=f"Chunk index out of range 0..{meta['total_chunks'] - 1}")
+
+    # every chunk but the last must be exactly chunk_size (MinIO parts ≥ 5 MiB)
+    expected = min(meta["chunk_size"], meta["total_size"] - index * meta["chunk_size"])
+    data = await request.body()
+    if len(data) != expected:
+        raise HTTPException(status_code=400, detail=f"Chunk {index} must be {expected} bytes, got {len(data)}")
+
+    part_number = index + 1
+    etag = await run_in_threadpool(upload_part, meta["object_name"], meta["minio_upload_id"], part_number, data)
+
+    r = get_redis()
+    pipe = r.pipeline()
+    pipe.hset(_parts_key(upload_id), part_number, json.dumps({"etag": etag, "size": len(data)}))
+    pipe.expire(_parts_key(upload_id), settings.CHUNKED_UPLOAD_TTL_S)
+    pipe.expire(_meta_key(upload_id), settings.CHUNKED_UPLOAD_TTL_S)
+    pipe.zadd(OPEN_KEY, {upload_id: time.time()}, xx=True)
+    await run_in_threadpool(pipe.execute)
+    return {"upload_id": upload_id, "index": index, "size": len(data), "etag": etag}
+
+
+@router.get("/{upload_id}")
+def upload_status(upload_id: str):
+    meta = _load(upload_id)
+    progress = _progress(meta, _received(upload_id))
+    if meta.get("result"):
+        progress["result"] = meta["result"]
+    return progress
+
+
+def _assemble(meta: dict, received: dict) -> str:
+    """Complete the multipart upload; "bucket/object" path of the assembled object."""
+    try:
+        return complete_multipart_upload(
+            meta["object_name"], meta["minio_upload_id"],
+            {number: part["etag"] for number, part in received.items()},
+        )
+    except Exception:
+        # an earlier attempt may have completed it and lost the response: MinIO then
+        # reports NoSuchUpload, but the object is there in full
+        if object_size(meta["object_name"]) == meta["total_size"]:
+            return f"{settings.MINIO_BUCKET}/{meta['object_name']}"
+        raise
+
+
+def _register(db, meta: dict) -> list:
+    """FileMetadata rows for the assembled object, inserted unless a previous attempt did."""
+    existing = db.execute(
+        select(FileMetadata).where(FileMetadata.minio_path == meta["minio_path"])
+    ).scalars().all()
+    if existing:
+        return [
+            {"id": f.id, "file_name": f.file_name, "file_type": f.file_type, "status": f.status,
+             "minio_path": f.minio_path}
+            for f in existing
+        ]
+    row = metadata_row(meta["batch_id"], meta["file_name"], meta["minio_path"], meta["total_size"],
+                       meta["content_type"], uploader_id=meta["uploader_id"], branch_id=meta["branch_id"])
+    saved_records = insert_metadata(db, [row])
+    db.commit()
+    return saved_records
+
+
+@router.post("/{upload_id}/complete")
+def complete_upload(upload_id: str):
+    meta = _load(upload_id)
+    # completing twice (e.g. the first response was lost) returns the original result
+    if meta["status"] == "completed":
+        return meta["result"]
+
+    # only one concurrent /complete may assemble the object
+    r = get_redis()
+    lock_key = f"{_meta_key(upload_id)}:completing"
+    if not r.set(lock_key, "1", nx=True, ex=300):
+        raise HTTPException(status_code=409, detail="Upload is already being completed")
+
+    db = SessionLocal()
+    try:
+        # re-read under the lock: a concurrent attempt may have moved it on
+        meta = _load(upload_id)
+        if meta["status"] == "completed":
+            return meta["result"]
+
+        if meta["status"] == "uploading":
+            received = _received(upload_id)
+            progress = _progress(meta, received)
+            if progress["missing_chunks"]:
+                raise HTTPException(status_code=400, detail={
+                    "message": "Upload incomplete",
+                    "missing_chunks": progress["missing_chunks"],
+                })
+            meta.update({"status": "assembled", "minio_path": _assemble(meta, received)})
+            _store(upload_id, meta)
+            _track_open(meta)
+
+        # --- Same FileMetadata row and preprocessing trigger as /upload ---
+        if meta["status"] == "assembled":
+            meta.update({"status": "registered", "files": _register(db, meta)})
+            _store(upload_id, meta)
+            _untrack_open(upload_id)
+
+        job = enqueue_preprocess(meta["batch_id"], [meta["minio_path"]], meta["pages"], meta["priority"],
+                                 branch_id=meta["branch_id"], uploader_id=meta["uploader_id"])
+        result = {"batch_id": meta["batch_id"], **job, "files": meta["files"]}
+
+        meta.update({"status": "completed", "result": result})
+        _store(upload_id, meta)
+        r.delete(_parts_key(upload_id))
+        logger.info(f"Completed chunked upload {upload_id} → {meta['minio_path']}")
+        return result
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        db.rollback()
+        logger.exception(f"Error completing chunked upload {upload_id} (status {meta['status']}; retry resumes)")
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        r.delete(lock_key)
+        db.close()
+
+
+@router.delete("/{upload_id}")
+def abort_upload(upload_id: str):
+    meta = _load(upload_id)
+    if meta["status"] in ("registered", "completed"):
+        raise HTTPException(status_code=409, detail="Upload already completed")
+    if meta["status"] == "assembled":
+        delete_objects([meta["minio_path"]])
+    else:
+        abort_multipart_upload(meta["object_name"], meta["minio_upload_id"])
+    _untrack_open(upload_id)
+    get_redis().delete(_meta_key(upload_id), _parts_key(upload_id))
+    logger.info(f"Aborted chunked upload {upload_id}")
+    return {"upload_id": upload_id, "status": "aborted"}
@@ -0,0 +1,143 @@
+# services/ingestion_service/status_updates.py
+import time
+from common.config.redis_client import get_redis
+from common.config.settings import settings
+from common.utils.logger import get_logger
+from .admission import track_completed
+from .models import FileMetadata
+
+logger = get_logger("ingestion_status_updates")
+
+# Applies preprocessing results to FileMetadata, shared by the status-event consumer
+# (outbox_consumer.py) and the /preprocess_callback endpoint. Events may be delivered
+# more than once and a batch may arrive through both paths, so every update is
+# idempotent: a page result overwrites its own entry, statuses never move backwards
+# (uploaded → enhancing → enhanced / failed), and a batch is counted as completed once.
+#
+# Event shapes (the "data" of a stream entry):
+#   {"type": "page",  "batch_id": ..., "result": {"original", "enhanced", "page", ...}}
+#   {"type": "batch", "batch_id": ..., "results": [...], "timings": {...}, "memory": {...}}
+# A "batch" event is the old callback payload and carries every result of the batch.
+
+COMPLETED_MARK_PREFIX = "docintel:status:completed:"
+
+_FINAL_STATUSES = ("enhanced", "failed")
+
+
+def _find_records(db, paths: set) -> dict:
+    """minio_path → FileMetadata for every path, with one IN query for the exact matches."""
+    records = {}
+    if paths:
+        for record in db.query(FileMetadata).filter(FileMetadata.minio_path.in_(paths)):
+            records[record.minio_path] = record
+    for path in paths - set(records):
+        # Fallback: try partial match (for cases where path prefixes differ)
+        record = (
+            db.query(FileMetadata)
+            .filter(FileMetadata.minio_path.ilike(f"%{path.split('/')[-1]}"))
+            .first()
+        )
+        if record:
+            records[path] = record
+    return records
+
+
+def _apply_page(record, r: dict):
+    # JSON columns are not mutation-tracked — build a new dict and reassign
+    meta = dict(record.additional_meta or {})
+    meta["enhanced_path"] = r["enhanced"]
+    pages = dict(meta.get("pages") or {})
+    pages[str(r.get("page", 1))] = {
+        "enhanced_path": r["enhanced"],
+        "quality": r.get("quality"),
+        "stages": r.get("stages"),
+        "type": r.get("type"),
+        "confidence": r.get("confidence"),
+        "near_duplicate": r.get("near_duplicate"),
+        "content": r.get("content"),
+        "text_path": r.get("text"),
+        "pipeline_version": r.get("pipeline_version"),
+    }
+    meta["pages"] = pages
+    meta["pages_done"] = len(pages)
+    record.additional_meta = meta
+    if record.status not in _FINAL_STATUSES:
+        record.status = "enhancing"
+
+
+def _apply_error(record, r: dict):
+    meta = dict(record.additional_meta or {})
+    meta["error"] = r["error"]
+    record.additional_meta = meta
+
+
+def _finish(record, timings: dict, memory: dict):
+    meta = dict(record.additional_meta or {})
+    meta["timings"] = timings
+    if memory:
+        meta["memory"] = memory
+    record.additional_meta = meta
+    if meta.get("enhanced_path"):
+        record.status = "enhanced"
+    elif meta.get("error") and record.status != "enhanced":
+        record.status = "failed"
+
+
+def apply_events(db, events: list) -> dict:
+    """
+    Apply a list of event dicts inside the caller's session (the caller commits).
+    Returns {"updated": records touched, "completed": {batch_id: pages}} — pass the
+    latter to mark_completed once the transaction has committed.
+    """
+    results_of = []
+    for event in events:
+        if event["type"] == "page":
+            results_of.append(event["result"])
+        elif event["type"] == "batch":
+            results_of.extend(event.get("results") or [])
+    records = _find_records(db, {r["original"] for r in results_of if r.get("original")})
+
+    touched, completed = set(), {}
+    for event in events:
+        batch_id = event.get("batch_id")
+        results = [event["result"]] if event["type"] == "page" else (event.get("results") or [])
+        batch_records = {}
+        for r in results:
+            record = records.get(r.get("original"))
+            if record is None:
+                if r.get("original"):
+                    logger.warning("No match found in DB for %s", r["original"], extra={"batch_id": batch_id})
+                continue
+            if r.get("enhanced"):
+                _apply_page(record, r)
+            elif r.get("error"):
+                _apply_error(record, r)
+            else:
+                continue
+            batch_records[record.id] = record
+            touched.add(record.id)
+
+        if event["type"] == "batch":
+            # per-hop timestamps from enqueue to this update, surfaced by /batch_status
+            timings = dict(event.get("timings") or {}, callback_received=time.time())
+            for record in db.query(FileMetadata).filter(FileMetadata.batch_id == batch_id):
+                batch_records.setdefault(record.id, record)
+            for record in batch_records.values():
+                _finish(record, timings, event.get("memory"))
+                touched.add(record.id)
+            completed[batch_id] = len(results)
+
+    return {"updated": len(touched), "completed": completed}
+
+
+def mark_completed(completed: dict):
+    """track_completed once per batch, however many times its batch event is applied."""
+    for batch_id, pages in completed.items():
+        try:
+            first = get_redis().set(f"{COMPLETED_MARK_PREFIX}{batch_id}", 1, nx=True,
+                                    ex=settings.ADMISSION_INFLIGHT_TTL_S)
+        except Exception as e:
+            logger.warning(f"Could not check completion mark of batch {batch_id}: {e}")
+            first = True
+        if first:
+            track_completed(batch_id, pages)
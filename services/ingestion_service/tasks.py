@@ -1,28 +1,72 @@
 # services/ingestion_service/tasks.py
+from celery.exceptions import Retry, SoftTimeLimitExceeded
 from .celery_app import celery
+from common.config.settings import settings
 from common.utils.logger import get_logger
+from common.utils import profiling
+from . import fair_scheduler
 import requests
 import socket
+import time
 
 logger = get_logger("ingestion_tasks")
 
-@celery.task(bind=True)
-def preprocess_job(self, batch_id: str, files: list):
+# Failures worth retrying: preprocessing unreachable, timing out, or still warming up (503)
+RETRYABLE_STATUS = {502, 503, 504}
+
+
+@celery.task(bind=True, max_retries=settings.PREPROCESS_MAX_RETRIES)
+def preprocess_job(self, batch_id: str, files: list, enqueued_at: float = None, profile: str = None):
     """
     Calls preprocessing_service /process_batch endpoint.
+    `enqueued_at` (epoch seconds) is passed through as the first per-hop timing.
+    `profile` ("cprofile", "sample" or true) profiles this run and, via X-Profile, process_batch.
     """
+    mode = profiling.requested_mode(profile)
+    finished = True
+    try:
+        with profiling.profiled(mode, batch_id, "preprocess_job") as prof:
+            result = _call_preprocessing(self, batch_id, files, enqueued_at, mode)
+    except Retry:
+        finished = False  # keeps its fair_scheduler slot until the retry runs
+        raise
+    finally:
+        if finished:
+            fair_scheduler.job_finished(self.request.id)
+    if prof:
+        result["profile"] = prof.path
+    return result
+
+
+def _call_preprocessing(task, batch_id: str, files: list, enqueued_at: float, profile_mode: str) -> dict:
     logger.info(f"preprocess_job: calling preprocessing_service for batch {batch_id}")
     local_ip = socket.gethostbyname(socket.gethostname())
     url = f"http://{local_ip}:8100/process_batch"
     payload = {
         "batch_id": batch_id,
-        "items": [{"object_path": p} for p in files]
+        "items": [{"object_path": p} for p in files],
+        "timings": {"enqueued": enqueued_at, "dispatched": time.time()},
     }
+    # Stay inside the soft limit so a slow batch surfaces as a timeout, not a kill. Under the
+    # threads and solo pools Celery enforces no time limit, so this is the only bound.
+    http_timeout = max(60, settings.CELERY_TASK_SOFT_TIME_LIMIT - 30)
     try:
-        r = requests.post(url, json=payload, timeout=60)
+        headers = {profiling.HEADER: profile_mode} if profile_mode else None
+        r = requests.post(url, json=payload, headers=headers, timeout=http_timeout)
         r.raise_for_status()
         logger.info(f"preprocessing_service responded: {r.status_code}")
         return {"status": "submitted", "response": r.json()}
+    except SoftTimeLimitExceeded:
+        logger.error(f"preprocess_job for batch {batch_id} hit the soft time limit")
+        raise
+    except (requests.ConnectionError, requests.Timeout, requests.HTTPError) as e:
+        status = getattr(e.response, "status_code", None)
+        if isinstance(e, requests.HTTPError) and status not in RETRYABLE_STATUS:
+            logger.exception("Failed to call preprocessing_service")
+            raise
+        countdown = settings.PREPROCESS_RETRY_BACKOFF_S * (2 ** task.request.retries)
+        logger.warning(f"preprocessing_service unavailable ({e}); retrying batch {batch_id} in {countdown}s")
+        raise task.retry(exc=e, countdown=countdown)
     except Exception as e:
         logger.exception("Failed to call preprocessing_service")
         raise
@@ -0,0 +1,100 @@
+# services/ingestion_service/utils/file_handler.py
+import mimetypes
+import time
+from typing import List, Optional
+from sqlalchemy import insert
+from common.config.settings import settings
+from common.utils.logger import get_logger
+from ..models import FileMetadata
+from ..tasks import preprocess_job
+from ..celery_app import LOW_PRIORITY
+from ..admission import track_enqueued
+from .. import fair_scheduler
+
+logger = get_logger("ingestion_file_handler")
+
+ALLOWED_MIMES = {"image/jpeg", "image/png", "application/pdf", "image/jpg"}
+
+
+def resolve_content_type(filename: str, declared: Optional[str]) -> Optional[str]:
+    return declared or mimetypes.guess_type(filename)[0]
+
+
+def detect_file_type(filename: str) -> str:
+    """Coarse document type from the filename (refined later by the classifier)."""
+    mime_type, _ = mimetypes.guess_type(filename)
+    file_type = mime_type.split("/")[0] if mime_type else "unknown"
+
+    name_low = filename.lower()
+    if "aadhaar" in name_low or "aadhar" in name_low:
+        file_type = "aadhaar"
+    elif "pan" in name_low:
+        file_type = "pan"
+    elif "selfie" in name_low or "photo" in name_low:
+        file_type = "photo"
+    return file_type
+
+
+def metadata_row(batch_id: str, file_name: str, minio_path: str, size: int, content_type: str,
+                 uploader_id: Optional[str] = None, branch_id: Optional[str] = None) -> dict:
+    return {
+        "batch_id": batch_id,
+        "file_name": file_name,
+        "minio_path": minio_path,
+        "uploader_id": uploader_id,
+        "branch_id": branch_id,
+        "file_type": detect_file_type(file_name),
+        "size_bytes": size,
+        "status": "uploaded",
+        "additional_meta": {"content_type": content_type},
+    }
+
+
+def insert_metadata(db, rows: List[dict]) -> List[dict]:
+    """Single bulk INSERT ... RETURNING id; returns the API view of the saved records."""
+    stmt = insert(FileMetadata).returning(FileMetadata.id, sort_by_parameter_order=True)
+    ids = db.execute(stmt, rows).scalars().all()
+    return [
+        {
+            "id": record_id,
+            "file_name": row["file_name"],
+            "file_type": row["file_type"],
+            "status": row["status"],
+            "minio_path": row["minio_path"],
+        }
+        for record_id, row in zip(ids, rows)
+    ]
+
+
+def enqueue_preprocess(batch_id: str, minio_paths: List[str], pages: int, priority: Optional[int] = None,
+                       profile: Optional[str] = None, branch_id: Optional[str] = None,
+                       uploader_id: Optional[str] = None) -> dict:
+    """
+    Trigger enhancement for committed files and count them as in-flight.
+    The job goes through fair_scheduler, which shares preprocessing between branches
+    (or uploaders) and lets single-document uploads overtake bulk batches.
+    `profile` (a common.utils.profiling mode) profiles the job and its process_batch run.
+    """
+    kwargs = {"enqueued_at": time.time()}
+    if profile:
+        kwargs["profile"] = profile
+    label = "low" if priority == LOW_PRIORITY else "normal"
+    queue_class, celery_priority = fair_scheduler.classify(len(minio_paths), pages, priority)
+    tenant = fair_scheduler.tenant_of(branch_id, uploader_id)
+    if priority == LOW_PRIORITY:
+        tenant = fair_scheduler.LOW_PRIORITY_TENANT
+
+    job_id = None
+    if settings.FAIR_SCHEDULING_ENABLED:
+        try:
+            job_id = fair_scheduler.submit(batch_id, minio_paths, pages, kwargs, tenant, queue_class,
+                                           celery_priority)
+        except Exception as e:
+            # never lose an accepted batch because the scheduler's state is unavailable
+            logger.warning(f"Fair scheduling unavailable, sending batch {batch_id} straight to Celery: {e}")
+    if job_id is None:
+        job_id = preprocess_job.apply_async((batch_id, minio_paths), kwargs, priority=celery_priority).id
+    track_enqueued(batch_id, pages)
+    logger.info(f"Enqueued preprocess job {job_id} for batch {batch_id} "
+                f"({label} priority, {queue_class}, tenant {tenant})")
+    return {"job_id": job_id, "priority": label, "queue_class": queue_class}
@@ -0,0 +1,78 @@
+# services/preprocessing_service/checkpoint.py
+import hashlib
+import json
+from common.config.redis_client import get_redis
+from common.config.settings import settings
+from common.utils.logger import get_logger
+from .minio_client import stat_object
+
+logger = get_logger("preprocessing_checkpoint")
+
+# One hash per batch: "<object_path>#<page>" → page result, "<object_path>#pages" → page count
+KEY_PREFIX = "docintel:checkpoint:"
+
+
+def _key(batch_id: str) -> str:
+    return f"{KEY_PREFIX}{batch_id}"
+
+
+def load(batch_id: str) -> dict:
+    """All checkpoints recorded for a batch; empty if none or Redis is unavailable."""
+    try:
+        raw = get_redis().hgetall(_key(batch_id))
+    except Exception as e:
+        logger.warning(f"Checkpoints unavailable for batch {batch_id}: {e}")
+        return {}
+    return {field: json.loads(value) for field, value in raw.items()}
+
+
+def _save(batch_id: str, field: str, value):
+    try:
+        r = get_redis()
+        pipe = r.pipeline()
+        pipe.hset(_key(batch_id), field, json.dumps(value))
+        pipe.expire(_key(batch_id), settings.CHECKPOINT_TTL_S)
+        pipe.execute()
+    except Exception as e:
+        # losing a checkpoint only costs re-work on retry
+        logger.warning(f"Could not checkpoint {field} for batch {batch_id}: {e}")
+
+
+def save_page(batch_id: str, object_path: str, page: int, result: dict, data_bytes: bytes):
+    """Record a page whose enhanced object has been uploaded, with its size and MD5."""
+    _save(batch_id, f"{object_path}#{page}", {
+        "result": result,
+        "size": len(data_bytes),
+        "md5": hashlib.md5(data_bytes).hexdigest(),
+    })
+
+
+def save_page_count(batch_id: str, object_path: str, pages: int):
+    _save(batch_id, f"{object_path}#pages", pages)
+
+
+def page_count(checkpoints: dict, object_path: str):
+    return checkpoints.get(f"{object_path}#pages")
+
+
+def verified_page(checkpoints: dict, object_path: str, page: int):
+    """
+    The checkpointed result for a page if it was produced by the current PIPELINE_VERSION
+    and its enhanced object still exists with the recorded size (and MD5 where the ETag
+    is one), else None.
+    """
+    entry = checkpoints.get(f"{object_path}#{page}")
+    if not entry or entry["result"].get("pipeline_version") != settings.PIPELINE_VERSION:
+        return None
+    try:
+        stat = stat_object(entry["result"]["enhanced"])
+    except Exception as e:
+        logger.warning(f"Could not verify checkpoint for {object_path} page {page}: {e}")
+        return None
+    if stat is None or stat.size != entry["size"]:
+        return None
+    # single-part uploads carry the MD5 as ETag; multipart ETags contain a "-"
+    etag = (stat.etag or "").strip('"')
+    if etag and "-" not in etag and etag != entry["md5"]:
+        return None
+    return entry["result"]
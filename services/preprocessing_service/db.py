@@ -0,0 +1,54 @@
+# services/preprocessing_service/db.py
+"""
+The preprocessing service's own database access. It only reads and writes page_hash,
+the near-duplicate index (dedup.py). The table's schema belongs to the ingestion
+service's migrations (alembic revision c4e8f1a2b7d3). It is mirrored here as a Core
+table with the columns preprocessing uses, so this service does not import ingestion's
+models or session. The engine is created on first use, like the service's other heavy
+dependencies.
+"""
+import threading
+from sqlalchemy import (
+    BigInteger, Column, Float, Integer, MetaData, String, Table, create_engine,
+)
+from sqlalchemy.orm import sessionmaker
+from common.config.settings import settings
+
+metadata = MetaData()
+
+page_hash = Table(
+    "page_hash", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("batch_id", String),
+    Column("minio_path", String),  # original object
+    Column("page", Integer),
+    Column("enhanced_path", String),
+    Column("phash", BigInteger),  # stored signed; see processor/phash.py
+    Column("dhash", BigInteger),
+    Column("h0", Integer),
+    Column("h1", Integer),
+    Column("h2", Integer),
+    Column("h3", Integer),
+    Column("doc_type", String),
+    Column("confidence", Float),
+)
+
+_session_factory = None
+_lock = threading.Lock()
+
+
+def configure(engine):
+    """Use engine instead of SQLALCHEMY_DATABASE_URI, e.g. the in-process load test's SQLite."""
+    global _session_factory
+    with _lock:
+        _session_factory = sessionmaker(bind=engine, autoflush=False, future=True)
+
+
+def get_session():
+    """A new Session on the shared engine."""
+    global _session_factory
+    with _lock:
+        if _session_factory is None:
+            engine = create_engine(settings.SQLALCHEMY_DATABASE_URI, pool_pre_ping=True, future=True)
+            _session_factory = sessionmaker(bind=engine, autoflush=False, future=True)
+    return _session_factory()
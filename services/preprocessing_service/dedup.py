@@ -0,0 +1,106 @@
+# services/preprocessing_service/dedup.py
+from sqlalchemy import insert, select, union
+from sqlalchemy.exc import IntegrityError
+from common.config.settings import settings
+from common.utils.logger import get_logger
+from .db import get_session, page_hash
+from .processor.phash import chunks, hamming, to_signed, to_unsigned, CHUNKS
+
+logger = get_logger("preprocessing_dedup")
+
+# Near-duplicate lookup over the page_hash table. Any hash within Hamming distance
+# r < CHUNKS of the query shares at least one 16-bit chunk with it exactly, so the
+# four equality lookups (h0..h3) return every candidate; the exact distance is then
+# checked here. dHash is a second opinion that weeds out pHash collisions.
+#
+# The lookups are a UNION of one SELECT per chunk, so each is served by its own index.
+# Candidates are never truncated: document pHashes are skewed (forms, letterheads), and
+# cutting the list off at some row count would silently drop real duplicates. Instead
+# only the columns the distance check needs are read, streamed FETCH_ROWS at a time, so
+# a heavily shared chunk costs scan time but not memory; the best match's full row is
+# read afterwards.
+
+CHUNK_COLUMNS = (page_hash.c.h0, page_hash.c.h1, page_hash.c.h2, page_hash.c.h3)
+CANDIDATE_COLUMNS = (page_hash.c.id, page_hash.c.minio_path, page_hash.c.page, page_hash.c.phash,
+                     page_hash.c.dhash)
+FETCH_ROWS = 500
+
+if settings.DEDUP_MAX_DISTANCE >= CHUNKS:
+    logger.warning("DEDUP_MAX_DISTANCE=%d ≥ %d: the chunk index may miss some matches",
+                   settings.DEDUP_MAX_DISTANCE, CHUNKS)
+
+
+def candidates_query(query_phash: int):
+    """Rows sharing at least one pHash chunk with the query, one indexed SELECT per chunk."""
+    return union(*(select(*CANDIDATE_COLUMNS).where(column == chunk)
+                   for column, chunk in zip(CHUNK_COLUMNS, chunks(query_phash))))
+
+
+def find_near_duplicate(hashes: dict, object_path: str, page: int):
+    """
+    The closest earlier page within DEDUP_MAX_DISTANCE, as a dict with its batch, paths,
+    classification and distance; None if there is none or the index is unavailable.
+    """
+    if not hashes:
+        return None
+    query_phash, query_dhash = hashes["phash"], hashes["dhash"]
+
+    best, best_distance, examined = None, None, 0
+    try:
+        with get_session() as db:
+            rows = db.execute(candidates_query(query_phash).execution_options(yield_per=FETCH_ROWS))
+            for row in rows:
+                examined += 1
+                # a retry of the same page is not a duplicate of itself
+                if row.minio_path == object_path and row.page == page:
+                    continue
+                distance = hamming(to_unsigned(row.phash), query_phash)
+                if distance > settings.DEDUP_MAX_DISTANCE:
+                    continue
+                if hamming(to_unsigned(row.dhash), query_dhash) > settings.DEDUP_DHASH_MAX_DISTANCE:
+                    continue
+                if best is None or distance < best_distance:
+                    best, best_distance = row.id, distance
+            if best is not None:
+                best = db.execute(select(page_hash).where(page_hash.c.id == best)).one_or_none()
+    except Exception as e:
+        logger.warning("Near-duplicate lookup failed for %s page %d: %s", object_path, page, e)
+        return None
+
+    if examined > settings.DEDUP_MAX_CANDIDATES:
+        logger.warning("Near-duplicate lookup for %s page %d examined %d index rows (> %d): "
+                       "a pHash chunk is heavily shared", object_path, page, examined,
+                       settings.DEDUP_MAX_CANDIDATES)
+    if best is None:
+        return None
+    return {
+        "batch_id": best.batch_id,
+        "original": best.minio_path,
+        "page": best.page,
+        "enhanced": best.enhanced_path,
+        "type": best.doc_type,
+        "confidence": best.confidence,
+        "distance": best_distance,
+    }
+
+
+def record_page(batch_id: str, object_path: str, page: int, hashes: dict, result: dict):
+    """Add a processed page to the index; re-recording the same page is a no-op."""
+    if not hashes:
+        return
+    c0, c1, c2, c3 = chunks(hashes["phash"])
+    stmt = insert(page_hash).values(
+        batch_id=batch_id, minio_path=object_path, page=page, enhanced_path=result.get("enhanced"),
+        phash=to_signed(hashes["phash"]), dhash=to_signed(hashes["dhash"]),
+        h0=c0, h1=c1, h2=c2, h3=c3,
+        doc_type=result.get("type"), confidence=result.get("confidence"),
+    )
+    try:
+        with get_session() as db:
+            db.execute(stmt)
+            db.commit()
+    except IntegrityError:
+        pass  # already indexed by an earlier attempt
+    except Exception as e:
+        # a missing index entry only costs a missed duplicate later
+        logger.warning("Could not index %s page %d: %s", object_path, page, e)
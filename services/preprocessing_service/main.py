@@ -1,19 +1,40 @@
-from fastapi import FastAPI, HTTPException
+import time
+_import_t0 = time.perf_counter()
+
+from contextlib import ExitStack, asynccontextmanager, closing
+from fastapi import FastAPI, HTTPException, Header
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
-from typing import List
-from common.utils.logger import get_logger
-from .minio_client import download_object, upload_bytes
-from .processor.converter import pdf_to_images
-from .processor.enhancer import enhance_image
-from .processor.classifier import classify_document
+from typing import List, Optional
+from common.config.settings import settings
+from common.utils.logger import get_logger, log_context
+from common.utils import profiling
+from .minio_client import upload_bytes, local_object
+from .processor.converter import pdf_page_count
+from .processor.pdf_analyzer import DIGITAL, iter_pdf_pages
+from .processor.enhancer import enhance_image_with_report
+from .processor.classifier import classify_document, classify_text
+from . import startup, checkpoint, dedup, scheduler, outbox, pipeline
+from .object_cache import get_cache
 import requests
 import socket
-import tempfile
 import os
 import io
 
 logger = get_logger("preprocessing_service")
-app = FastAPI(title="Preprocessing Service")
+# per-page messages are sampled; warnings and errors always pass
+page_logger = get_logger("preprocessing_service.pages", sample_rate=settings.LOG_PAGE_SAMPLE_RATE)
+startup.record("imports_s", "preprocessing_service.main", time.perf_counter() - _import_t0)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Heavy modules and models load in the background; /ready flips once they are usable
+    startup.start_warmup()
+    yield
+
+
+app = FastAPI(title="Preprocessing Service", lifespan=lifespan)
 
 
 class ProcessItem(BaseModel):
@@ -23,6 +44,9 @@ class ProcessItem(BaseModel):
 class ProcessBatchRequest(BaseModel):
     batch_id: str
     items: List[ProcessItem]
+    # per-hop epoch timestamps collected so far ("enqueued", "dispatched"); extended here
+    # with "started" / "finished" and returned to ingestion in the callback
+    timings: Optional[dict] = None
 
 
 @app.get("/health")
@@ -30,83 +54,334 @@ def health():
     return {"status": "ok"}
 
 
+@app.get("/cache_stats")
+def cache_stats():
+    """Object cache hit rate and occupancy for this worker process."""
+    cache = get_cache()
+    if cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **cache.get_stats()}
+
+
+@app.get("/memory")
+def memory():
+    """Page memory budget usage and current RSS of this worker process."""
+    return {**scheduler.get_budget().snapshot(), "rss_bytes": scheduler.current_rss()}
+
+
+@app.get("/ready")
+def ready():
+    """Readiness: 200 once models are loaded, 503 while warming up or if warmup failed."""
+    report = startup.get_report()
+    if not startup.is_ready():
+        return JSONResponse(status_code=503, content={"status": report["state"], "startup": report})
+    return {"status": "ready", "startup": report}
+
+
+def process_page(batch_id: str, object_path: str, page: int, img_path: str, is_pdf: bool,
+                 usage: dict = None, uploads: pipeline.PageUploads = None, content: dict = None,
+                 reservation: scheduler.Reservation = None) -> dict:
+    """
+    Enhance and classify one page, then upload, checkpoint and publish it: in the
+    background when `uploads` is given (the caller waits on it), else before returning.
+    `content` is what pdf_analyzer found on a PDF page (kind, image source, text layer).
+    `reservation` is the page's share of the process memory budget, taken before it was
+    rendered; without one the page reserves from its image header here. It shrinks to
+    the enhanced bytes once they exist and is released when their upload is done.
+    """
+    if reservation is None:
+        width, height, channels = scheduler.image_dimensions(img_path)
+        reservation = scheduler.get_budget().hold(scheduler.estimate_page_bytes(width, height, channels), usage)
+    try:
+        result, enhanced_bytes, content_type, hashes = _process_page(batch_id, object_path, page, img_path,
+                                                                     is_pdf, content)
+        text = (content or {}).get("text")
+        reservation.shrink(len(enhanced_bytes) + len(text or ""))
+        if uploads is None:
+            _finish_page(batch_id, object_path, page, result, enhanced_bytes, content_type, hashes, text)
+        else:
+            uploads.submit(_finish_reserved, reservation, batch_id, object_path, page, result, enhanced_bytes,
+                           content_type, hashes, text)
+            reservation = None  # the upload releases it
+    finally:
+        if reservation is not None:
+            reservation.release()
+    return result
+
+
+def _finish_reserved(reservation: scheduler.Reservation, *args):
+    try:
+        _finish_page(*args)
+    finally:
+        reservation.release()
+
+
+def _process_page(batch_id: str, object_path: str, page: int, img_path: str, is_pdf: bool,
+                  content: dict = None) -> tuple:
+    """The CPU part of a page: (result, enhanced bytes, their content type, image hashes)."""
+    # 🧩 Extract original filename from the MinIO path, not temp file
+    original_file_name = os.path.basename(object_path)
+    base_name, original_ext = os.path.splitext(original_file_name)
+
+    # --- Enhance image (quality gate picks the stages) ---
+    # photographed documents are cropped out of their background; rendered PDF pages
+    # already are the page, and cropping them could cut a page down to one table
+    # digital PDF pages are clean renders of vector text: nothing for the quality gate to fix
+    digital = content is not None and content["kind"] == DIGITAL
+    enhanced_bytes, report = enhance_image_with_report(img_path, stages=[] if digital else None,
+                                                       crop=None if not is_pdf else False)
+
+    # PDF pages are rendered as PNG and need a per-page name
+    if is_pdf:
+        enhanced_name = f"{base_name}_page{page:03d}_enhanced.png"
+    else:
+        enhanced_name = f"{base_name}_enhanced{original_ext}"
+
+    # ✅ Store inside correct folder structure
+    bucket = "documents"
+    enhanced_object_path = f"enhanced/{batch_id}/{enhanced_name}"
+    content_type = "image/jpeg" if original_ext.lower() in [".jpg", ".jpeg"] else "image/png"
+
+    # --- Classify: near-duplicate of a page seen before, else the text layer, else the image ---
+    text = (content or {}).get("text")
+    duplicate = dedup.find_near_duplicate(report["hashes"], object_path, page)
+    by_text = classify_text(text) if text and not (duplicate and duplicate["type"]) else None
+    if duplicate and duplicate["type"]:
+        doc_type, confidence = duplicate["type"], duplicate["confidence"]
+        logger.info("%s page %d is a near-duplicate of %s page %d (batch %s, distance %d)",
+                    object_path, page, duplicate["original"], duplicate["page"],
+                    duplicate["batch_id"], duplicate["distance"])
+    elif by_text:
+        doc_type, confidence = by_text
+    else:
+        doc_type, confidence = classify_document(img_path, crop_quad=(report["crop"] or {}).get("quad"))
+
+    result = {
+        "original": object_path,
+        "enhanced": f"{bucket}/{enhanced_object_path}",  # ✅ include full enhanced path
+        "page": page,
+        "type": doc_type,
+        "confidence": confidence,
+        "quality": report["metrics"],
+        "stages": report["stages"],
+        "crop": report["crop"],
+        "near_duplicate": duplicate,
+        "pipeline_version": settings.PIPELINE_VERSION,
+    }
+    if content is not None:
+        result["content"] = {"kind": content["kind"], "source": content["source"], "text_chars": len(text)}
+        # the text layer is stored next to the enhanced page, for OCR to pick up
+        result["text"] = f"{bucket}/enhanced/{batch_id}/{base_name}_page{page:03d}.txt" if text else None
+    return result, enhanced_bytes, content_type, report["hashes"]
+
+
+def _finish_page(batch_id: str, object_path: str, page: int, result: dict, enhanced_bytes: bytes,
+                 content_type: str, hashes: dict, text: str = None):
+    """The I/O part of a page: upload, then record it (dedup index, checkpoint, status event)."""
+    bucket, object_name = result["enhanced"].split("/", 1)
+    uploaded_path = upload_bytes(
+        bucket=bucket,
+        object_name=object_name,
+        data_bytes=enhanced_bytes,
+        content_type=content_type,
+    )
+    page_logger.info("✅ Uploaded enhanced image to: %s (stages: %s)", uploaded_path, result["stages"])
+    if result.get("text"):
+        text_bucket, text_object = result["text"].split("/", 1)
+        upload_bytes(bucket=text_bucket, object_name=text_object, data_bytes=text.encode("utf-8"),
+                     content_type="text/plain; charset=utf-8")
+
+    dedup.record_page(batch_id, object_path, page, hashes, result)
+    checkpoint.save_page(batch_id, object_path, page, result, enhanced_bytes)
+    outbox.publish_page(batch_id, result)
+
+
+def _remove_temp(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        # the reaper sweeps anything left behind
+        logger.warning("Could not remove temp file %s: %s", path, e)
+
+
+def _resumed(checkpoints: dict, object_path: str, is_pdf: bool):
+    """Every page's result if an earlier attempt processed them all and they still verify."""
+    known_pages = checkpoint.page_count(checkpoints, object_path) or (None if is_pdf else 1)
+    if known_pages:
+        done = [checkpoint.verified_page(checkpoints, object_path, p) for p in range(1, known_pages + 1)]
+        if all(done):
+            logger.info("Resuming %s: all %d page(s) already processed", object_path, known_pages)
+            return done
+    return None
+
+
+def open_input(object_path: str, checkpoints: dict) -> dict:
+    """
+    The fetch stage of one file, run ahead of the file before it: {"done": results} if
+    checkpoints cover every page, else {"path", "close"} with the input on local disk
+    (object cache, or a temp file) until close() is called.
+    """
+    done = _resumed(checkpoints, object_path, object_path.lower().endswith(".pdf"))
+    if done:
+        return {"done": done}
+    stack = ExitStack()
+    try:
+        path = stack.enter_context(local_object(object_path, suffix=os.path.splitext(object_path)[-1]))
+    except BaseException:
+        stack.close()
+        raise
+    return {"path": path, "close": stack.close}
+
+
+def _close_input(opened: dict):
+    if "close" in opened:
+        opened["close"]()
+
+
+def process_file(batch_id: str, object_path: str, checkpoints: dict, usage: dict = None,
+                 stalls: pipeline.Stalls = None, opened: dict = None) -> list:
+    """
+    Process every page of one input file. Pages checkpointed by an earlier attempt whose
+    enhanced objects still verify are reused instead of being rendered and enhanced again.
+    `opened` is this file's open_input() result when it was prefetched.
+    """
+    opened = opened or open_input(object_path, checkpoints)
+    if "done" in opened:
+        return opened["done"]
+    try:
+        return _process_downloaded(batch_id, object_path, checkpoints, opened["path"],
+                                   object_path.lower().endswith(".pdf"), usage, stalls)
+    finally:
+        _close_input(opened)
+
+
+def _pending_images(input_path: str, pending: list, is_pdf: bool, stalls: pipeline.Stalls = None,
+                    usage: dict = None):
+    """
+    (page, image path, PDF page content, memory reservation) of each pending page. PDF
+    pages are extracted or rendered (see pdf_analyzer) ahead in the background, each
+    after reserving memory for the image it becomes; images reserve in process_page.
+    """
+    if not is_pdf:
+        if pending:
+            yield 1, input_path, None, None
+        return
+
+    budget = scheduler.get_budget()
+
+    def reserve(dimensions):
+        return budget.hold(scheduler.estimate_page_bytes(*dimensions), usage)
+
+    def discard(item):
+        _remove_temp(item[1])
+        item[3].release()
+
+    rendered = pipeline.read_ahead(iter_pdf_pages(input_path, pages=[p - 1 for p in pending], reserve=reserve),
+                                   settings.PIPELINE_RENDER_AHEAD, discard=discard, stalls=stalls)
+    with closing(rendered):
+        for index, img_path, content, reservation in rendered:
+            yield index + 1, img_path, content, reservation
+
+
+def _process_downloaded(batch_id: str, object_path: str, checkpoints: dict, input_path: str, is_pdf: bool,
+                        usage: dict = None, stalls: pipeline.Stalls = None) -> list:
+    """process_file once the input is on local disk at `input_path`."""
+    # --- Step 2: Work out which pages still need processing ---
+    total_pages = pdf_page_count(input_path) if is_pdf else 1
+    checkpoint.save_page_count(batch_id, object_path, total_pages)
+
+    page_results = {}
+    for page in range(1, total_pages + 1):
+        reused = checkpoint.verified_page(checkpoints, object_path, page)
+        if reused:
+            page_results[page] = reused
+    pending = [p for p in range(1, total_pages + 1) if p not in page_results]
+    if page_results:
+        logger.info("Resuming %s: %d page(s) reused, %d to go", object_path, len(page_results), len(pending))
+
+    # --- Step 3: Extract or render (PDF) → enhance & classify → upload, overlapped page by page ---
+    uploads = pipeline.PageUploads(stalls)
+    try:
+        with closing(_pending_images(input_path, pending, is_pdf, stalls, usage)) as images:
+            for page, img_path, content, reservation in images:
+                try:
+                    with log_context(page=page):
+                        page_results[page] = process_page(batch_id, object_path, page, img_path, is_pdf, usage,
+                                                          uploads, content, reservation)
+                finally:
+                    # rendered pages are ours to clean up; the input file belongs to local_object
+                    if is_pdf:
+                        _remove_temp(img_path)
+    except BaseException:
+        # pages already handed off still finish (and are checkpointed for the retry)
+        # before the file's failure is reported
+        uploads.settle()
+        raise
+    uploads.wait()
+
+    return [page_results[p] for p in sorted(page_results)]
+
+
 @app.post("/process_batch")
-def process_batch(req: ProcessBatchRequest):
+def process_batch(req: ProcessBatchRequest, x_profile: Optional[str] = Header(None)):
     batch_id = req.batch_id
     items = req.items
     if not items:
         raise HTTPException(status_code=400, detail="items empty")
+    if not startup.is_ready():
+        raise HTTPException(status_code=503, detail="Preprocessing service is warming up")
+
+    timings = dict(req.timings or {}, started=time.time())
+    with log_context(batch_id=batch_id):
+        with profiling.profiled(profiling.requested_mode(x_profile), batch_id, "process_batch") as profile:
+            response = _process_batch(batch_id, items, timings)
+    if profile:
+        response["profile"] = profile.path
+    return response
+
 
+def _process_batch(batch_id: str, items: list, timings: dict) -> dict:
     results = []
+    checkpoints = checkpoint.load(batch_id)
 
-    for item in items:
-        object_path = item.object_path
-        try:
-            logger.info(f"Processing file: {object_path}")
-
-            # --- Step 1: Download file from MinIO ---
-            data = download_object(object_path)
-            tmp_input = tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(object_path)[-1])
-            tmp_input.write(data)
-            tmp_input.flush()
-
-            # --- Step 2: Convert to images if PDF ---
-            if object_path.lower().endswith(".pdf"):
-                image_paths = pdf_to_images(tmp_input.name)
-            else:
-                image_paths = [tmp_input.name]
-
-            # --- Step 3: Process each image ---
-                processed_files = []
-                for img_path in image_paths:
-                    # 🧩 Extract original filename from the MinIO path, not temp file
-                    original_file_name = os.path.basename(object_path)
-                    base_name, original_ext = os.path.splitext(original_file_name)
-
-                    # --- Enhance image ---
-                    enhanced_bytes = enhance_image(img_path)
-
-                    # ✅ Use same base name for enhanced version (fix)
-                    enhanced_name = f"{base_name}_enhanced{original_ext}"
-
-                    # ✅ Store inside correct folder structure
-                    bucket = "documents"
-                    enhanced_object_path = f"enhanced/{batch_id}/{enhanced_name}"
-
-                    # --- Upload enhanced image ---
-                    uploaded_path = upload_bytes(
-                        bucket=bucket,
-                        object_name=enhanced_object_path,
-                        data_bytes=enhanced_bytes,
-                        content_type="image/jpeg" if original_ext.lower() in [".jpg", ".jpeg"] else "image/png"
-                    )
-
-                    logger.info(f"✅ Uploaded enhanced image to: {uploaded_path}")
-
-                    # --- Step 4: Classify enhanced image ---
-                    doc_type, confidence = classify_document(img_path)
-
-                    processed_files.append({
-                        "input": object_path,
-                        "enhanced_path": f"{bucket}/{enhanced_object_path}",  # ✅ include full enhanced path
-                        "type": doc_type,
-                        "confidence": confidence
-                    })
-
-            results.extend(processed_files)
+    # estimated vs. measured memory for this job, reported to ingestion with the results
+    usage = {}
+    # the next file is fetched while this one is enhanced (see pipeline.py)
+    stalls = pipeline.Stalls()
+    inputs = pipeline.prefetch([item.object_path for item in items], lambda path: open_input(path, checkpoints),
+                               settings.PIPELINE_PREFETCH_FILES, discard=_close_input, stalls=stalls)
+    with scheduler.track_peak_rss(usage), closing(inputs):
+        for object_path, opened, error in inputs:
+            try:
+                if error is not None:
+                    raise error
+                logger.info("Processing file: %s", object_path)
+                results.extend(process_file(batch_id, object_path, checkpoints, usage, stalls, opened))
+            except Exception as e:
+                logger.exception("Failed processing %s: %s", object_path, e)
+                results.append({"original": object_path, "error": str(e)})
+    logger.info("Batch memory: peak RSS %d MiB (started at %d MiB), largest page estimate %d MiB, "
+                "waited %.2fs for budget", usage["peak_rss_bytes"] >> 20, usage["rss_start_bytes"] >> 20,
+                usage.get("estimated_peak_page_bytes", 0) >> 20, usage.get("budget_wait_s", 0.0))
+    logger.info("Batch I/O stalls: %s", stalls.snapshot())
 
+    # --- Report to ingestion: status stream, HTTP callback only if Redis is unavailable ---
+    timings["finished"] = time.time()
+    if not outbox.publish_batch(batch_id, results, timings, usage):
+        try:
+            local_ip = socket.gethostbyname(socket.gethostname())
+            callback_url = f"http://{local_ip}:8000/preprocess_callback"
+            payload = {"batch_id": batch_id, "results": results, "timings": timings, "memory": usage}
+            r = requests.post(callback_url, json=payload, timeout=100)
+            r.raise_for_status()
+            logger.info("Callback response from ingestion: %s", r.status_code)
         except Exception as e:
-            logger.exception(f"Failed processing {object_path}: {e}")
-            results.append({"original": object_path, "error": str(e)})
+            # neither path worked: fail the job so Celery retries it; the pages are
+            # checkpointed, so the retry only re-reports them
+            logger.error("Could not report batch %s to ingestion: %s", batch_id, e)
+            raise HTTPException(status_code=503, detail=f"Could not report results: {e}")
 
-    # --- Step 5: Send callback to ingestion service ---
-    try:
-        local_ip = socket.gethostbyname(socket.gethostname())
-        callback_url = f"http://{local_ip}:8000/preprocess_callback"
-        payload = {"batch_id": batch_id, "results": results}
-        r = requests.post(callback_url, json=payload, timeout=100)
-        logger.info(f"Callback response from ingestion: {r.status_code}")
-    except Exception as e:
-        logger.warning(f"Callback failed: {e}")
-
-    return {"batch_id": batch_id, "processed": len(results), "details": results}
+    return {"batch_id": batch_id, "processed": len(results), "pipeline_version": settings.PIPELINE_VERSION,
+            "memory": usage, "pipeline": stalls.snapshot(), "details": results}
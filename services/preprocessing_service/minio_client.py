@@ -1,6 +1,11 @@
+import tempfile
+from contextlib import contextmanager
 from minio import Minio
+from minio.error import S3Error
 from io import BytesIO
 from common.config.settings import settings
+from .object_cache import get_cache
+from .processor.converter import TEMP_PREFIX
 
 def get_minio_client():
     return Minio(
@@ -10,16 +15,46 @@ def get_minio_client():
         secure=False
     )
 
-def download_object(bucket_object_path: str) -> bytes:
+def fetch_object_to(bucket_object_path: str, f) -> str:
+    """Stream an object from MinIO into the open binary file f, bypassing the object cache; returns its ETag."""
     if "/" not in bucket_object_path:
         raise ValueError("Invalid object path")
     bucket, object_name = bucket_object_path.split("/", 1)
     client = get_minio_client()
     resp = client.get_object(bucket, object_name)
-    data = resp.read()
-    resp.close()
-    resp.release_conn()
-    return data
+    try:
+        for chunk in resp.stream(1024 * 1024):
+            f.write(chunk)
+        return (resp.headers.get("ETag") or "").strip('"')
+    finally:
+        resp.close()
+        resp.release_conn()
+
+
+def download_object(bucket_object_path: str) -> bytes:
+    cache = get_cache()
+    if cache is None:
+        buf = BytesIO()
+        fetch_object_to(bucket_object_path, buf)
+        return buf.getvalue()
+    return cache.get(bucket_object_path)
+
+
+@contextmanager
+def local_object(bucket_object_path: str, suffix: str = ""):
+    """
+    Local file path holding the object for the duration of the block: the cached copy
+    when the object cache is on, else a temp file that is removed afterwards.
+    """
+    cache = get_cache()
+    if cache is not None:
+        with cache.local_path(bucket_object_path) as path:
+            yield path
+        return
+    with tempfile.NamedTemporaryFile(prefix=TEMP_PREFIX, suffix=suffix) as tmp:
+        fetch_object_to(bucket_object_path, tmp)
+        tmp.flush()
+        yield tmp.name
 
 def upload_bytes(bucket: str, object_name: str, data_bytes: bytes, content_type: str = "application/octet-stream"):
     client = get_minio_client()
@@ -33,3 +68,14 @@ def upload_bytes(bucket: str, object_name: str, data_bytes: bytes, content_type:
         content_type=content_type
     )
     return f"{bucket}/{object_name}"
+
+def stat_object(bucket_object_path: str):
+    """Object metadata (size, etag) or None if it does not exist."""
+    bucket, object_name = bucket_object_path.split("/", 1)
+    client = get_minio_client()
+    try:
+        return client.stat_object(bucket, object_name)
+    except S3Error as e:
+        if e.code in ("NoSuchKey", "NoSuchObject"):
+            return None
+        raise
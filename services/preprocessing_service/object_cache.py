@@ -0,0 +1,351 @@
+# services/preprocessing_service/object_cache.py
+"""
+Node-local read-through cache for MinIO objects: a memory LRU for small objects in
+front of a disk LRU under OBJECT_CACHE_DIR, both keyed by object path and ETag.
+
+- Reads within OBJECT_CACHE_REVALIDATE_S of the last check are served without touching
+  MinIO; older entries are revalidated with a stat (HEAD) and refetched only if the ETag
+  changed. Inputs are written once under unique names, so revalidation rarely finds a
+  change. Only inputs are cached: enhanced pages are written, never read back.
+- A miss streams the object from MinIO straight into its cache file, so a large input is
+  never held in memory whole. local_path() hands out the cached file itself, so callers
+  that need a path (PyMuPDF, OpenCV) don't write a temp copy; mapped() reads files of at
+  least OBJECT_CACHE_MMAP_MIN_BYTES through a read-only mmap instead of into memory.
+- Files handed out by local_path() are pinned and never evicted while in use. Concurrent
+  misses on one object fetch it once.
+
+The index lives in memory, so each process caches into its own pid<N> subdirectory with
+its own share of the disk budget; directories of processes that are gone are removed
+when the next cache starts.
+"""
+import hashlib
+import mmap
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from common.config.settings import settings
+from common.utils.logger import get_logger
+
+logger = get_logger("preprocessing_object_cache")
+
+
+class _DiskEntry:
+    __slots__ = ("etag", "size", "file", "checked_at", "pins", "transient")
+
+    def __init__(self, etag, size, file, checked_at, transient=False):
+        self.etag = etag
+        self.size = size
+        self.file = file
+        self.checked_at = checked_at
+        self.pins = 0
+        # larger than the disk budget: not indexed, removed once its one reader is done
+        self.transient = transient
+
+
+@contextmanager
+def mapped(file: str, mmap_min_bytes: int = None):
+    """Read-only buffer over a local file: an mmap for large files, else its bytes."""
+    mmap_min_bytes = settings.OBJECT_CACHE_MMAP_MIN_BYTES if mmap_min_bytes is None else mmap_min_bytes
+    with open(file, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0 or size < mmap_min_bytes:
+            yield f.read()
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+            yield view
+
+
+class ObjectCache:
+    def __init__(self, fetch, stat, directory: str, memory_bytes: int, disk_bytes: int,
+                 memory_max_item: int, revalidate_s: float):
+        """
+        fetch(path, file) streams the object into the open binary file and returns its
+        ETag; stat(path) -> object with .etag, or None if gone.
+        """
+        self._fetch = fetch
+        self._stat = stat
+        self.directory = directory
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.memory_max_item = memory_max_item
+        self.revalidate_s = revalidate_s
+
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()  # path → (etag, bytes)
+        self._memory_used = 0
+        self._disk = OrderedDict()  # path → _DiskEntry
+        self._disk_used = 0
+        self._fetch_locks = {}  # path → Lock, so concurrent misses fetch once
+        self.stats = {
+            "memory_hits": 0, "disk_hits": 0, "misses": 0, "revalidations": 0, "stale": 0,
+            "evictions": 0, "network_bytes": 0, "served_bytes": 0,
+        }
+        os.makedirs(directory, exist_ok=True)
+        self._clear_leftovers()
+
+    # ---------------- public API ----------------
+
+    def get(self, path: str) -> bytes:
+        """Object contents, from memory or disk when fresh, else from MinIO."""
+        with self._lookup(path) as (data, entry):
+            if data is not None:
+                return data
+            with open(entry.file, "rb") as f:
+                return f.read()
+
+    @contextmanager
+    def local_path(self, path: str):
+        """Path of the cached file on local disk, pinned against eviction for the block."""
+        with self._lookup(path, need_file=True) as (_, entry):
+            yield entry.file
+
+    def invalidate(self, path: str):
+        with self._lock:
+            self._drop_memory(path)
+            entry = self._disk.get(path)
+            if entry is not None and not entry.pins:
+                self._drop_disk(path)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.stats)
+            stats.update({
+                "memory_items": len(self._memory), "memory_bytes": self._memory_used,
+                "disk_items": len(self._disk), "disk_bytes": self._disk_used,
+            })
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["memory_hits"] + stats["disk_hits"]) / lookups, 4) if lookups else None
+        return stats
+
+    # ---------------- internals ----------------
+
+    def _file_for(self, path: str, etag: str) -> str:
+        digest = hashlib.sha256(path.encode()).hexdigest()
+        return os.path.join(self.directory, f"{digest}_{(etag or 'none').strip(chr(34))}")
+
+    def _clear_leftovers(self):
+        # the index is in memory, so files from a previous run can't be trusted to be
+        # current — start clean, and drop the directories of processes that are gone
+        for name in os.listdir(self.directory):
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+        parent = os.path.dirname(self.directory)
+        for name in os.listdir(parent):
+            if name.startswith("pid") and name[3:].isdigit() and not _alive(int(name[3:])):
+                shutil.rmtree(os.path.join(parent, name), ignore_errors=True)
+
+    @contextmanager
+    def _lookup(self, path: str, need_file: bool = False):
+        """Yield (bytes, None) for a memory hit or (None, pinned disk entry) otherwise."""
+        for _ in range(2):
+            entry = self._fresh_entry(path, need_file)
+            if entry is None:
+                entry = self._fill(path, need_file)
+            if isinstance(entry, tuple):  # memory hit
+                self._count_served(len(entry[1]))
+                yield entry[1], None
+                return
+            if not os.path.exists(entry.file):
+                # removed behind our back (tmp cleaners, manual cleanup) — refetch
+                with self._lock:
+                    entry.pins -= 1
+                    if self._disk.get(path) is entry:
+                        self._drop_disk(path)
+                continue
+            try:
+                self._count_served(entry.size)
+                yield None, entry
+            finally:
+                with self._lock:
+                    entry.pins -= 1
+                if entry.transient:
+                    self._unlink(entry.file)
+            return
+        raise RuntimeError(f"Could not cache {path}")
+
+    def _count_served(self, size: int):
+        with self._lock:
+            self.stats["served_bytes"] += size
+
+    def _fresh_entry(self, path: str, need_file: bool):
+        """Memory (etag, bytes) tuple or pinned _DiskEntry if cached and not stale, else None."""
+        with self._lock:
+            hit = self._memory.get(path) if not need_file else None
+            disk = self._disk.get(path)
+            checked_at = disk.checked_at if disk else None
+            etag = disk.etag if disk else (hit[0] if hit else None)
+        if hit is None and disk is None:
+            return None
+
+        # entries are revalidated against MinIO's ETag once they are older than the window
+        if checked_at is None or time.time() - checked_at > self.revalidate_s:
+            with self._lock:
+                self.stats["revalidations"] += 1
+            try:
+                stat = self._stat(path)
+            except Exception as e:
+                # MinIO unreachable: the cached copy is the best answer there is
+                logger.warning("Could not revalidate %s, serving cached copy: %s", path, e)
+            else:
+                if stat is None or (stat.etag or "").strip('"') != (etag or "").strip('"'):
+                    with self._lock:
+                        self.stats["stale"] += 1
+                    self.invalidate(path)
+                    return None
+                with self._lock:
+                    if disk is not None:
+                        disk.checked_at = time.time()
+
+        with self._lock:
+            if hit is not None and path in self._memory:
+                self._memory.move_to_end(path)
+                self.stats["memory_hits"] += 1
+                return self._memory[path]
+            if disk is not None and self._disk.get(path) is disk:
+                self._disk.move_to_end(path)
+                disk.pins += 1
+                self.stats["disk_hits"] += 1
+                return disk
+        return None
+
+    def _fill(self, path: str, need_file: bool):
+        with self._lock:
+            fetch_lock = self._fetch_locks.setdefault(path, threading.Lock())
+        try:
+            with fetch_lock:
+                # another thread may have fetched it while we waited
+                entry = self._fresh_entry(path, need_file)
+                if entry is not None:
+                    return entry
+                tmp = os.path.join(self.directory, f".fetch-{threading.get_ident()}-{time.monotonic_ns()}")
+                try:
+                    with open(tmp, "wb") as f:
+                        etag = self._fetch(path, f)
+                        size = f.tell()
+                    with self._lock:
+                        self.stats["misses"] += 1
+                        self.stats["network_bytes"] += size
+                    return self._store(path, tmp, etag, size, need_file)
+                except BaseException:
+                    self._unlink(tmp)
+                    raise
+        finally:
+            # held until the entry is stored, so waiting misses find it instead of refetching
+            with self._lock:
+                if self._fetch_locks.get(path) is fetch_lock:
+                    del self._fetch_locks[path]
+
+    def _store(self, path: str, tmp: str, etag: str, size: int, need_file: bool):
+        """
+        Index a freshly fetched file (moved from tmp into place) and return it like
+        _fresh_entry does: the memory tuple, or the disk entry pinned for the caller.
+        """
+        now = time.time()
+        if size > self.disk_bytes:
+            # too large for the disk budget: served once from tmp without caching
+            entry = _DiskEntry(etag, size, tmp, now, transient=True)
+            entry.pins = 1
+            return entry
+
+        file = self._file_for(path, etag)
+        os.replace(tmp, file)
+        data = None
+        if size <= self.memory_max_item:
+            with open(file, "rb") as f:
+                data = f.read()
+        with self._lock:
+            old = self._disk.pop(path, None)
+            if old is not None:
+                self._disk_used -= old.size
+                # a pinned old version stays on disk until the next restart clears it
+                if old.file != file and not old.pins:
+                    self._unlink(old.file)
+            entry = _DiskEntry(etag, size, file, now)
+            self._disk[path] = entry
+            self._disk_used += size
+            entry.pins += 1  # before eviction runs, so the new entry survives it
+            self._evict_disk()
+
+            self._drop_memory(path)
+            if data is not None:
+                self._memory[path] = (etag, data)
+                self._memory_used += size
+                while self._memory_used > self.memory_bytes and self._memory:
+                    _, (_, evicted) = self._memory.popitem(last=False)
+                    self._memory_used -= len(evicted)
+                    self.stats["evictions"] += 1
+            if need_file or path not in self._memory:
+                return entry
+            entry.pins -= 1
+            return self._memory[path]
+
+    def _evict_disk(self):
+        # caller holds the lock; least recently used first, skipping pinned files
+        for path in list(self._disk):
+            if self._disk_used <= self.disk_bytes:
+                break
+            if self._disk[path].pins:
+                continue
+            self._drop_disk(path)
+            self.stats["evictions"] += 1
+
+    def _drop_memory(self, path: str):
+        hit = self._memory.pop(path, None)
+        if hit is not None:
+            self._memory_used -= len(hit[1])
+
+    def _drop_disk(self, path: str):
+        entry = self._disk.pop(path, None)
+        if entry is not None:
+            self._disk_used -= entry.size
+            self._unlink(entry.file)
+
+    @staticmethod
+    def _unlink(file: str):
+        try:
+            os.remove(file)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning("Could not evict %s: %s", file, e)
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """The process-wide cache, or None when OBJECT_CACHE_ENABLED is off."""
+    global _cache
+    if not settings.OBJECT_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            from .minio_client import fetch_object_to, stat_object
+
+            directory = os.path.join(settings.OBJECT_CACHE_DIR, f"pid{os.getpid()}")
+            _cache = ObjectCache(
+                fetch=fetch_object_to,
+                stat=stat_object,
+                directory=directory,
+                memory_bytes=settings.OBJECT_CACHE_MEMORY_BYTES,
+                disk_bytes=settings.OBJECT_CACHE_DISK_BYTES,
+                memory_max_item=settings.OBJECT_CACHE_MEMORY_MAX_ITEM_BYTES,
+                revalidate_s=settings.OBJECT_CACHE_REVALIDATE_S,
+            )
+    return _cache
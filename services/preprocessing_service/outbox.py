@@ -0,0 +1,39 @@
+# services/preprocessing_service/outbox.py
+import json
+from common.config.redis_client import get_redis
+from common.config.settings import settings
+from common.utils.logger import get_logger
+
+logger = get_logger("preprocessing_outbox")
+
+# Results leave this service as entries on the STATUS_STREAM Redis stream, applied to the
+# database by services/ingestion_service/outbox_consumer.py. Each finished page is
+# published as it completes, so status shows up page by page; the batch event at the
+# end repeats every result, so a lost page event is made good by it. Redis persists the
+# stream and the consumer group tracks what has been applied, so results survive an
+# ingestion restart instead of being lost with a failed HTTP callback.
+
+
+def _publish(event: dict) -> bool:
+    try:
+        get_redis().xadd(
+            settings.STATUS_STREAM,
+            {"type": event["type"], "batch_id": event["batch_id"], "data": json.dumps(event)},
+            maxlen=settings.STATUS_STREAM_MAXLEN,
+            approximate=True,
+        )
+        return True
+    except Exception as e:
+        logger.warning("Could not publish %s event for batch %s: %s", event["type"], event["batch_id"], e)
+        return False
+
+
+def publish_page(batch_id: str, result: dict) -> bool:
+    """One finished page; best effort, since the batch event carries it again."""
+    return _publish({"type": "page", "batch_id": batch_id, "result": result})
+
+
+def publish_batch(batch_id: str, results: list, timings: dict, memory: dict) -> bool:
+    """Every result of the batch plus its timings; False means the caller must deliver it another way."""
+    return _publish({"type": "batch", "batch_id": batch_id, "results": results,
+                     "timings": timings, "memory": memory})
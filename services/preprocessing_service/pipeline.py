@@ -0,0 +1,219 @@
+# services/preprocessing_service/pipeline.py
+"""
+Overlapped I/O for process_batch: the next input is fetched and the next PDF pages are
+rendered while the current page is enhanced, and finished pages are uploaded in the
+background. Enhancement (CPU) stays on the request thread and is what bounds the batch.
+
+Every stage is bounded, so memory stays flat however far one side runs ahead:
+
+    fetch     prefetch(): PIPELINE_PREFETCH_FILES inputs opened ahead of the current one
+    render    read_ahead(): PIPELINE_RENDER_AHEAD pages produced ahead of enhancement
+    upload    PageUploads: at most PIPELINE_UPLOADS_IN_FLIGHT pages of a file pending, on a
+              pool of PIPELINE_UPLOAD_WORKERS threads shared by the process
+
+Setting a limit to 0 runs that stage inline, as before. Background work runs in a copy of
+the caller's contextvars, so log_context fields (batch_id, page) follow it.
+"""
+import contextvars
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from common.config.settings import settings
+from common.utils.logger import get_logger
+
+logger = get_logger("preprocessing_pipeline")
+
+_DONE = object()
+
+
+class Stalls:
+    """Seconds the enhancement thread spent waiting on each I/O stage."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.seconds = {"fetch_wait_s": 0.0, "render_wait_s": 0.0, "upload_wait_s": 0.0}
+
+    def add(self, stage: str, seconds: float):
+        with self._lock:
+            self.seconds[stage] += seconds
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {k: round(v, 3) for k, v in self.seconds.items()}
+
+
+def prefetch(items: list, open_fn, ahead: int, discard, stalls: Stalls = None):
+    """
+    Yield (item, open_fn(item), error) in order, running open_fn for up to `ahead` later
+    items in the background; error is the exception open_fn raised, if any (the value is
+    then None). If the consumer stops early, values it never received are passed to
+    discard() (e.g. to release a temp file).
+    """
+    if ahead <= 0:
+        for item in items:
+            try:
+                value = open_fn(item)
+            except Exception as e:
+                yield item, None, e
+                continue
+            yield item, value, None
+        return
+
+    pool = ThreadPoolExecutor(max_workers=ahead, thread_name_prefix="prefetch")
+    pending = []
+    try:
+        for item in items:
+            pending.append((item, pool.submit(contextvars.copy_context().run, open_fn, item)))
+            if len(pending) > ahead:
+                yield _outcome(*pending.pop(0), stalls)
+        while pending:
+            yield _outcome(*pending.pop(0), stalls)
+    finally:
+        for _, future in pending:
+            future.cancel()
+        for _, future in pending:
+            if not future.cancelled() and future.exception() is None:
+                discard(future.result())
+        pool.shutdown(wait=True)
+
+
+def _outcome(item, future, stalls: Stalls) -> tuple:
+    t0 = time.perf_counter()
+    error = future.exception()
+    if stalls is not None:
+        stalls.add("fetch_wait_s", time.perf_counter() - t0)
+    return item, None if error else future.result(), error
+
+
+def read_ahead(iterator, ahead: int, discard, stalls: Stalls = None):
+    """
+    Yield from `iterator`, which a background thread runs up to `ahead` items ahead.
+    Items produced but never consumed are passed to discard(); a producer exception is
+    re-raised in the consumer after the items before it.
+    """
+    if ahead <= 0:
+        yield from iterator
+        return
+
+    buffer = queue.Queue(maxsize=ahead)
+    stop = threading.Event()
+
+    def _put(entry) -> bool:
+        while not stop.is_set():
+            try:
+                buffer.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _produce():
+        try:
+            for value in iterator:
+                if not _put((value, None)):
+                    discard(value)
+                    return
+            _put((_DONE, None))
+        except BaseException as e:
+            _put((_DONE, e))
+        finally:
+            close = getattr(iterator, "close", None)
+            if close:
+                close()
+
+    producer = threading.Thread(target=contextvars.copy_context().run, args=(_produce,),
+                                name="read-ahead", daemon=True)
+    producer.start()
+    try:
+        while True:
+            t0 = time.perf_counter()
+            value, error = buffer.get()
+            if stalls is not None:
+                stalls.add("render_wait_s", time.perf_counter() - t0)
+            if value is _DONE:
+                if error is not None:
+                    raise error
+                return
+            yield value
+    finally:
+        stop.set()
+        producer.join()
+        while True:
+            try:
+                value, _ = buffer.get_nowait()
+            except queue.Empty:
+                break
+            if value is not _DONE:
+                discard(value)
+
+
+_upload_pool = None
+_upload_pool_lock = threading.Lock()
+
+
+def _get_upload_pool() -> ThreadPoolExecutor:
+    global _upload_pool
+    with _upload_pool_lock:
+        if _upload_pool is None:
+            _upload_pool = ThreadPoolExecutor(max_workers=max(1, settings.PIPELINE_UPLOAD_WORKERS),
+                                              thread_name_prefix="page-upload")
+    return _upload_pool
+
+
+class PageUploads:
+    """
+    Finishing work (upload, checkpoint, status event) for the pages of one file, run in
+    the background. submit() blocks while PIPELINE_UPLOADS_IN_FLIGHT pages are pending;
+    wait() returns once all are done and raises the first failure; settle() only waits.
+    """
+
+    def __init__(self, stalls: Stalls = None):
+        self.limit = settings.PIPELINE_UPLOADS_IN_FLIGHT
+        self.stalls = stalls
+        self._slots = threading.BoundedSemaphore(max(1, self.limit))
+        self._futures = []
+        self._failed = None
+
+    def _done(self, future):
+        self._slots.release()
+        if self._failed is None and not future.cancelled() and future.exception() is not None:
+            self._failed = future.exception()
+
+    def submit(self, fn, *args):
+        if self.limit <= 0:
+            fn(*args)
+            return
+        if self._failed is not None:
+            # no point enhancing the rest of the file; wait() reports the failure
+            raise self._failed
+        t0 = time.perf_counter()
+        self._slots.acquire()
+        if self.stalls is not None:
+            self.stalls.add("upload_wait_s", time.perf_counter() - t0)
+        try:
+            future = _get_upload_pool().submit(contextvars.copy_context().run, fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(self._done)
+        self._futures.append(future)
+
+    def settle(self):
+        """Wait for every pending page without raising, when the file has already failed."""
+        try:
+            self.wait()
+        except Exception as e:
+            logger.warning("Upload of a page also failed: %s", e)
+
+    def wait(self):
+        t0 = time.perf_counter()
+        try:
+            errors = [f.exception() for f in self._futures]
+        finally:
+            if self.stalls is not None:
+                self.stalls.add("upload_wait_s", time.perf_counter() - t0)
+            self._futures = []
+        for error in errors:
+            if error is not None:
+                raise error
@@ -0,0 +1,76 @@
+import cv2
+import numpy as np
+from common.config.settings import settings
+
+# Document boundary detection for photographed cards and pages: find the largest convex
+# quadrilateral in an edge map of a downsampled copy, then warp the full-resolution
+# page so only the document (perspective-corrected) goes through the rest of the
+# pipeline. Frames where the document fills almost everything (scans) are left alone.
+
+
+def _order(quad: np.ndarray) -> np.ndarray:
+    """Corners as top-left, top-right, bottom-right, bottom-left."""
+    s = quad.sum(axis=1)
+    d = np.diff(quad, axis=1).ravel()
+    return np.array([quad[np.argmin(s)], quad[np.argmin(d)], quad[np.argmax(s)], quad[np.argmax(d)]],
+                    np.float32)
+
+
+def _edges(small: np.ndarray) -> np.ndarray:
+    blurred = cv2.GaussianBlur(small, (5, 5), 0)
+    # thresholds around the median intensity adapt to dark tables and bright paper alike
+    median = float(np.median(blurred))
+    edges = cv2.Canny(blurred, int(max(0, 0.66 * median)), int(min(255, 1.33 * median)))
+    # close the small gaps that glare and rounded card corners leave in the outline
+    return cv2.morphologyEx(edges, cv2.MORPH_CLOSE, np.ones((5, 5), np.uint8), iterations=2)
+
+
+def detect_document(gray: np.ndarray):
+    """
+    Corners (4x2 float32, full-resolution coordinates, ordered tl/tr/br/bl) of the
+    document in a uint8 grayscale frame, or None if there is nothing worth cropping.
+    """
+    h, w = gray.shape[:2]
+    scale = min(1.0, settings.CROP_ANALYSIS_MAX_SIDE / float(max(h, w)))
+    small = gray if scale == 1.0 else cv2.resize(gray, (max(1, int(w * scale)), max(1, int(h * scale))),
+                                                 interpolation=cv2.INTER_AREA)
+    frame_area = float(small.shape[0] * small.shape[1])
+
+    contours, _ = cv2.findContours(_edges(small), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    for contour in sorted(contours, key=cv2.contourArea, reverse=True)[:5]:
+        area = cv2.contourArea(contour)
+        ratio = area / frame_area
+        if ratio < settings.CROP_MIN_AREA_RATIO:
+            break  # sorted by area: the rest are smaller still
+        approx = cv2.approxPolyDP(contour, 0.02 * cv2.arcLength(contour, True), True)
+        if len(approx) == 4 and cv2.isContourConvex(approx):
+            quad = approx.reshape(4, 2).astype(np.float32)
+        else:
+            # rounded corners or a clipped edge: accept the bounding rotated rectangle if
+            # the outline fills most of it
+            rect = cv2.minAreaRect(contour)
+            if area < 0.85 * rect[1][0] * rect[1][1]:
+                continue
+            quad = cv2.boxPoints(rect).astype(np.float32)
+        if cv2.contourArea(quad) / frame_area > settings.CROP_MAX_AREA_RATIO:
+            return None  # the document already fills the frame
+        quad = np.clip(quad / scale, 0, [w - 1, h - 1])
+        return _order(quad)
+    return None
+
+
+def warp_size(quad: np.ndarray) -> tuple:
+    """(width, height) of the rectified document: the longer of each pair of opposite edges."""
+    tl, tr, br, bl = quad
+    width = max(np.linalg.norm(tr - tl), np.linalg.norm(br - bl))
+    height = max(np.linalg.norm(bl - tl), np.linalg.norm(br - tr))
+    return max(1, int(round(width))), max(1, int(round(height)))
+
+
+def warp_document(img: np.ndarray, quad, size: tuple = None) -> np.ndarray:
+    """Perspective-correct the quad of img (gray or colour) into an upright rectangle."""
+    quad = np.asarray(quad, np.float32)
+    width, height = size or warp_size(quad)
+    target = np.array([[0, 0], [width - 1, 0], [width - 1, height - 1], [0, height - 1]], np.float32)
+    M = cv2.getPerspectiveTransform(quad, target)
+    return cv2.warpPerspective(img, M, (width, height), flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
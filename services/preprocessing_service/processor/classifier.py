@@ -1,46 +1,174 @@
-import torch
-from transformers import AutoImageProcessor, AutoModelForImageClassification
-from PIL import Image
+import re
+import numpy as np
+from PIL import Image, ImageOps
 from io import BytesIO
-import torchvision.transforms as T
+from common.config.settings import settings
+from common.utils.logger import get_logger
+from .boundary import warp_document
 
 # ✅ Import your MinIO helper
 from services.preprocessing_service.minio_client import download_object
 
 MODEL_NAME = "google/mobilenet_v2_1.0_224"  # lightweight fallback
-processor = AutoImageProcessor.from_pretrained(MODEL_NAME)
-model = AutoModelForImageClassification.from_pretrained(MODEL_NAME)
+
+logger = get_logger("preprocessing_classifier", sample_rate=settings.LOG_PAGE_SAMPLE_RATE)
 
 LABELS = ["aadhaar", "pan", "voter_id", "driving_license", "photo"]
 
-def classify_document(image_path: str):
+# Phrases printed on each document type, for pages whose text layer can be read directly
+# (digital PDFs, scans with an OCR layer); matched case-insensitively
+KEYWORDS = {
+    "aadhaar": [r"\baadhaa?r\b", r"unique identification authority", r"\buidai\b", r"\b\d{4} \d{4} \d{4}\b"],
+    "pan": [r"income tax department", r"permanent account number", r"\b[a-z]{5}\d{4}[a-z]\b"],
+    "voter_id": [r"election commission", r"elector'?s? photo identity", r"\bepic\b"],
+    "driving_license": [r"driving licen[cs]e", r"transport department", r"\bdl no\b"],
+}
+_KEYWORD_RES = {label: [re.compile(k) for k in keys] for label, keys in KEYWORDS.items()}
+
+BACKEND_PYTORCH = "pytorch"
+BACKEND_ONNX = "onnx"
+BACKEND_ONNX_INT8 = "onnx-int8"
+
+
+class TorchBackend:
+    """Full-precision PyTorch model through transformers."""
+    name = BACKEND_PYTORCH
+
+    def __init__(self, model_name: str = MODEL_NAME):
+        import torch
+        from transformers import AutoModelForImageClassification
+
+        self._torch = torch
+        self.model = AutoModelForImageClassification.from_pretrained(
+            model_name, **pretrained_kwargs()
+        ).eval()
+
+    def predict(self, pixel_values: np.ndarray) -> np.ndarray:
+        with self._torch.no_grad():
+            logits = self.model(pixel_values=self._torch.from_numpy(pixel_values)).logits
+        return logits.numpy()
+
+
+class OnnxBackend:
+    """ONNX Runtime CPU session over an exported (optionally int8-quantized) model."""
+
+    def __init__(self, model_path: str, name: str = BACKEND_ONNX):
+        import onnxruntime as ort
+
+        self.name = name
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if settings.CLASSIFIER_ONNX_THREADS:
+            opts.intra_op_num_threads = settings.CLASSIFIER_ONNX_THREADS
+        self.session = ort.InferenceSession(model_path, opts, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def predict(self, pixel_values: np.ndarray) -> np.ndarray:
+        return self.session.run(None, {self.input_name: pixel_values})[0]
+
+
+def pretrained_kwargs() -> dict:
+    """from_pretrained options: read from the local model cache, offline when configured."""
+    return {"cache_dir": settings.MODEL_CACHE_DIR, "local_files_only": settings.MODEL_OFFLINE}
+
+
+def onnx_model_path(quantized: bool = False) -> str:
+    filename = "classifier.int8.onnx" if quantized else "classifier.onnx"
+    return f"{settings.CLASSIFIER_ONNX_DIR.rstrip('/')}/{filename}"
+
+
+def load_backend(name: str = None):
+    """Instantiate the inference backend selected by CLASSIFIER_BACKEND (or `name`)."""
+    name = name or settings.CLASSIFIER_BACKEND
+    if name == BACKEND_PYTORCH:
+        return TorchBackend(MODEL_NAME)
+    if name == BACKEND_ONNX:
+        return OnnxBackend(onnx_model_path(quantized=False), name=BACKEND_ONNX)
+    if name == BACKEND_ONNX_INT8:
+        return OnnxBackend(onnx_model_path(quantized=True), name=BACKEND_ONNX_INT8)
+    raise ValueError(f"Unknown classifier backend: {name}")
+
+
+_processor = None
+_backend = None
+
+
+def get_processor():
+    global _processor
+    if _processor is None:
+        from transformers import AutoImageProcessor
+
+        _processor = AutoImageProcessor.from_pretrained(MODEL_NAME, **pretrained_kwargs())
+    return _processor
+
+
+def get_backend():
+    """The process-wide backend, created on first use."""
+    global _backend
+    if _backend is None:
+        _backend = load_backend()
+    return _backend
+
+
+def preprocess(image: Image.Image) -> np.ndarray:
+    """Resize/normalise an RGB image into the model's float32 NCHW input."""
+    inputs = get_processor()(images=image, return_tensors="np")
+    return inputs["pixel_values"].astype(np.float32)
+
+
+def softmax(logits: np.ndarray) -> np.ndarray:
+    shifted = np.exp(logits - logits.max(axis=-1, keepdims=True))
+    return shifted / shifted.sum(axis=-1, keepdims=True)
+
+
+def classify_document(image_path: str, crop_quad=None):
     """
     Classify an image from MinIO or local file.
     Supports both local paths and MinIO object paths.
+    `crop_quad` (corners from boundary.detect_document) classifies only the document.
     """
     try:
         # --- Detect if the image path is a MinIO object path ---
         if image_path.startswith("documents/"):
-            print(f"[INFO] Downloading image from MinIO: {image_path}")
+            logger.info("Downloading image from MinIO: %s", image_path)
             image_bytes = download_object(image_path)
-            image = Image.open(BytesIO(image_bytes)).convert("RGB")
+            image = Image.open(BytesIO(image_bytes))
         else:
             # Local file (for testing/debug)
-            image = Image.open(image_path).convert("RGB")
+            image = Image.open(image_path)
+        # upright, as cv2.imdecode in the enhancer sees it, so crop_quad's corners line up
+        image = ImageOps.exif_transpose(image).convert("RGB")
 
-        # --- Preprocess & Predict ---
-        inputs = processor(images=image, return_tensors="pt")
+        if crop_quad is not None:
+            image = Image.fromarray(warp_document(np.asarray(image), crop_quad))
 
-        with torch.no_grad():
-            logits = model(**inputs).logits
-            pred = torch.argmax(logits, dim=1).item()
-            confidence = torch.softmax(logits, dim=1)[0][pred].item()
+        # --- Preprocess & Predict ---
+        backend = get_backend()
+        logits = backend.predict(preprocess(image))[0]
+        pred = int(np.argmax(logits))
+        confidence = float(softmax(logits)[pred])
 
         label = LABELS[pred % len(LABELS)]
-        print(f"[INFO] Classified as {label} ({confidence:.2f})")
+        logger.info("Classified as %s (%.2f) via %s", label, confidence, backend.name)
 
         return label, round(confidence, 3)
 
     except Exception as e:
-        print(f"[ERROR] Classification failed for {image_path}: {e}")
+        logger.error("Classification failed for %s: %s", image_path, e)
         raise
+
+
+def classify_text(text: str):
+    """
+    (label, confidence) from a page's text layer, or None when no document type, or more
+    than one, matches; the image classifier decides those pages.
+    """
+    text = " ".join(text.lower().split())
+    hits = {label: sum(1 for r in res if r.search(text)) for label, res in _KEYWORD_RES.items()}
+    ranked = sorted(hits.items(), key=lambda kv: kv[1], reverse=True)
+    (label, best), (_, runner_up) = ranked[0], ranked[1]
+    if best == 0 or best == runner_up:
+        return None
+    confidence = min(0.99, 0.6 + 0.15 * (best - runner_up))
+    logger.info("Classified as %s (%.2f) from the text layer", label, confidence)
+    return label, round(confidence, 3)
@@ -1,17 +1,73 @@
-import fitz  # PyMuPDF
 import tempfile
+import threading
+from contextlib import contextmanager
+from common.utils.logger import get_logger
 
-def pdf_to_images(pdf_path):
+logger = get_logger("preprocessing_converter")
+
+# Every local temp file the service creates starts with this, so services/scripts/reaper.py
+# can sweep whatever a crashed or killed worker left behind.
+TEMP_PREFIX = "docintel_"
+
+# PyMuPDF is not thread-safe: all documents share one MuPDF context, and concurrent
+# process_batch requests each render ahead on a thread of their own. Every fitz call in
+# the service is made holding this lock, and a document is opened, used and closed by a
+# single thread (the page generators below run entirely on their read-ahead thread).
+# Generators hold it per page, never across a yield.
+FITZ_LOCK = threading.RLock()
+
+
+@contextmanager
+def open_pdf(pdf_path):
+    """fitz.open(), with the open and the close made under FITZ_LOCK; use the document under it too."""
+    import fitz  # PyMuPDF — imported lazily to keep service startup fast
+
+    with FITZ_LOCK:
+        doc = fitz.open(pdf_path)
+    try:
+        yield doc
+    finally:
+        with FITZ_LOCK:
+            doc.close()
+
+
+def pdf_page_count(pdf_path) -> int:
+    with FITZ_LOCK, open_pdf(pdf_path) as doc:
+        return doc.page_count
+
+
+def iter_pdf_images(pdf_path, pages=None):
+    """
+    Render PDF pages one at a time, yielding (0-based index, local PNG path) as each is
+    done. `pages` (0-based indices) limits rendering to those pages, in the given order.
+    The caller owns the yielded files and must remove them.
+    """
+    with open_pdf(pdf_path) as doc:
+        with FITZ_LOCK:
+            indices = range(doc.page_count) if pages is None else pages
+        for i in indices:
+            with FITZ_LOCK:
+                img_path = render_page(doc[i])
+            yield i, img_path
+
+
+def render_page(page) -> str:
+    """Rasterize one fitz page at 2x to a local PNG the caller must remove."""
+    import fitz
+
+    pix = page.get_pixmap(matrix=fitz.Matrix(2, 2))
+    img_path = tempfile.NamedTemporaryFile(prefix=TEMP_PREFIX, suffix=f"_page{page.number}.png", delete=False).name
+    pix.save(img_path)
+    return img_path
+
+
+def pdf_to_images(pdf_path, pages=None):
     """
     Converts each page of a PDF into images and returns their local file paths.
+    `pages` (0-based indices) limits rendering to those pages, in the given order.
+    The caller owns the returned files and must remove them.
     """
-    images = []
-    print(f"[INFO] Converting PDF to images: {pdf_path}")
-    with fitz.open(pdf_path) as doc:
-        for i, page in enumerate(doc):
-            pix = page.get_pixmap(matrix=fitz.Matrix(2, 2))
-            img_path = tempfile.NamedTemporaryFile(suffix=f"_page{i}.png", delete=False).name
-            pix.save(img_path)
-            images.append(img_path)
-    print(f"[INFO] Extracted {len(images)} image(s) from {pdf_path}")
+    logger.info("Converting PDF to images: %s", pdf_path)
+    images = [img_path for _, img_path in iter_pdf_images(pdf_path, pages)]
+    logger.info("Extracted %d image(s) from %s", len(images), pdf_path)
     return images
@@ -0,0 +1,344 @@
+import math
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+from common.config.settings import settings
+from .quality import quality_gate, estimate_skew, STAGE_DESKEW, STAGE_CLAHE, STAGE_DEBLUR
+from .boundary import detect_document, warp_document
+
+# Enhancement engine behind enhancer.enhance_image_with_report, used for every page.
+#
+# Pages are converted to uint8 grayscale once on entry and every stage works on that
+# ndarray, writing into per-thread scratch buffers that are reused between stages and
+# pages. Stages are declared by name in ENHANCE_STAGES; stages tied to a quality-gate
+# need ("deskew", "clahe", "deblur") only run when the gate asks for them. Pages of at
+# least ENHANCE_TILE_MIN_PIXELS run tileable stages in ENHANCE_TILE_SIZE tiles.
+# With crop=True a photographed document is first cut out of its background
+# (boundary.py), so the gate and every stage only see the document.
+
+
+class _Buffers(threading.local):
+    """Per-thread scratch arrays keyed by (shape, dtype, slot), reused across pages."""
+    MAX_ENTRIES = 16
+
+    def __init__(self):
+        self.pool = {}
+
+    def get(self, shape, dtype=np.uint8, slot=0) -> np.ndarray:
+        key = (tuple(shape), np.dtype(dtype).str, slot)
+        buf = self.pool.get(key)
+        if buf is None:
+            if len(self.pool) >= self.MAX_ENTRIES:
+                self.pool.clear()  # page sizes changed a lot — start over
+            buf = np.empty(shape, dtype)
+            self.pool[key] = buf
+        return buf
+
+
+_buffers = _Buffers()
+
+
+# ---------------- STAGES ----------------
+# Signature: stage(src, out, ctx) -> ndarray. `out` is a free uint8 buffer shaped like src;
+# a stage may return it, return src untouched, or return a differently shaped array.
+
+def _unsharp(src, out, blurred):
+    # unsharp mask: src + amount·(src − gaussian(src)), saturated to uint8
+    amount = settings.ENHANCE_SHARPEN_AMOUNT
+    cv2.GaussianBlur(src, (0, 0), settings.ENHANCE_SHARPEN_SIGMA, dst=blurred,
+                     borderType=cv2.BORDER_REFLECT_101)
+    return cv2.addWeighted(src, 1.0 + amount, blurred, -amount, 0, dst=out)
+
+
+def stage_deblur(src, out, ctx):
+    # The gate asks for this stage on blurry pages (low Laplacian variance), so it sharpens.
+    # The legacy 5x5 box "deblur" blurred them further and is gone.
+    return _unsharp(src, out, _buffers.get(src.shape, slot="unsharp"))
+
+
+def stage_clahe(src, out, ctx):
+    clahe = cv2.createCLAHE(
+        clipLimit=settings.ENHANCE_CLAHE_CLIP_LIMIT,
+        tileGridSize=(settings.ENHANCE_CLAHE_TILES, settings.ENHANCE_CLAHE_TILES),
+    )
+    return clahe.apply(src, dst=out)
+
+
+_DESKEW_BAND_ROWS = 256
+
+
+def _deskew_inverse(w: int, h: int, angle: float) -> np.ndarray:
+    """Destination → source affine of a rotation by angle degrees about the page centre."""
+    return cv2.invertAffineTransform(cv2.getRotationMatrix2D((w / 2.0, h / 2.0), angle, 1.0))
+
+
+def _remap_region(src, out, inverse, y0, y1, x0, x1):
+    """
+    Rotate one destination region of out from the whole of src. The source coordinates
+    are computed per pixel in float64 from the page-wide inverse affine, so they do not
+    depend on the region's origin (warpAffine's fixed-point coordinates do).
+    """
+    xs = np.arange(x0, x1, dtype=np.float64)[None, :]
+    ys = np.arange(y0, y1, dtype=np.float64)[:, None]
+    map_x = (inverse[0, 0] * xs + (inverse[0, 1] * ys + inverse[0, 2])).astype(np.float32)
+    map_y = (inverse[1, 0] * xs + (inverse[1, 1] * ys + inverse[1, 2])).astype(np.float32)
+    out[y0:y1, x0:x1] = cv2.remap(src, map_x, map_y, cv2.INTER_CUBIC, borderMode=cv2.BORDER_REPLICATE)
+
+
+def stage_deskew(src, out, ctx):
+    metrics = ctx.get("metrics")
+    angle = metrics["skew_deg"] if metrics else estimate_skew(src)
+    if angle == 0:
+        return src
+    h, w = src.shape[:2]
+    inverse = _deskew_inverse(w, h, angle)
+    # bands keep the coordinate maps small; each pixel comes out as it would in one pass
+    for y0 in range(0, h, _DESKEW_BAND_ROWS):
+        _remap_region(src, out, inverse, y0, min(y0 + _DESKEW_BAND_ROWS, h), 0, w)
+    return out
+
+
+_wiener_filters = {}
+
+
+def _kernel_tf(kernel: np.ndarray, shape) -> np.ndarray:
+    """Transfer function of a small kernel centred on the origin (2-channel float32 DFT)."""
+    padded = np.zeros(shape, np.float32)
+    kh, kw = kernel.shape
+    padded[:kh, :kw] = kernel
+    padded = np.roll(padded, (-(kh // 2), -(kw // 2)), axis=(0, 1))
+    return cv2.dft(padded, flags=cv2.DFT_COMPLEX_OUTPUT)
+
+
+def _wiener_filter(shape) -> np.ndarray:
+    """conj(H) / (|H|² + balance·|L|²) for a 3x3 box PSF and Laplacian regulariser, cached per shape."""
+    key = (shape, settings.ENHANCE_WIENER_BALANCE)
+    filt = _wiener_filters.get(key)
+    if filt is None:
+        H = _kernel_tf(np.full((3, 3), 1 / 9.0, np.float32), shape)
+        L = _kernel_tf(np.array([[0, -1, 0], [-1, 4, -1], [0, -1, 0]], np.float32), shape)
+        denom = H[..., 0] ** 2 + H[..., 1] ** 2 + settings.ENHANCE_WIENER_BALANCE * (L[..., 0] ** 2 + L[..., 1] ** 2)
+        filt = np.dstack((H[..., 0] / denom, -H[..., 1] / denom)).astype(np.float32)
+        if len(_wiener_filters) >= 8:
+            _wiener_filters.clear()
+        _wiener_filters[key] = filt
+    return filt
+
+
+def stage_wiener(src, out, ctx):
+    # float32 frequency-domain Wiener deconvolution (skimage.restoration.wiener equivalent)
+    shape = src.shape[:2]
+    work = _buffers.get(shape, np.float32, slot="wiener")
+    np.multiply(src, np.float32(1 / 255.0), out=work, casting="unsafe")
+    spectrum = cv2.dft(work, flags=cv2.DFT_COMPLEX_OUTPUT)
+    restored = cv2.idft(cv2.mulSpectrums(spectrum, _wiener_filter(shape), 0),
+                        flags=cv2.DFT_SCALE | cv2.DFT_REAL_OUTPUT)
+    np.clip(restored, 0, 1, out=restored)
+    np.multiply(restored, 255, out=restored)
+    np.copyto(out, restored, casting="unsafe")
+    return out
+
+
+def stage_limit_width(src, out, ctx):
+    max_w = settings.ENHANCE_MAX_WIDTH
+    h, w = src.shape[:2]
+    if not max_w or w <= max_w:
+        return src
+    new_h = int(h * max_w / w)
+    resized = _buffers.get((new_h, max_w), slot="limit_width")
+    return cv2.resize(src, (max_w, new_h), dst=resized, interpolation=cv2.INTER_AREA)
+
+
+# ---------------- TILED EXECUTION ----------------
+# Large pages are cut into tiles that run on a thread pool (OpenCV releases the GIL).
+# Each tile is processed with a halo of neighbouring pixels so the core written back is
+# what full-frame processing would produce there; the halo is then discarded.
+
+_tile_pool = None
+_tile_pool_lock = threading.Lock()
+
+
+def _get_tile_pool() -> ThreadPoolExecutor:
+    global _tile_pool
+    with _tile_pool_lock:
+        if _tile_pool is None:
+            workers = settings.ENHANCE_TILE_WORKERS or os.cpu_count() or 1
+            _tile_pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="enhance-tile")
+    return _tile_pool
+
+
+def _tile_grid(h: int, w: int, tile_h: int, tile_w: int) -> list:
+    return [
+        (y0, min(y0 + tile_h, h), x0, min(x0 + tile_w, w))
+        for y0 in range(0, h, tile_h)
+        for x0 in range(0, w, tile_w)
+    ]
+
+
+def _run_tiles(src, out, tile_h, tile_w, halo, fn):
+    """Apply fn(region) to haloed tiles of src in parallel and write each core into out."""
+    h, w = src.shape[:2]
+
+    def _one(tile):
+        y0, y1, x0, x1 = tile
+        ys, ye = max(0, y0 - halo), min(h, y1 + halo)
+        xs, xe = max(0, x0 - halo), min(w, x1 + halo)
+        result = fn(src[ys:ye, xs:xe], (ys, ye, xs, xe))
+        out[y0:y1, x0:x1] = result[y0 - ys:y1 - ys, x0 - xs:x1 - xs]
+
+    # list() re-raises the first tile error, if any
+    list(_get_tile_pool().map(_one, _tile_grid(h, w, tile_h, tile_w)))
+    return out
+
+
+def _tile_size() -> int:
+    return settings.ENHANCE_TILE_SIZE
+
+
+def tiled_deblur(src, out, ctx):
+    # the Gaussian reaches 3 sigma, so that halo makes the result identical to full-frame
+    tile = _tile_size()
+    halo = int(math.ceil(3 * settings.ENHANCE_SHARPEN_SIGMA)) + 1
+    return _run_tiles(src, out, tile, tile, halo,
+                      lambda region, _: _unsharp(region, np.empty_like(region), np.empty_like(region)))
+
+
+def tiled_clahe(src, out, ctx):
+    # Keep the full-frame CLAHE cell size and align tiles to the cell grid, with one cell of
+    # halo so every core pixel interpolates between the same neighbouring cells' LUTs.
+    h, w = src.shape[:2]
+    tiles = settings.ENHANCE_CLAHE_TILES
+    cell_h, cell_w = math.ceil(h / tiles), math.ceil(w / tiles)
+    tile_h = max(1, round(_tile_size() / cell_h)) * cell_h
+    tile_w = max(1, round(_tile_size() / cell_w)) * cell_w
+
+    def _clahe(region, _):
+        rh, rw = region.shape[:2]
+        grid = (max(1, math.ceil(rw / cell_w)), max(1, math.ceil(rh / cell_h)))
+        return cv2.createCLAHE(clipLimit=settings.ENHANCE_CLAHE_CLIP_LIMIT, tileGridSize=grid).apply(region)
+
+    return _run_tiles(src, out, tile_h, tile_w, max(cell_h, cell_w), _clahe)
+
+
+def tiled_deskew(src, out, ctx):
+    # Each destination tile is remapped straight from the full (read-only) source through
+    # the same page-wide coordinate map as stage_deskew, so no halo is needed and tiles
+    # match the full-frame result pixel for pixel.
+    metrics = ctx.get("metrics")
+    angle = metrics["skew_deg"] if metrics else estimate_skew(src)
+    if angle == 0:
+        return src
+    h, w = src.shape[:2]
+    inverse = _deskew_inverse(w, h, angle)
+
+    def _warp(tile):
+        y0, y1, x0, x1 = tile
+        _remap_region(src, out, inverse, y0, y1, x0, x1)
+
+    tile = _tile_size()
+    list(_get_tile_pool().map(_warp, _tile_grid(h, w, tile, tile)))
+    return out
+
+
+# name → (function, quality-gate need that enables it or None for always, tiled variant or None)
+STAGES = {
+    "deblur": (stage_deblur, STAGE_DEBLUR, tiled_deblur),
+    "wiener": (stage_wiener, STAGE_DEBLUR, None),  # global FFT — always full-frame
+    "clahe": (stage_clahe, STAGE_CLAHE, tiled_clahe),
+    "deskew": (stage_deskew, STAGE_DESKEW, tiled_deskew),
+    "limit_width": (stage_limit_width, None, None),
+}
+
+
+def parse_stages(spec) -> list:
+    names = [s.strip() for s in spec.split(",") if s.strip()] if isinstance(spec, str) else list(spec)
+    unknown = [n for n in names if n not in STAGES]
+    if unknown:
+        raise ValueError(f"Unknown enhancement stage(s): {unknown}; available: {sorted(STAGES)}")
+    return names
+
+
+def to_gray(img: np.ndarray, color: str = "bgr") -> np.ndarray:
+    """The single colour conversion of the pipeline; grayscale input passes through."""
+    if img.ndim == 2:
+        return img if img.dtype == np.uint8 else img.astype(np.uint8)
+    if img.shape[2] == 4:
+        code = cv2.COLOR_RGBA2GRAY if color == "rgb" else cv2.COLOR_BGRA2GRAY
+    else:
+        code = cv2.COLOR_RGB2GRAY if color == "rgb" else cv2.COLOR_BGR2GRAY
+    return cv2.cvtColor(img, code)
+
+
+class EnhancementEngine:
+    def __init__(self, stages=None, tiled: bool = None):
+        self.stages = parse_stages(settings.ENHANCE_STAGES if stages is None else stages)
+        # None → decide per page from ENHANCE_TILE_SIZE / ENHANCE_TILE_MIN_PIXELS
+        self.tiled = tiled
+
+    def _use_tiles(self, img: np.ndarray) -> bool:
+        if self.tiled is not None:
+            return self.tiled and _tile_size() > 0
+        return _tile_size() > 0 and img.shape[0] * img.shape[1] >= settings.ENHANCE_TILE_MIN_PIXELS
+
+    def run(self, img: np.ndarray, color: str = "bgr", needs: list = None, crop: bool = False) -> tuple:
+        """
+        Enhance one page. Returns (uint8 grayscale ndarray, report). The array may be a
+        reused scratch buffer: encode or copy it before the next run on this thread.
+        `needs` overrides the quality gate's choice of deskew / clahe / deblur.
+        `crop` cuts the detected document out first; report["crop"] has its corners.
+        """
+        current = to_gray(img, color)
+
+        crop_report = None
+        if crop:
+            quad = detect_document(current)
+            if quad is not None:
+                h, w = current.shape[:2]
+                current = warp_document(current, quad)
+                crop_report = {
+                    "quad": [[round(float(x), 1), round(float(y), 1)] for x, y in quad],
+                    "from": [w, h],
+                    "to": [current.shape[1], current.shape[0]],
+                }
+
+        if needs is None:
+            report = quality_gate(current)
+        else:
+            report = {"metrics": None, "stages": list(needs)}
+        report["crop"] = crop_report
+        ctx = {"metrics": report["metrics"]}
+
+        slot = 0
+        applied = []
+        tiled = self._use_tiles(current)
+        for name in self.stages:
+            fn, gate, tiled_fn = STAGES[name]
+            if gate is not None and gate not in report["stages"]:
+                continue
+            if tiled and tiled_fn is not None:
+                fn = tiled_fn
+            # ping-pong between two buffers; never hand a stage its own input as output
+            slot = 1 - slot
+            out = _buffers.get(current.shape, slot=slot)
+            if out is current:
+                slot = 1 - slot
+                out = _buffers.get(current.shape, slot=slot)
+            current = fn(current, out, ctx)
+            applied.append(name)
+
+        report["applied"] = applied
+        report["tiled"] = tiled
+        return current, report
+
+
+_default_engine = None
+
+
+def get_engine() -> EnhancementEngine:
+    """Engine built from ENHANCE_STAGES, shared by the service."""
+    global _default_engine
+    if _default_engine is None:
+        _default_engine = EnhancementEngine()
+    return _default_engine
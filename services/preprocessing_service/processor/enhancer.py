@@ -1,59 +1,54 @@
 import cv2
 import numpy as np
-import os
-from skimage import exposure
-import logging
+from common.config.settings import settings
+from common.utils.logger import get_logger
+from ..object_cache import mapped
+from .engine import get_engine
+from .phash import page_hashes
 
-logger = logging.getLogger(__name__)
+logger = get_logger("preprocessing_enhancer", sample_rate=settings.LOG_PAGE_SAMPLE_RATE)
 
-def enhance_image(image_path: str) -> bytes:
+
+def enhance_image_with_report(image_path: str, stages: list = None, crop: bool = None) -> tuple:
     """
-    Enhances the image and returns the enhanced image as bytes.
+    Enhances the image and returns (enhanced PNG bytes, report).
+    When `stages` is None the quality gate decides which stages run; the report
+    carries its measurements, the stages that were applied and, with DEDUP_ENABLED,
+    the perceptual hashes of the enhanced page ("hashes", None for a blank page).
+    `crop` (default ENHANCE_CROP) cuts a photographed document out of its background
+    first; report["crop"] holds its corners in the input image, or None.
     """
     try:
-        logger.info(f"[ENHANCER] Starting enhancement for: {image_path}")
-
-        # Read the image
-        with open(image_path, "rb") as f:
-            img_bytes = f.read()
-
-        img_array = np.frombuffer(img_bytes, np.uint8)
-        img = cv2.imdecode(img_array, cv2.IMREAD_COLOR)
+        logger.info("[ENHANCER] Starting enhancement for: %s", image_path)
+
+        # Decode straight to grayscale — the engine works on uint8 gray end to end. Large
+        # inputs (often the cached file itself) are decoded from an mmap, not a copy.
+        with mapped(image_path) as buf:
+            raw = np.frombuffer(buf, np.uint8)
+            img = cv2.imdecode(raw, cv2.IMREAD_GRAYSCALE)
+            del raw  # the mmap can't close while an array still points into it
         if img is None:
             raise ValueError(f"Failed to decode image from: {image_path}")
 
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-
-        # --- Deblur ---
-        psf = np.ones((5, 5)) / 25
-        deconvolved = cv2.filter2D(gray, -1, psf)
-
-        # --- Contrast enhancement ---
-        equalized = exposure.equalize_adapthist(deconvolved, clip_limit=0.03)
-        enhanced = (equalized * 255).astype(np.uint8)
-
-        # --- Deskew ---
-        coords = np.column_stack(np.where(enhanced > 0))
-        if coords.size == 0:
-            raise ValueError("Empty image — cannot deskew.")
-        angle = cv2.minAreaRect(coords)[-1]
-        if angle < -45:
-            angle = -(90 + angle)
-        else:
-            angle = -angle
-
-        (h, w) = enhanced.shape[:2]
-        M = cv2.getRotationMatrix2D((w // 2, h // 2), angle, 1.0)
-        deskewed = cv2.warpAffine(enhanced, M, (w, h),
-                                  flags=cv2.INTER_CUBIC, borderMode=cv2.BORDER_REPLICATE)
+        crop = settings.ENHANCE_CROP if crop is None else crop
+        enhanced, report = get_engine().run(img, color="gray", needs=stages, crop=crop)
+        report["hashes"] = page_hashes(enhanced) if settings.DEDUP_ENABLED else None
 
         # Encode as PNG bytes
-        success, encoded_img = cv2.imencode(".png", deskewed)
+        success, encoded_img = cv2.imencode(".png", enhanced)
         if not success:
             raise IOError("Failed to encode enhanced image")
 
-        return encoded_img.tobytes()
+        return encoded_img.tobytes(), report
 
     except Exception as e:
-        logger.error(f"[ENHANCER] Enhancement failed for {image_path}: {e}", exc_info=True)
+        logger.error("[ENHANCER] Enhancement failed for %s: %s", image_path, e, exc_info=True)
         raise
+
+
+def enhance_image(image_path: str, stages: list = None) -> bytes:
+    """
+    Enhances the image and returns the enhanced image as bytes.
+    """
+    enhanced_bytes, _ = enhance_image_with_report(image_path, stages)
+    return enhanced_bytes
@@ -0,0 +1,224 @@
+"""
+Export, quantize, validate and benchmark the document classifier on ONNX Runtime.
+
+    python -m services.preprocessing_service.processor.onnx_tools export
+    python -m services.preprocessing_service.processor.onnx_tools quantize [--calibration DIR]
+    python -m services.preprocessing_service.processor.onnx_tools validate --images DIR
+    python -m services.preprocessing_service.processor.onnx_tools benchmark --images DIR
+
+`validate` exits non-zero when an ONNX variant's top-1 agreement with PyTorch on the
+validation images drops below --min-agreement, so it can gate a CLASSIFIER_BACKEND switch.
+"""
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+from .classifier import (
+    MODEL_NAME, BACKEND_PYTORCH, BACKEND_ONNX, BACKEND_ONNX_INT8,
+    load_backend, onnx_model_path, preprocess, pretrained_kwargs,
+)
+
+IMAGE_EXTS = (".png", ".jpg", ".jpeg")
+
+
+def _list_images(directory: str) -> list:
+    paths = []
+    for ext in IMAGE_EXTS:
+        paths.extend(glob.glob(os.path.join(directory, f"**/*{ext}"), recursive=True))
+    if not paths:
+        raise SystemExit(f"No images found under {directory}")
+    return sorted(paths)
+
+
+def _load_inputs(paths: list) -> list:
+    return [preprocess(Image.open(p).convert("RGB")) for p in paths]
+
+
+def _rss_bytes() -> int:
+    """Current resident set size of this process."""
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+# ---------------- EXPORT / QUANTIZE ----------------
+
+def export_onnx(output_path: str = None, opset: int = 17) -> str:
+    import torch
+    from transformers import AutoModelForImageClassification
+
+    output_path = output_path or onnx_model_path(quantized=False)
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+
+    class _LogitsOnly(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, pixel_values):
+            return self.model(pixel_values=pixel_values).logits
+
+    model = _LogitsOnly(AutoModelForImageClassification.from_pretrained(MODEL_NAME, **pretrained_kwargs()).eval())
+    dummy = torch.randn(1, 3, 224, 224)
+    torch.onnx.export(
+        model, (dummy,), output_path,
+        input_names=["pixel_values"], output_names=["logits"],
+        dynamic_axes={"pixel_values": {0: "batch"}, "logits": {0: "batch"}},
+        opset_version=opset,
+    )
+    print(f"Exported {MODEL_NAME} → {output_path}")
+    return output_path
+
+
+class _CalibrationReader:
+    """Feeds preprocessed calibration images to ONNX Runtime static quantization."""
+
+    def __init__(self, paths: list, input_name: str = "pixel_values"):
+        self._inputs = iter(_load_inputs(paths))
+        self._input_name = input_name
+
+    def get_next(self):
+        pixel_values = next(self._inputs, None)
+        return None if pixel_values is None else {self._input_name: pixel_values}
+
+
+def quantize_int8(input_path: str = None, output_path: str = None, calibration_dir: str = None) -> str:
+    """
+    int8-quantize the exported model. With calibration images a static QDQ model is
+    produced (quantizes the convolutions); otherwise weights-only dynamic quantization.
+    """
+    from onnxruntime.quantization import QuantType, QuantFormat, quantize_dynamic, quantize_static
+
+    input_path = input_path or onnx_model_path(quantized=False)
+    output_path = output_path or onnx_model_path(quantized=True)
+
+    if calibration_dir:
+        quantize_static(
+            input_path, output_path,
+            _CalibrationReader(_list_images(calibration_dir)),
+            quant_format=QuantFormat.QDQ,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+            per_channel=True,
+        )
+    else:
+        quantize_dynamic(input_path, output_path, weight_type=QuantType.QInt8)
+    print(f"Quantized {input_path} → {output_path}")
+    return output_path
+
+
+# ---------------- VALIDATE ----------------
+
+def top1(backend_name: str, inputs: list) -> np.ndarray:
+    backend = load_backend(backend_name)
+    return np.array([int(np.argmax(backend.predict(x)[0])) for x in inputs])
+
+
+def validate(images_dir: str, backends: list, min_agreement: float) -> dict:
+    inputs = _load_inputs(_list_images(images_dir))
+    reference = top1(BACKEND_PYTORCH, inputs)
+
+    report = {"images": len(inputs), "agreement": {}}
+    for name in backends:
+        preds = top1(name, inputs)
+        report["agreement"][name] = {
+            "top1_agreement": round(float((preds == reference).mean()), 4),
+            "mismatches": int((preds != reference).sum()),
+        }
+    report["passed"] = all(a["top1_agreement"] >= min_agreement for a in report["agreement"].values())
+    return report
+
+
+# ---------------- BENCHMARK ----------------
+
+def _benchmark_one(backend_name: str, images_dir: str, runs: int, warmup: int, queue):
+    # Runs in a fresh process so RSS reflects only this backend
+    inputs = _load_inputs(_list_images(images_dir))
+    rss_before = _rss_bytes()
+
+    t0 = time.perf_counter()
+    backend = load_backend(backend_name)
+    load_s = time.perf_counter() - t0
+
+    for x in inputs[:warmup]:
+        backend.predict(x)
+
+    latencies = []
+    for _ in range(runs):
+        for x in inputs:
+            t = time.perf_counter()
+            backend.predict(x)
+            latencies.append((time.perf_counter() - t) * 1000)
+
+    lat = np.array(latencies)
+    queue.put({
+        "backend": backend_name,
+        "load_s": round(load_s, 2),
+        "latency_ms_p50": round(float(np.percentile(lat, 50)), 2),
+        "latency_ms_p95": round(float(np.percentile(lat, 95)), 2),
+        "latency_ms_mean": round(float(lat.mean()), 2),
+        "rss_mb": round(_rss_bytes() / 2**20, 1),
+        "rss_model_mb": round((_rss_bytes() - rss_before) / 2**20, 1),
+        "samples": len(latencies),
+    })
+
+
+def benchmark(images_dir: str, backends: list, runs: int = 5, warmup: int = 5) -> list:
+    ctx = multiprocessing.get_context("spawn")
+    results = []
+    for name in backends:
+        queue = ctx.Queue()
+        proc = ctx.Process(target=_benchmark_one, args=(name, images_dir, runs, warmup, queue))
+        proc.start()
+        results.append(queue.get())
+        proc.join()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ONNX tooling for the document classifier")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_export = sub.add_parser("export")
+    p_export.add_argument("--output")
+    p_export.add_argument("--opset", type=int, default=17)
+
+    p_quant = sub.add_parser("quantize")
+    p_quant.add_argument("--input")
+    p_quant.add_argument("--output")
+    p_quant.add_argument("--calibration", help="directory of representative page images")
+
+    all_backends = [BACKEND_PYTORCH, BACKEND_ONNX, BACKEND_ONNX_INT8]
+    p_val = sub.add_parser("validate")
+    p_val.add_argument("--images", required=True)
+    p_val.add_argument("--backends", nargs="+", default=[BACKEND_ONNX, BACKEND_ONNX_INT8])
+    p_val.add_argument("--min-agreement", type=float, default=0.99)
+
+    p_bench = sub.add_parser("benchmark")
+    p_bench.add_argument("--images", required=True)
+    p_bench.add_argument("--backends", nargs="+", default=all_backends)
+    p_bench.add_argument("--runs", type=int, default=5)
+    p_bench.add_argument("--warmup", type=int, default=5)
+
+    args = parser.parse_args(argv)
+    if args.command == "export":
+        export_onnx(args.output, args.opset)
+    elif args.command == "quantize":
+        quantize_int8(args.input, args.output, args.calibration)
+    elif args.command == "validate":
+        report = validate(args.images, args.backends, args.min_agreement)
+        print(json.dumps(report, indent=2))
+        if not report["passed"]:
+            sys.exit(1)
+    elif args.command == "benchmark":
+        print(json.dumps(benchmark(args.images, args.backends, args.runs, args.warmup), indent=2))
+
+
+if __name__ == "__main__":
+    main()
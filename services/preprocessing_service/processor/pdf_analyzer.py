@@ -0,0 +1,134 @@
+import tempfile
+from common.config.settings import settings
+from common.utils.logger import get_logger
+from .converter import FITZ_LOCK, TEMP_PREFIX, open_pdf, render_page
+
+logger = get_logger("preprocessing_pdf_analyzer", sample_rate=settings.LOG_PAGE_SAMPLE_RATE)
+
+# Looks at what a PDF page is made of before deciding whether to rasterize it:
+#
+#   scanned  a single upright image covering the page (with at most an invisible OCR
+#            layer on top): the embedded JPEG / PNG is the page, taken as-is
+#   digital  a text layer of at least PDF_TEXT_MIN_CHARS: the text is read directly for
+#            classification and OCR; the page is still rendered for its image, but the
+#            enhancement stages are skipped
+#   render   anything else (vector art, several images, masks, CMYK): rendered at 2x
+
+SCANNED = "scanned"
+DIGITAL = "digital"
+RENDER = "render"
+
+_NATIVE_FORMATS = {"jpeg": "jpg", "jpg": "jpg", "png": "png"}
+RENDER_ZOOM = 2  # render_page's fitz.Matrix(2, 2)
+
+
+def _visible_text(page) -> bool:
+    """Text drawn in any render mode but 3 (invisible, as OCR layers are)."""
+    try:
+        return any(span.get("type") != 3 for span in page.get_texttrace())
+    except Exception:
+        return True  # can't tell: assume the text shows and render the page
+
+
+def _full_page_image(page, has_text: bool):
+    """get_image_info() entry of the one upright image covering the page, or None."""
+    import fitz
+
+    if page.rotation:
+        return None
+    infos = page.get_image_info(xrefs=True)
+    if len(infos) != 1 or not infos[0].get("xref"):  # xref 0: inline image
+        return None
+    info = infos[0]
+    a, b, c, d, _, _ = info["transform"]
+    if abs(b) > 1e-3 or abs(c) > 1e-3 or a <= 0 or d <= 0:
+        return None  # rotated or mirrored on the page
+    if info.get("colorspace") not in (1, 3):
+        return None  # CMYK, indexed or a stencil mask: rendering gets the colours right
+    covered = (fitz.Rect(info["bbox"]) & page.rect).get_area()
+    if covered < settings.PDF_IMAGE_MIN_COVERAGE * page.rect.get_area():
+        return None
+    if max(info["width"] / page.rect.width, info["height"] / page.rect.height) > \
+            settings.PDF_NATIVE_MAX_SCALE * RENDER_ZOOM:
+        return None  # enhancing a 600 dpi original costs more than rendering it down
+    if has_text and _visible_text(page):
+        return None
+    return info
+
+
+def extract_image(doc, info: dict):
+    """(encoded bytes, file extension) of an embedded image as stored, or None if unusable."""
+    extracted = doc.extract_image(info["xref"])
+    if not extracted or extracted.get("smask"):
+        return None  # transparency only looks right composited, i.e. rendered
+    ext = _NATIVE_FORMATS.get(extracted["ext"])
+    if ext is None:
+        return None  # JPX, JBIG2, ...: not every decoder downstream reads them
+    return extracted["image"], ext
+
+
+def analyze_page(page) -> dict:
+    """
+    {"kind", "text", "image", "native"}: what the page is made of. For scanned pages
+    image is its get_image_info() entry and native the (bytes, extension) to store.
+    """
+    text = page.get_text("text").strip()
+    image = _full_page_image(page, bool(text)) if settings.PDF_NATIVE_EXTRACTION else None
+    native = extract_image(page.parent, image) if image else None
+    if native:
+        kind = SCANNED
+    elif image:
+        kind = RENDER  # a scan in a form we can't take as-is: render it
+    elif settings.PDF_NATIVE_EXTRACTION and len(text) >= settings.PDF_TEXT_MIN_CHARS:
+        kind = DIGITAL
+    else:
+        kind = RENDER
+    return {"kind": kind, "text": text, "image": image, "native": native}
+
+
+def page_dimensions(page, analysis: dict) -> tuple:
+    """(width, height, channels) of the image page_image will produce for an analyzed page."""
+    if analysis["kind"] == SCANNED:
+        info = analysis["image"]
+        return info["width"], info["height"], 1 if info.get("colorspace") == 1 else 3
+    return int(page.rect.width * RENDER_ZOOM), int(page.rect.height * RENDER_ZOOM), 3
+
+
+def page_image(doc, page, analysis: dict) -> tuple:
+    """(local image path, "embedded" | "rendered") for an analyzed page; the caller removes it."""
+    if analysis["kind"] == SCANNED:
+        data, ext = analysis["native"]
+        with tempfile.NamedTemporaryFile(prefix=TEMP_PREFIX, suffix=f"_page{page.number}.{ext}",
+                                         delete=False) as f:
+            f.write(data)
+        return f.name, "embedded"
+    return render_page(page), "rendered"
+
+
+def iter_pdf_pages(pdf_path, pages=None, reserve=None):
+    """
+    Like converter.iter_pdf_images, but rasterizes only pages that need it. Yields
+    (0-based index, local image path, content, reservation) where content is
+    {"kind", "source", "text"}. reserve((width, height, channels)), if given, is called
+    with page_dimensions once a page is analyzed and before it is extracted or rendered,
+    outside FITZ_LOCK as it may wait; its result is yielded as the reservation (else
+    None). The caller owns the yielded files and reservations and must release them.
+    """
+    with open_pdf(pdf_path) as doc:
+        with FITZ_LOCK:
+            indices = range(doc.page_count) if pages is None else pages
+        for i in indices:
+            with FITZ_LOCK:
+                page = doc[i]
+                analysis = analyze_page(page)
+                dimensions = page_dimensions(page, analysis)
+            reservation = reserve(dimensions) if reserve else None
+            try:
+                with FITZ_LOCK:
+                    img_path, source = page_image(doc, page, analysis)
+            except BaseException:
+                if reservation is not None:
+                    reservation.release()
+                raise
+            logger.info("Page %d of %s is %s, image %s", i + 1, pdf_path, analysis["kind"], source)
+            yield i, img_path, {"kind": analysis["kind"], "source": source, "text": analysis["text"]}, reservation
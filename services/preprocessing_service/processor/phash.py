@@ -0,0 +1,54 @@
+import cv2
+import numpy as np
+
+# 64-bit perceptual hashes of a grayscale page, used for near-duplicate detection.
+# Hashes are Python ints in [0, 2**64); the DB stores them as signed BIGINT.
+
+CHUNKS = 4
+CHUNK_BITS = 16
+
+# below this grayscale std-dev (on the 32x32 thumbnail) a page is blank and its hash
+# would match every other blank page
+MIN_STD = 2.0
+
+
+def _pack(bits: np.ndarray) -> int:
+    return int.from_bytes(np.packbits(bits.astype(np.uint8)).tobytes(), "big")
+
+
+def phash(small: np.ndarray) -> int:
+    """DCT hash: low 8x8 frequencies of the 32x32 thumbnail against their median (DC excluded)."""
+    low = cv2.dct(small.astype(np.float32))[:8, :8].flatten()
+    return _pack(low > np.median(low[1:]))
+
+
+def dhash(gray: np.ndarray) -> int:
+    """Gradient hash: is each pixel of a 9x8 thumbnail brighter than its left neighbour."""
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    return _pack(small[:, 1:] > small[:, :-1])
+
+
+def page_hashes(gray: np.ndarray):
+    """{"phash", "dhash"} for a uint8 grayscale page, or None for a blank page."""
+    small = cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA)
+    if small.std() < MIN_STD:
+        return None
+    return {"phash": phash(small), "dhash": dhash(gray)}
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def chunks(h: int) -> list:
+    """The four 16-bit chunks of a 64-bit hash, most significant first."""
+    mask = (1 << CHUNK_BITS) - 1
+    return [(h >> (CHUNK_BITS * (CHUNKS - 1 - i))) & mask for i in range(CHUNKS)]
+
+
+def to_signed(h: int) -> int:
+    return h - (1 << 64) if h >= 1 << 63 else h
+
+
+def to_unsigned(h: int) -> int:
+    return h + (1 << 64) if h < 0 else h
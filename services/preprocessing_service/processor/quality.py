@@ -0,0 +1,84 @@
+import cv2
+import numpy as np
+from common.config.settings import settings
+
+# Stage names understood by both enhancement paths
+STAGE_DESKEW = "deskew"
+STAGE_CLAHE = "clahe"
+STAGE_DEBLUR = "deblur"
+ALL_STAGES = (STAGE_DESKEW, STAGE_CLAHE, STAGE_DEBLUR)
+
+
+def _to_gray(img: np.ndarray) -> np.ndarray:
+    if img.ndim == 2:
+        return img
+    if img.shape[2] == 4:
+        return cv2.cvtColor(img, cv2.COLOR_BGRA2GRAY)
+    return cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+
+
+def estimate_skew(gray: np.ndarray) -> float:
+    """Skew angle in degrees, normalised to [-45, 45], from the dark (ink) pixels."""
+    _, ink = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    coords = cv2.findNonZero(ink)
+    # a near-blank page has no meaningful orientation
+    if coords is None or len(coords) < 0.001 * gray.size:
+        return 0.0
+    angle = cv2.minAreaRect(coords)[-1]
+    # OpenCV < 4.5 reports [-90, 0), newer versions (0, 90] — fold both into [-45, 45]
+    if angle > 45:
+        angle -= 90
+    elif angle < -45:
+        angle += 90
+    return float(angle)
+
+
+def analyze_quality(img: np.ndarray) -> dict:
+    """
+    Cheap quality measurements on a downsampled grayscale copy of a BGR/grayscale page.
+    """
+    h, w = img.shape[:2]
+    gray = _to_gray(img)
+
+    max_side = settings.QUALITY_ANALYSIS_MAX_SIDE
+    scale = min(1.0, max_side / float(max(h, w)))
+    if scale < 1.0:
+        gray = cv2.resize(gray, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+
+    blur = cv2.Laplacian(gray, cv2.CV_32F).var()
+    p2, p98 = np.percentile(gray, (2, 98))
+
+    return {
+        "width": int(w),
+        "height": int(h),
+        "megapixels": round(w * h / 1e6, 2),
+        "blur_laplacian_var": round(float(blur), 2),
+        "contrast_std": round(float(gray.std()), 2),
+        "dynamic_range": int(p98 - p2),
+        "skew_deg": round(estimate_skew(gray), 2),
+    }
+
+
+def select_stages(metrics: dict) -> list:
+    """Pick the enhancement stages a page actually needs from its quality metrics."""
+    stages = []
+    # larger angles are usually photo framing, not a skewed scan — leave those alone
+    if settings.QUALITY_SKEW_THRESHOLD_DEG <= abs(metrics["skew_deg"]) <= settings.QUALITY_SKEW_MAX_DEG:
+        stages.append(STAGE_DESKEW)
+    if (metrics["contrast_std"] < settings.QUALITY_CONTRAST_THRESHOLD
+            or metrics["dynamic_range"] < settings.QUALITY_DYNAMIC_RANGE_THRESHOLD):
+        stages.append(STAGE_CLAHE)
+    # a thumbnail-sized page looks soft for lack of pixels, not focus: sharpening it only
+    # amplifies noise and JPEG blocking
+    if (metrics["blur_laplacian_var"] < settings.QUALITY_BLUR_THRESHOLD
+            and metrics["megapixels"] >= settings.QUALITY_MIN_DEBLUR_MEGAPIXELS):
+        stages.append(STAGE_DEBLUR)
+    return stages
+
+
+def quality_gate(img: np.ndarray) -> dict:
+    """Analyze a page and return its metrics together with the selected stages."""
+    if not settings.QUALITY_GATE_ENABLED:
+        return {"metrics": None, "stages": list(ALL_STAGES)}
+    metrics = analyze_quality(img)
+    return {"metrics": metrics, "stages": select_stages(metrics)}
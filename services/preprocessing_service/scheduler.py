@@ -0,0 +1,205 @@
+# services/preprocessing_service/scheduler.py
+"""
+Memory-budget page scheduler for a preprocessing worker process.
+
+Every page reserves its estimated working set against one per-process budget shared by
+all batches the process is running, before any of its pixels exist: a PDF page from the
+size it will be extracted or rendered at (pdf_analyzer.page_dimensions, in the
+render-ahead thread), an image from its header before it is decoded. Once the page is
+enhanced the reservation shrinks to the encoded output and is held until the upload of
+it is done, so pages rendered ahead and pages waiting to upload all count. A page that
+does not fit waits until others release enough; a page larger than the whole budget is
+admitted only when nothing else holds a reservation, so it can't deadlock.
+
+Peak RSS is sampled while each job runs and reported next to the estimates, so the
+estimate factors and WORKER_MEMORY_BUDGET_BYTES can be calibrated from real jobs.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+from common.config.settings import settings
+from common.utils.logger import get_logger
+
+logger = get_logger("preprocessing_scheduler")
+
+# Bytes held per page pixel while a page is enhanced, on top of the decoded input
+# (channels bytes/pixel): the uint8 gray copy, the engine's two ping-pong buffers and
+# the encoded output, plus stage temporaries. Wiener works in float32 with complex
+# spectra, so it dominates when enabled.
+_BASE_BYTES_PER_PIXEL = 1 + 2 + 1
+_STAGE_BYTES_PER_PIXEL = {
+    "deblur": 1,
+    "clahe": 1,
+    "deskew": 1,
+    "wiener": 4 + 8 + 8 + 4,  # work, spectrum, filtered spectrum, real output
+    "limit_width": 1,
+}
+
+
+def bytes_per_pixel(stages: list = None, channels: int = 3) -> float:
+    names = stages if stages is not None else [s.strip() for s in settings.ENHANCE_STAGES.split(",") if s.strip()]
+    per_pixel = channels + _BASE_BYTES_PER_PIXEL + sum(_STAGE_BYTES_PER_PIXEL.get(n, 1) for n in names)
+    return per_pixel * settings.PAGE_MEMORY_SAFETY_FACTOR
+
+
+def estimate_page_bytes(width: int, height: int, channels: int = 3) -> int:
+    """Estimated peak working set of enhancing one width x height page."""
+    return int(width * height * bytes_per_pixel(channels=channels)) + settings.PAGE_MEMORY_OVERHEAD_BYTES
+
+
+def image_dimensions(path: str) -> tuple:
+    """(width, height, channels) from the image header, without decoding the pixels."""
+    from PIL import Image
+
+    with Image.open(path) as img:
+        return img.width, img.height, len(img.getbands())
+
+
+# ---------------- BUDGET ----------------
+
+def _memory_limit() -> int:
+    """The container's cgroup memory limit, else the host's MemTotal."""
+    for path in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        try:
+            with open(path) as f:
+                raw = f.read().strip()
+            if raw.isdigit() and int(raw) < 1 << 60:  # v1 reports "unlimited" as a huge number
+                return int(raw)
+        except OSError:
+            continue
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemTotal:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 4 * 1024 ** 3
+
+
+class Reservation:
+    """Bytes held against a MemoryBudget until release()."""
+
+    def __init__(self, budget, nbytes: int):
+        self._budget = budget
+        self.nbytes = nbytes
+        self._released = False
+
+    def shrink(self, nbytes: int):
+        """Hand back all but nbytes, e.g. once only the encoded output is still held."""
+        with self._budget._cond:
+            if self._released or nbytes >= self.nbytes:
+                return
+            self._budget.in_use -= self.nbytes - nbytes
+            self.nbytes = nbytes
+            self._budget._cond.notify_all()
+
+    def release(self):
+        """Idempotent, so every path that may own the reservation can call it."""
+        with self._budget._cond:
+            if self._released:
+                return
+            self._released = True
+        self._budget.release(self.nbytes)
+
+
+class MemoryBudget:
+    def __init__(self, budget_bytes: int):
+        self.budget_bytes = budget_bytes
+        self.in_use = 0
+        self.running = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, nbytes: int) -> float:
+        """Block until nbytes fit (or nothing else runs); returns seconds waited."""
+        t0 = time.perf_counter()
+        with self._cond:
+            while self.running and self.in_use + nbytes > self.budget_bytes:
+                self._cond.wait()
+            self.in_use += nbytes
+            self.running += 1
+        return time.perf_counter() - t0
+
+    def release(self, nbytes: int):
+        with self._cond:
+            self.in_use -= nbytes
+            self.running -= 1
+            self._cond.notify_all()
+
+    def hold(self, nbytes: int, usage: dict = None) -> Reservation:
+        """acquire() as a Reservation the caller hands on and releases when the page is done."""
+        waited = self.acquire(nbytes)
+        if usage is not None:
+            usage["budget_wait_s"] = usage.get("budget_wait_s", 0.0) + waited
+            usage["estimated_peak_page_bytes"] = max(usage.get("estimated_peak_page_bytes", 0), nbytes)
+        if nbytes > self.budget_bytes:
+            logger.warning("Page needs ~%d MiB, more than the %d MiB budget; running it alone",
+                           nbytes >> 20, self.budget_bytes >> 20)
+        return Reservation(self, nbytes)
+
+    @contextmanager
+    def reserve(self, nbytes: int, usage: dict = None):
+        reservation = self.hold(nbytes, usage)
+        try:
+            yield reservation
+        finally:
+            reservation.release()
+
+    def snapshot(self) -> dict:
+        with self._cond:
+            return {"budget_bytes": self.budget_bytes, "in_use_bytes": self.in_use, "running_pages": self.running}
+
+
+_budget = None
+_budget_lock = threading.Lock()
+
+
+def get_budget() -> MemoryBudget:
+    global _budget
+    with _budget_lock:
+        if _budget is None:
+            budget = settings.WORKER_MEMORY_BUDGET_BYTES or int(_memory_limit() * settings.WORKER_MEMORY_BUDGET_FRACTION)
+            _budget = MemoryBudget(budget)
+            logger.info("Page memory budget: %d MiB", budget >> 20)
+    return _budget
+
+
+# ---------------- PEAK RSS ----------------
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def current_rss() -> int:
+    """Resident set size of this process in bytes (0 where /proc is unavailable)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+@contextmanager
+def track_peak_rss(usage: dict, interval_s: float = None):
+    """
+    Sample RSS in a background thread while the block runs and store rss_start_bytes and
+    peak_rss_bytes in `usage`. RSS is per process, so concurrent jobs see each other.
+    """
+    interval_s = settings.RSS_SAMPLE_INTERVAL_S if interval_s is None else interval_s
+    start = current_rss()
+    peak = [start]
+    done = threading.Event()
+
+    def _sample():
+        while not done.wait(interval_s):
+            peak[0] = max(peak[0], current_rss())
+
+    sampler = threading.Thread(target=_sample, name="rss-sampler", daemon=True)
+    sampler.start()
+    try:
+        yield usage
+    finally:
+        done.set()
+        sampler.join()
+        usage["rss_start_bytes"] = start
+        usage["peak_rss_bytes"] = max(peak[0], current_rss())
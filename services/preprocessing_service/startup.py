@@ -0,0 +1,106 @@
+# services/preprocessing_service/startup.py
+import importlib
+import threading
+import time
+from common.config.settings import settings
+from common.utils.logger import get_logger
+
+logger = get_logger("preprocessing_startup")
+
+# Imported lazily by the pipeline; warmed up here so the first request doesn't pay for them
+HEAVY_MODULES = ["fitz"]
+
+_ready = threading.Event()
+_lock = threading.Lock()
+_report = {
+    "state": "starting",
+    "imports_s": {},
+    "models_s": {},
+    "total_s": None,
+    "error": None,
+}
+
+
+def _timed(section: str, name: str, fn):
+    t0 = time.perf_counter()
+    result = fn()
+    elapsed = round(time.perf_counter() - t0, 3)
+    record(section, name, elapsed)
+    logger.info(f"Startup: {name} took {elapsed}s")
+    return result
+
+
+def record(section: str, name: str, seconds: float):
+    with _lock:
+        _report[section][name] = round(seconds, 3)
+
+
+def _backend_modules() -> list:
+    if settings.CLASSIFIER_BACKEND.startswith("onnx"):
+        return ["onnxruntime", "transformers"]
+    return ["torch", "transformers"]
+
+
+def warmup():
+    """Import heavy modules, load the classifier and run one inference, timing each step."""
+    from .processor import classifier
+
+    t0 = time.perf_counter()
+    try:
+        with _lock:
+            _report["state"] = "warming_up"
+        for module in HEAVY_MODULES + _backend_modules():
+            _timed("imports_s", module, lambda m=module: importlib.import_module(m))
+
+        _timed("models_s", "image_processor", classifier.get_processor)
+        _timed("models_s", f"classifier:{settings.CLASSIFIER_BACKEND}", classifier.get_backend)
+
+        from PIL import Image
+        blank = Image.new("RGB", (224, 224), "white")
+        _timed("models_s", "first_inference",
+               lambda: classifier.get_backend().predict(classifier.preprocess(blank)))
+
+        with _lock:
+            _report["state"] = "ready"
+        _ready.set()
+    except Exception as e:
+        logger.exception("Warmup failed")
+        with _lock:
+            _report["state"] = "failed"
+            _report["error"] = str(e)
+    finally:
+        with _lock:
+            _report["total_s"] = round(time.perf_counter() - t0, 3)
+        logger.info(f"Startup report: {get_report()}")
+
+
+def start_warmup():
+    """Run warmup off the event loop so /health answers while models load."""
+    threading.Thread(target=warmup, name="preprocessing-warmup", daemon=True).start()
+
+
+def is_ready() -> bool:
+    return _ready.is_set()
+
+
+def get_report() -> dict:
+    with _lock:
+        return {
+            **_report,
+            "imports_s": dict(_report["imports_s"]),
+            "models_s": dict(_report["models_s"]),
+        }
+
+
+def prefetch_models():
+    """Populate MODEL_CACHE_DIR from the Hub so workers can start with MODEL_OFFLINE=true."""
+    from transformers import AutoImageProcessor, AutoModelForImageClassification
+    from .processor.classifier import MODEL_NAME
+
+    AutoImageProcessor.from_pretrained(MODEL_NAME, cache_dir=settings.MODEL_CACHE_DIR)
+    AutoModelForImageClassification.from_pretrained(MODEL_NAME, cache_dir=settings.MODEL_CACHE_DIR)
+    logger.info(f"Cached {MODEL_NAME} in {settings.MODEL_CACHE_DIR}")
+
+
+if __name__ == "__main__":
+    prefetch_models()
@@ -0,0 +1,416 @@
+"""
+Reprocess stored documents after the enhancement or classification pipeline changed.
+
+Every page result carries the PIPELINE_VERSION that produced it (additional_meta.pages).
+A document is selected when any of its pages was made by another version, or when it has
+none (failed or never processed). --force selects every document that matches the filters.
+
+Sources:
+
+db     FileMetadata rows, streamed in id order through a server-side cursor, filtered by
+       --date-from/--date-to (created_at), --branch and --file-type
+minio  the original objects in MINIO_BUCKET, listed page by page (optionally under
+       --prefix and between --date-from/--date-to by last_modified). Rows are looked up
+       per chunk of batches to check their version. Use it for objects without rows
+
+Consecutive documents of one batch form one job, with up to --max-files files. Jobs run
+either
+
+celery   through enqueue_preprocess as low-priority work, so the fair scheduler gives
+         live uploads precedence. Dispatch pauses while more than --max-queue jobs wait
+local    in a pool of --workers processes calling process_batch's code directly; results
+         still go through the status stream, so outbox_consumer must be running
+
+Both are throttled to --rate jobs per second. Progress is saved to --checkpoint every
+BACKFILL_CHECKPOINT_INTERVAL_S as the position below which every job is done. The next
+run with the same arguments resumes there. Throughput and ETA are logged as it runs,
+and a JSON summary is printed at the end.
+
+In celery mode a job counts as done only once every one of its rows reports --version,
+checked every BACKFILL_CHECKPOINT_INTERVAL_S; jobs still queued, lost or failed hold the
+checkpoint back, and the summary counts them as unconfirmed_jobs. Resuming rescans from
+the oldest of them and skips documents that are up to date by then. With --force the
+rows are at --version already, so completion can't be confirmed and celery mode never
+advances the checkpoint: such a run can't be resumed.
+
+    python -m services.scripts.backfill --date-from 2026-01-01 --date-to 2026-07-01 --dry-run
+    python -m services.scripts.backfill --date-from 2026-01-01 --branch BR-0042 --rate 2
+    python -m services.scripts.backfill --source minio --prefix 0b7e --mode local --workers 4
+"""
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime, timezone
+
+from sqlalchemy import func, select
+
+from common.config.settings import settings
+from common.utils.logger import get_logger
+from services.ingestion_service.db import SessionLocal
+from services.ingestion_service.models import FileMetadata
+
+logger = get_logger("backfill")
+
+DB_LOOKUP_CHUNK = 500
+# under a batch prefix, these are outputs rather than originals
+SKIP_PREFIXES = ("enhanced/",)
+SKIP_SEGMENTS = ("/profiles/",)
+
+
+# ---------------- SELECTION ----------------
+
+def is_current(meta: dict, version: str) -> bool:
+    pages = (meta or {}).get("pages") or {}
+    return bool(pages) and all(p.get("pipeline_version") == version for p in pages.values())
+
+
+def _page_count(meta: dict) -> int:
+    return max(1, len((meta or {}).get("pages") or {}))
+
+
+def _db_filters(args) -> list:
+    filters = []
+    if args.date_from:
+        filters.append(FileMetadata.created_at >= args.date_from)
+    if args.date_to:
+        filters.append(FileMetadata.created_at < args.date_to)
+    if args.branch:
+        filters.append(FileMetadata.branch_id.in_(args.branch))
+    if args.file_type:
+        filters.append(FileMetadata.file_type.in_(args.file_type))
+    return filters
+
+
+def count_db(args, after) -> int:
+    with SessionLocal() as db:
+        return db.execute(select(func.count(FileMetadata.id))
+                          .where(*_db_filters(args), FileMetadata.id > (after or 0))).scalar_one()
+
+
+def iter_db(args, after):
+    """(cursor, batch_id, minio_path, pages, current) per row after `after` (an id), in id order."""
+    stmt = (
+        select(FileMetadata.id, FileMetadata.batch_id, FileMetadata.minio_path, FileMetadata.additional_meta)
+        .where(*_db_filters(args), FileMetadata.id > (after or 0))
+        .order_by(FileMetadata.id)
+        .execution_options(yield_per=DB_LOOKUP_CHUNK)  # server-side cursor on Postgres
+    )
+    with SessionLocal() as db:
+        for record_id, batch_id, minio_path, meta in db.execute(stmt):
+            yield record_id, batch_id, minio_path, _page_count(meta), is_current(meta, args.version)
+
+
+def _rows_by_path(paths: list) -> dict:
+    with SessionLocal() as db:
+        rows = db.execute(select(FileMetadata.minio_path, FileMetadata.additional_meta)
+                          .where(FileMetadata.minio_path.in_(paths)))
+        return {path: meta for path, meta in rows}
+
+
+def confirmed_jobs(jobs: list, version: str) -> list:
+    """The jobs all of whose rows have been reprocessed to `version`."""
+    metas = _rows_by_path([path for job in jobs for path in job["files"]])
+    return [job for job in jobs if all(is_current(metas.get(path), version) for path in job["files"])]
+
+
+def iter_minio(args, after):
+    """(cursor, batch_id, minio_path, pages, current) per original object after `after` (a key)."""
+    from services.ingestion_service.minio_client import get_minio_client
+
+    client = get_minio_client()
+    bucket = args.bucket
+    date_from = args.date_from.timestamp() if args.date_from else None
+    date_to = args.date_to.timestamp() if args.date_to else None
+
+    def _chunk_out(chunk):
+        metas = _rows_by_path([path for _, path in chunk])
+        for key, path in chunk:
+            meta = metas.get(path)
+            yield key, key.split("/", 1)[0], path, _page_count(meta), is_current(meta, args.version)
+
+    chunk = []
+    # minio-py pages the listing (1000 keys per request) as it is iterated
+    for obj in client.list_objects(bucket, prefix=args.prefix or None, recursive=True, start_after=after or None):
+        key = obj.object_name
+        if key.startswith(SKIP_PREFIXES) or any(s in key for s in SKIP_SEGMENTS) or "/" not in key:
+            continue
+        modified = obj.last_modified.timestamp() if obj.last_modified else None
+        if modified is not None and ((date_from and modified < date_from) or (date_to and modified >= date_to)):
+            continue
+        chunk.append((key, f"{bucket}/{key}"))
+        if len(chunk) >= DB_LOOKUP_CHUNK:
+            yield from _chunk_out(chunk)
+            chunk = []
+    if chunk:
+        yield from _chunk_out(chunk)
+
+
+def iter_jobs(documents, max_files: int, stats: dict):
+    """Group consecutive out-of-date documents of one batch into jobs."""
+    job = None
+    for cursor, batch_id, path, pages, current in documents:
+        stats["scanned"] += 1
+        if current:
+            stats["up_to_date"] += 1
+            if job is not None:
+                job["cursor"] = cursor  # nothing to do up to here
+            continue
+        if job is not None and (job["batch_id"] != batch_id or len(job["files"]) >= max_files):
+            yield job
+            job = None
+        if job is None:
+            job = {"batch_id": batch_id, "files": [], "pages": 0}
+        job["files"].append(path)
+        job["pages"] += pages
+        job["cursor"] = cursor
+    if job is not None:
+        yield job
+
+
+# ---------------- EXECUTION ----------------
+
+def _run_local(batch_id: str, files: list) -> int:
+    """Worker process: the same code path as POST /process_batch, minus HTTP."""
+    from services.preprocessing_service.main import ProcessItem, _process_batch
+
+    response = _process_batch(batch_id, [ProcessItem(object_path=f) for f in files], {"started": time.time()})
+    return sum(1 for r in response["details"] if r.get("error"))
+
+
+class _RateLimiter:
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.next_at = time.monotonic()
+
+    def wait(self):
+        now = time.monotonic()
+        if self.next_at > now:
+            time.sleep(self.next_at - now)
+        self.next_at = max(now, self.next_at) + self.interval
+
+
+class Checkpoint:
+    """
+    Resume position in a JSON file: the cursor below which every job has finished.
+    Jobs finish out of order, so the cursor advances only past a contiguous run of them.
+    """
+
+    def __init__(self, path: str, key: str):
+        self.path = path
+        self.key = key
+        self.cursor = None
+        self._order = []  # submitted job cursors, oldest first
+        self._done = set()
+        self._saved_at = 0.0
+        if path and os.path.exists(path):
+            with open(path) as f:
+                saved = json.load(f)
+            if saved.get("key") == key:
+                self.cursor = saved["cursor"]
+                logger.info("Resuming from %s at cursor %s", path, self.cursor)
+            else:
+                logger.warning("%s was written for other arguments; starting over", path)
+
+    def submitted(self, cursor):
+        self._order.append(cursor)
+
+    def finished(self, cursor):
+        self._done.add(cursor)
+        while self._order and self._order[0] in self._done:
+            self._done.discard(self._order[0])
+            self.cursor = self._order.pop(0)
+
+    def skipped_to(self, cursor):
+        """Nothing is in flight and everything up to cursor was up to date."""
+        if not self._order:
+            self.cursor = cursor
+
+    def save(self, totals: dict, force: bool = False):
+        if not self.path or (not force and time.monotonic() - self._saved_at < settings.BACKFILL_CHECKPOINT_INTERVAL_S):
+            return
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"key": self.key, "cursor": self.cursor, "totals": totals,
+                       "saved_at": datetime.now(timezone.utc).isoformat(timespec="seconds")}, f)
+        os.replace(tmp, self.path)
+        self._saved_at = time.monotonic()
+
+
+class Progress:
+    def __init__(self, total: int):
+        self.total = total  # documents left to scan; None when unknown (minio source)
+        self.t0 = time.monotonic()
+        self._logged_at = self.t0
+
+    def report(self, stats: dict, force: bool = False) -> dict:
+        now = time.monotonic()
+        elapsed = max(now - self.t0, 1e-6)
+        rate = stats["scanned"] / elapsed
+        snapshot = {
+            "elapsed_s": round(elapsed, 1),
+            "docs_per_s": round(rate, 2),
+            "pages_per_s": round(stats["pages"] / elapsed, 2),
+            "jobs_per_s": round(stats["jobs"] / elapsed, 3),
+        }
+        if self.total:
+            remaining = max(self.total - stats["scanned"], 0)
+            snapshot["eta_s"] = round(remaining / rate) if rate > 0 else None
+        if force or now - self._logged_at >= settings.BACKFILL_REPORT_INTERVAL_S:
+            self._logged_at = now
+            logger.info("Backfill: %d/%s documents scanned, %d jobs (%d pages) handed out, %d up to date, "
+                        "%.1f docs/s, ETA %s s", stats["scanned"], self.total or "?", stats["jobs"], stats["pages"],
+                        stats["up_to_date"], rate, snapshot.get("eta_s"))
+        return snapshot
+
+
+def _queue_depth() -> int:
+    from services.ingestion_service.admission import broker_queue_depth
+
+    return broker_queue_depth()
+
+
+def run(args) -> dict:
+    key = hashlib.sha1(json.dumps({
+        "source": args.source, "from": str(args.date_from), "to": str(args.date_to), "branch": args.branch,
+        "type": args.file_type, "prefix": args.prefix, "version": args.version, "force": args.force,
+    }, sort_keys=True).encode()).hexdigest()
+    checkpoint = Checkpoint(args.checkpoint, key)
+    stats = {"scanned": 0, "up_to_date": 0, "jobs": 0, "files": 0, "pages": 0, "failed_jobs": 0, "failed_files": 0}
+
+    total = count_db(args, checkpoint.cursor) if args.source == "db" else None
+    progress = Progress(total)
+    source = iter_db if args.source == "db" else iter_minio
+    documents = source(args, checkpoint.cursor)
+    if args.force:
+        documents = ((c, b, p, n, False) for c, b, p, n, _ in documents)
+    limiter = _RateLimiter(args.rate)
+
+    pool = None
+    if args.mode == "local" and not args.dry_run:
+        # spawn, not fork: children must not inherit this process's DB connections
+        pool = ProcessPoolExecutor(max_workers=args.workers, mp_context=multiprocessing.get_context("spawn"))
+    else:
+        from services.ingestion_service.celery_app import LOW_PRIORITY
+        from services.ingestion_service.utils.file_handler import enqueue_preprocess
+    in_flight = {}  # future → job
+    enqueued = []  # celery jobs whose rows have not yet reported --version, oldest first
+    confirmed_at = [time.monotonic()]
+    if args.mode == "celery" and args.force and not args.dry_run:
+        logger.warning("--force in celery mode: completion can't be confirmed, the checkpoint won't advance")
+
+    def _collect(block: bool):
+        if not in_flight:
+            return
+        finished, _ = wait(list(in_flight), timeout=None if block else 0, return_when=FIRST_COMPLETED)
+        for future in finished:
+            job = in_flight.pop(future)
+            try:
+                failed = future.result()
+                stats["failed_files"] += failed
+            except Exception as e:
+                stats["failed_jobs"] += 1
+                logger.error("Backfill job for batch %s failed: %s", job["batch_id"], e)
+            checkpoint.finished(job["cursor"])
+
+    def _confirm(force: bool = False):
+        """Finish the oldest enqueued jobs that are done; only they can move the checkpoint."""
+        if not enqueued or args.force:
+            return
+        if not force and time.monotonic() - confirmed_at[0] < settings.BACKFILL_CHECKPOINT_INTERVAL_S:
+            return
+        confirmed_at[0] = time.monotonic()
+        head, files = [], 0
+        for job in enqueued:
+            if files >= DB_LOOKUP_CHUNK:
+                break
+            head.append(job)
+            files += len(job["files"])
+        for job in confirmed_jobs(head, args.version):
+            enqueued.remove(job)
+            checkpoint.finished(job["cursor"])
+
+    try:
+        for job in iter_jobs(documents, args.max_files, stats):
+            if args.limit and stats["jobs"] >= args.limit:
+                break
+            stats["jobs"] += 1
+            stats["files"] += len(job["files"])
+            stats["pages"] += job["pages"]
+            if args.dry_run:
+                checkpoint.skipped_to(job["cursor"])
+            elif pool is not None:
+                while len(in_flight) >= args.workers * 2:
+                    _collect(block=True)
+                limiter.wait()
+                checkpoint.submitted(job["cursor"])
+                in_flight[pool.submit(_run_local, job["batch_id"], job["files"])] = job
+                _collect(block=False)
+            else:
+                while _queue_depth() >= args.max_queue:
+                    time.sleep(1)
+                limiter.wait()
+                enqueue_preprocess(job["batch_id"], job["files"], job["pages"], LOW_PRIORITY)
+                checkpoint.submitted(job["cursor"])
+                enqueued.append(job)
+                _confirm()
+            if not args.dry_run:
+                checkpoint.save(stats)
+            progress.report(stats)
+        while in_flight:
+            _collect(block=True)
+            checkpoint.save(stats)
+        _confirm(force=True)
+    finally:
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+        if not args.dry_run:
+            checkpoint.save(stats, force=True)
+
+    return {
+        "source": args.source, "mode": "dry-run" if args.dry_run else args.mode, "version": args.version,
+        "total": total, "cursor": checkpoint.cursor, **stats, "unconfirmed_jobs": len(enqueued),
+        **progress.report(stats, force=True),
+    }
+
+
+def _date(value: str) -> datetime:
+    parsed = datetime.fromisoformat(value)
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--source", choices=("db", "minio"), default="db")
+    parser.add_argument("--mode", choices=("celery", "local"), default="celery",
+                        help="celery: the checkpoint advances once rows report --version (never with --force)")
+    parser.add_argument("--date-from", type=_date, help="ISO date/time, inclusive")
+    parser.add_argument("--date-to", type=_date, help="ISO date/time, exclusive")
+    parser.add_argument("--branch", action="append", help="branch_id (repeatable; db source)")
+    parser.add_argument("--file-type", action="append", help="file_type (repeatable; db source)")
+    parser.add_argument("--prefix", help="object key prefix (minio source)")
+    parser.add_argument("--bucket", default=settings.MINIO_BUCKET)
+    parser.add_argument("--version", default=settings.PIPELINE_VERSION, help="target pipeline version")
+    parser.add_argument("--force", action="store_true", help="reprocess documents already at --version")
+    parser.add_argument("--rate", type=float, default=settings.BACKFILL_RATE, help="jobs per second; 0 = unlimited")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="processes (local mode)")
+    parser.add_argument("--max-queue", type=int, default=settings.BACKFILL_MAX_QUEUE_DEPTH,
+                        help="pause while this many jobs wait (celery mode)")
+    parser.add_argument("--max-files", type=int, default=settings.BACKFILL_MAX_FILES_PER_JOB)
+    parser.add_argument("--limit", type=int, default=0, help="stop after this many jobs")
+    parser.add_argument("--checkpoint", default="backfill.checkpoint.json", help="resume file; '' disables")
+    parser.add_argument("--dry-run", action="store_true", help="count what would be reprocessed")
+    args = parser.parse_args(argv)
+    if args.source == "minio" and (args.branch or args.file_type):
+        parser.error("--branch and --file-type need --source db")
+    args.workers = max(1, args.workers)
+    args.max_files = max(1, args.max_files)
+
+    print(json.dumps(run(args), indent=2, default=str), flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Benchmark Celery worker profiles (solo / prefork / threads) on a simulated preprocess_job.
+
+preprocess_job spends almost all of its time waiting on the preprocessing service, so the
+simulated task sleeps for --io-s and burns --cpu-ms of CPU. For every profile a worker is
+started on a private queue, --tasks jobs are enqueued, and completed jobs/sec is reported.
+
+    python -m services.scripts.bench_worker_profiles --tasks 200 --io-s 2 --cpu-ms 50
+"""
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+
+from services.ingestion_service.celery_app import celery, WORKER_PROFILES
+
+BENCH_QUEUE = "bench_worker_profiles"
+
+
+@celery.task(name="bench.simulated_batch")
+def simulated_batch(io_s: float, cpu_ms: float):
+    time.sleep(io_s)
+    deadline = time.perf_counter() + cpu_ms / 1000.0
+    x = 0
+    while time.perf_counter() < deadline:
+        x += 1
+    return x
+
+
+def _start_worker(profile: str, concurrency: int = None) -> subprocess.Popen:
+    env = dict(os.environ, CELERY_WORKER_PROFILE=profile)
+    if concurrency:
+        env["CELERY_WORKER_CONCURRENCY"] = str(concurrency)
+    cmd = [
+        sys.executable, "-m", "celery",
+        "-A", "services.ingestion_service.celery_app.celery",
+        "worker", "--loglevel=warning",
+        "-I", "services.scripts.bench_worker_profiles",
+        "-Q", BENCH_QUEUE, "-n", f"bench-{profile}@%h",
+    ]
+    return subprocess.Popen(cmd, env=env)
+
+
+def _wait_for_worker(name_prefix: str, timeout: float = 60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        replies = celery.control.ping(timeout=1.0) or []
+        if any(name.startswith(name_prefix) for reply in replies for name in reply):
+            return
+    raise RuntimeError(f"Worker {name_prefix} did not come up within {timeout}s")
+
+
+def run_profile(profile: str, tasks: int, io_s: float, cpu_ms: float, concurrency: int = None) -> dict:
+    worker = _start_worker(profile, concurrency)
+    try:
+        _wait_for_worker(f"bench-{profile}@")
+        t0 = time.perf_counter()
+        results = [simulated_batch.apply_async((io_s, cpu_ms), queue=BENCH_QUEUE) for _ in range(tasks)]
+        for r in results:
+            r.get(timeout=3600)
+        elapsed = time.perf_counter() - t0
+    finally:
+        worker.send_signal(signal.SIGTERM)
+        worker.wait(timeout=60)
+
+    return {
+        "profile": profile,
+        "tasks": tasks,
+        "elapsed_s": round(elapsed, 2),
+        "jobs_per_s": round(tasks / elapsed, 2),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profiles", nargs="+", default=list(WORKER_PROFILES))
+    parser.add_argument("--tasks", type=int, default=100)
+    parser.add_argument("--io-s", type=float, default=2.0, help="simulated wait on preprocessing_service")
+    parser.add_argument("--cpu-ms", type=float, default=50.0, help="simulated CPU time per job")
+    parser.add_argument("--concurrency", type=int, help="override the profile's concurrency")
+    args = parser.parse_args(argv)
+
+    print(f"{'profile':<10} {'tasks':>6} {'elapsed_s':>10} {'jobs/s':>8}")
+    for profile in args.profiles:
+        row = run_profile(profile, args.tasks, args.io_s, args.cpu_ms, args.concurrency)
+        print(f"{row['profile']:<10} {row['tasks']:>6} {row['elapsed_s']:>10} {row['jobs_per_s']:>8}")
+
+
+if __name__ == "__main__":
+    main()
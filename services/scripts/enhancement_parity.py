@@ -0,0 +1,120 @@
+"""
+SSIM parity between the ndarray enhancement engine and the implementations it replaced.
+
+Each legacy stage (skimage CLAHE and skimage Wiener) is compared with its engine
+counterpart on the same grayscale input, followed by the legacy pipeline without deskew.
+The legacy "deblur" was a 5x5 box blur; the engine's deblur sharpens instead, so it has
+no legacy counterpart. The legacy deskew measured minAreaRect over every non-zero pixel,
+which under OpenCV >= 4.5 reports a 90° "skew" for any full frame, so deskew is not
+compared.
+
+With --tiled, every tileable stage is instead run full-frame and tiled on the same page
+(at --tile-size, forced on regardless of ENHANCE_TILE_MIN_PIXELS), and the report adds the
+largest per-pixel difference. deblur and deskew should be identical; clahe is close.
+
+    python -m services.scripts.enhancement_parity samples/ --min-ssim 0.9
+    python -m services.scripts.enhancement_parity scans/ --tiled --tile-size 512 --min-ssim 0.98
+
+Exits non-zero if any comparison's minimum SSIM is below --min-ssim.
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+
+import cv2
+import numpy as np
+from skimage import exposure, img_as_ubyte
+from skimage.metrics import structural_similarity
+from skimage.restoration import wiener
+
+from common.config.settings import settings
+from services.preprocessing_service.processor.engine import (
+    EnhancementEngine, stage_deblur, stage_clahe, stage_deskew, stage_wiener, tiled_deblur, tiled_clahe, tiled_deskew,
+)
+from services.preprocessing_service.processor.quality import STAGE_CLAHE, STAGE_DEBLUR
+
+
+# ---------------- LEGACY REFERENCE STAGES ----------------
+
+def legacy_clahe(gray):
+    return (exposure.equalize_adapthist(gray, clip_limit=0.03) * 255).astype(np.uint8)
+
+
+def legacy_wiener(gray):
+    deconvolved = wiener(gray.astype(np.float32) / 255.0, np.ones((3, 3)) / 9.0, balance=0.1)
+    return img_as_ubyte(np.clip(deconvolved, 0, 1))
+
+
+def legacy_pipeline(gray):
+    return legacy_wiener(legacy_clahe(gray))
+
+
+def _engine_stage(fn, ctx=None):
+    return lambda gray: fn(gray, np.empty_like(gray), ctx or {}).copy()
+
+
+COMPARISONS = {
+    "clahe": (legacy_clahe, _engine_stage(stage_clahe)),
+    "wiener": (legacy_wiener, _engine_stage(stage_wiener)),
+    "pipeline (clahe,wiener)": (
+        legacy_pipeline,
+        lambda g: EnhancementEngine(["clahe", "wiener"]).run(g, "gray", [STAGE_DEBLUR, STAGE_CLAHE])[0].copy(),
+    ),
+}
+
+
+# a fixed skew so deskew is exercised on every page, whatever its content
+_SKEW_CTX = {"metrics": {"skew_deg": 3.0}}
+
+TILED_COMPARISONS = {
+    "deblur tiled": (_engine_stage(stage_deblur), _engine_stage(tiled_deblur)),
+    "clahe tiled": (_engine_stage(stage_clahe), _engine_stage(tiled_clahe)),
+    "deskew tiled": (_engine_stage(stage_deskew, _SKEW_CTX), _engine_stage(tiled_deskew, _SKEW_CTX)),
+}
+
+
+def compare(paths: list, comparisons: dict = COMPARISONS) -> dict:
+    scores = {name: [] for name in comparisons}
+    max_diff = {name: 0 for name in comparisons}
+    for path in paths:
+        gray = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+        if gray is None:
+            continue
+        for name, (reference, candidate) in comparisons.items():
+            expected, actual = reference(gray), candidate(gray)
+            scores[name].append(structural_similarity(expected, actual, data_range=255))
+            max_diff[name] = max(max_diff[name], int(cv2.absdiff(expected, actual).max()))
+    return {
+        name: {"min": round(min(v), 4), "mean": round(float(np.mean(v)), 4),
+               "max_abs_diff": max_diff[name], "images": len(v)}
+        for name, v in scores.items() if v
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("images", help="directory of sample page images")
+    parser.add_argument("--min-ssim", type=float, default=0.9)
+    parser.add_argument("--tiled", action="store_true", help="compare tiled against full-frame stages")
+    parser.add_argument("--tile-size", type=int, default=512)
+    args = parser.parse_args(argv)
+
+    paths = sorted(p for ext in ("png", "jpg", "jpeg")
+                   for p in glob.glob(os.path.join(args.images, f"**/*.{ext}"), recursive=True))
+    if not paths:
+        raise SystemExit(f"No images found under {args.images}")
+
+    if args.tiled:
+        settings.ENHANCE_TILE_SIZE = args.tile_size
+        report = compare(paths, TILED_COMPARISONS)
+    else:
+        report = compare(paths)
+    print(json.dumps(report, indent=2))
+    if any(r["min"] < args.min_ssim for r in report.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
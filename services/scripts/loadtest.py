@@ -0,0 +1,464 @@
+"""
+End-to-end load test: synthetic batches → POST /upload → Celery preprocess_job →
+/process_batch → status stream → /batch_status, with per-hop latency percentiles.
+
+Two ways to run it, both fully offline:
+
+  remote      against an already running stack (the docker-compose containers plus the
+              services from start_all.sh)
+      python -m services.scripts.loadtest --target http://localhost:8000 --rate 2 --batches 200
+
+  in-process  MinIO is replaced by an in-memory object store, Redis by fakeredis, Postgres by
+              SQLite and the Celery broker by kombu's memory transport; both services run under
+              uvicorn inside this process on their usual ports (8000 / 8100), the status-event
+              consumer and fair-scheduler dispatcher in threads. The classifier
+              loads from MODEL_CACHE_DIR (prefetch it once with
+              `python -m services.preprocessing_service.startup`). Needs `pip install fakeredis`.
+      python -m services.scripts.loadtest --in-process --rate 1 --batches 50 --seed 7
+
+Batches arrive as a Poisson process (--rate batches/s, open loop): latency is measured from
+each batch's scheduled arrival, so a saturated client does not hide queueing. Each batch holds
+1..--max-files documents drawn from a pre-generated corpus of scanned-looking images and
+multi-page PDFs (--pdf-share, --pdf-pages); the same --seed gives the same corpus and
+arrival schedule.
+
+Hops, from the "timings" each batch carries through the pipeline (epoch seconds, so run
+all services on one host or keep clocks in sync):
+  upload      client POST /upload round trip
+  queue       enqueued → picked up by a Celery worker
+  dispatch    worker → process_batch started
+  process     process_batch started → finished
+  callback    finished → batch event applied by the outbox consumer
+  observe     applied → completion seen by polling /batch_status
+  end_to_end  scheduled arrival → completion seen
+
+A batch is done once every file is "enhanced" or "failed". Batches with a failed file are
+reported as processing_failed, with their own document count, latency and error messages;
+only fully enhanced batches count towards the throughput and hop latencies.
+"""
+import argparse
+import functools
+import hashlib
+import io
+import json
+import os
+import random
+import string
+import sys
+import tempfile
+import threading
+import time
+import types
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from datetime import datetime, timezone
+
+import requests
+
+HOPS = ("upload", "queue", "dispatch", "process", "callback", "observe", "end_to_end")
+FINAL_STATUSES = ("enhanced", "failed")  # FileMetadata.status values no event changes again
+
+INGESTION_PORT = 8000
+PREPROCESSING_PORT = 8100
+
+
+# ---------------- SYNTHETIC DOCUMENTS ----------------
+
+def synth_page(rng, width: int = 1240, height: int = 1754):
+    """A grayscale page of random text lines, with a random mix of skew, blur and low contrast."""
+    import cv2
+    import numpy as np
+
+    page = np.full((height, width), 245, np.uint8)
+    y = 120
+    while y < height - 100:
+        x = 90
+        while x < width - 200:
+            word = "".join(rng.choice(list(string.ascii_letters), size=rng.integers(2, 10)))
+            cv2.putText(page, word, (x, y), cv2.FONT_HERSHEY_SIMPLEX, 0.9, 25, 2, cv2.LINE_AA)
+            x += 22 * len(word) + 20
+        y += int(rng.integers(40, 60))
+
+    if rng.random() < 0.5:
+        angle = float(rng.uniform(-4, 4))
+        M = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+        page = cv2.warpAffine(page, M, (width, height), borderValue=245)
+    if rng.random() < 0.4:
+        page = cv2.GaussianBlur(page, (0, 0), float(rng.uniform(1.0, 2.5)))
+    if rng.random() < 0.4:
+        page = cv2.convertScaleAbs(page, alpha=0.45, beta=110)
+    return page
+
+
+def synth_image(rng) -> tuple:
+    import cv2
+
+    ok, data = cv2.imencode(".jpg", synth_page(rng), [cv2.IMWRITE_JPEG_QUALITY, 85])
+    return data.tobytes(), "image/jpeg", ".jpg", 1
+
+
+def synth_pdf(rng, pages: int) -> tuple:
+    import cv2
+    import fitz
+
+    doc = fitz.open()
+    for _ in range(pages):
+        ok, data = cv2.imencode(".jpg", synth_page(rng), [cv2.IMWRITE_JPEG_QUALITY, 80])
+        page = doc.new_page(width=595, height=842)  # A4 in points
+        page.insert_image(page.rect, stream=data.tobytes())
+    return doc.tobytes(), "application/pdf", ".pdf", pages
+
+
+def build_corpus(size: int, pdf_share: float, pdf_pages: tuple, seed: int) -> list:
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    corpus = []
+    for i in range(size):
+        if rng.random() < pdf_share:
+            data, mime, ext, pages = synth_pdf(rng, int(rng.integers(pdf_pages[0], pdf_pages[1] + 1)))
+        else:
+            data, mime, ext, pages = synth_image(rng)
+        corpus.append({"name": f"loadtest_{i:04d}{ext}", "data": data, "mime": mime, "pages": pages})
+    return corpus
+
+
+# ---------------- IN-PROCESS STAND-INS ----------------
+
+class _Obj:
+    def __init__(self, bucket_name, object_name, data, content_type):
+        self.bucket_name = bucket_name
+        self.object_name = object_name
+        self.data = data
+        self.size = len(data)
+        self.etag = hashlib.md5(data).hexdigest()
+        self.content_type = content_type
+        self.last_modified = datetime.now(timezone.utc)
+        self.is_dir = False
+
+
+class _Response(io.BytesIO):
+    def __init__(self, obj):
+        super().__init__(obj.data)
+        self.headers = {"ETag": f'"{obj.etag}"'}
+
+    def release_conn(self):
+        pass
+
+
+class InMemoryMinio:
+    """The subset of minio.Minio the services use, backed by a dict."""
+
+    def __init__(self):
+        self._objects = {}
+        self._uploads = {}
+        self._lock = threading.Lock()
+
+    def bucket_exists(self, bucket_name):
+        return True
+
+    def make_bucket(self, bucket_name):
+        pass
+
+    def put_object(self, bucket_name, object_name, data, length, content_type="application/octet-stream", **_):
+        obj = _Obj(bucket_name, object_name, data.read(length), content_type)
+        with self._lock:
+            self._objects[(bucket_name, object_name)] = obj
+        return obj
+
+    def _get(self, bucket_name, object_name):
+        from minio.error import S3Error
+
+        obj = self._objects.get((bucket_name, object_name))
+        if obj is None:
+            raise S3Error("NoSuchKey", "Object does not exist", object_name, None, None, None,
+                          bucket_name=bucket_name, object_name=object_name)
+        return obj
+
+    def get_object(self, bucket_name, object_name, **_):
+        return _Response(self._get(bucket_name, object_name))
+
+    def stat_object(self, bucket_name, object_name, **_):
+        return self._get(bucket_name, object_name)
+
+    def list_objects(self, bucket_name, prefix=None, recursive=False, **_):
+        with self._lock:
+            keys = sorted(k for k in self._objects if k[0] == bucket_name and k[1].startswith(prefix or ""))
+        return iter([self._objects[k] for k in keys])
+
+    def remove_objects(self, bucket_name, delete_object_list, **_):
+        with self._lock:
+            for d in delete_object_list:
+                self._objects.pop((bucket_name, d._name), None)
+        return iter(())
+
+    def _create_multipart_upload(self, bucket_name, object_name, headers):
+        upload_id = hashlib.md5(f"{object_name}{time.time()}".encode()).hexdigest()
+        self._uploads[upload_id] = {}
+        return upload_id
+
+    def _upload_part(self, bucket_name, object_name, data, headers, upload_id, part_number):
+        self._uploads[upload_id][part_number] = data
+        return hashlib.md5(data).hexdigest()
+
+    def _complete_multipart_upload(self, bucket_name, object_name, upload_id, parts):
+        chunks = self._uploads.pop(upload_id)
+        data = b"".join(chunks[p.part_number] for p in parts)
+        self.put_object(bucket_name, object_name, io.BytesIO(data), len(data))
+
+    def _abort_multipart_upload(self, bucket_name, object_name, upload_id):
+        self._uploads.pop(upload_id, None)
+
+
+def _serve(app, port: int):
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(app, host="0.0.0.0", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+def start_in_process(stack, workers: int, workdir: str):
+    """Wire the stand-ins into the services, start both apps and a Celery worker thread."""
+    # Settings validation needs values for the external services even though none is used
+    for key, value in {
+        "DB_HOST": "localhost", "DB_PORT": "5432", "DB_NAME": "loadtest", "DB_USER": "loadtest",
+        "DB_PASS": "loadtest", "MINIO_ENDPOINT": "localhost:9000", "MINIO_ACCESS_KEY": "loadtest",
+        "MINIO_SECRET_KEY": "loadtest", "MINIO_BUCKET": "documents", "REDIS_HOST": "localhost",
+        "REDIS_PORT": "6379", "MODEL_OFFLINE": "true",
+    }.items():
+        os.environ.setdefault(key, value)
+
+    try:
+        import fakeredis
+    except ImportError:
+        raise SystemExit("--in-process needs fakeredis: pip install fakeredis")
+    from sqlalchemy import create_engine
+    from celery.contrib.testing.worker import start_worker
+    from common.config import redis_client
+    from services.ingestion_service import db, minio_client as ingestion_minio
+    from services.ingestion_service.celery_app import celery
+    from services.preprocessing_service import db as preprocessing_db, minio_client as preprocessing_minio
+
+    # --- Redis → fakeredis, one shared server for every db ---
+    server = fakeredis.FakeServer()
+    redis_client.redis = types.SimpleNamespace(Redis=functools.partial(fakeredis.FakeRedis, server=server))
+
+    # --- MinIO → in-memory store shared by both services ---
+    store = InMemoryMinio()
+    ingestion_minio.get_minio_client = lambda: store
+    preprocessing_minio.get_minio_client = lambda: store
+
+    # --- Postgres → SQLite file ---
+    engine = create_engine(f"sqlite:///{os.path.join(workdir, 'loadtest.db')}",
+                           connect_args={"check_same_thread": False, "timeout": 30})
+    import services.ingestion_service.models  # noqa: F401 — registers the tables on Base
+    db.Base.metadata.create_all(engine)
+    db.engine = engine
+    db.SessionLocal.configure(bind=engine)
+    preprocessing_db.configure(engine)  # the near-duplicate index (page_hash)
+
+    # --- Celery → memory broker and an in-process worker ---
+    celery.conf.update(broker_url="memory://", result_backend="cache+memory://", broker_transport_options={})
+    stack.enter_context(start_worker(celery, pool="threads", concurrency=workers,
+                                     perform_ping_check=False, loglevel="WARNING", shutdown_timeout=60))
+
+    # --- Status events: a consumer thread applies what preprocessing publishes ---
+    from services.ingestion_service import outbox_consumer
+    threading.Thread(target=outbox_consumer.run, args=("loadtest",), daemon=True).start()
+    from services.ingestion_service import fair_scheduler
+    threading.Thread(target=fair_scheduler.run, daemon=True).start()
+
+    from services.ingestion_service.main import app as ingestion_app
+    from services.preprocessing_service.main import app as preprocessing_app
+    servers = [_serve(ingestion_app, INGESTION_PORT), _serve(preprocessing_app, PREPROCESSING_PORT)]
+    stack.callback(lambda: [setattr(s, "should_exit", True) for s in servers])
+    return f"http://127.0.0.1:{INGESTION_PORT}", f"http://127.0.0.1:{PREPROCESSING_PORT}"
+
+
+def wait_ready(preprocessing_url: str, timeout: float):
+    """Preprocessing answers 503 on /ready until its models are loaded."""
+    deadline = time.time() + timeout
+    last = None
+    while time.time() < deadline:
+        try:
+            r = requests.get(f"{preprocessing_url}/ready", timeout=5)
+            if r.status_code == 200:
+                return
+            last = r.json()
+        except requests.ConnectionError as e:
+            last = str(e)
+        time.sleep(1)
+    raise SystemExit(f"Preprocessing service not ready after {timeout}s: {last}")
+
+
+# ---------------- LOAD GENERATION ----------------
+
+_sessions = threading.local()
+
+
+def _session() -> requests.Session:
+    if not hasattr(_sessions, "s"):
+        _sessions.s = requests.Session()
+    return _sessions.s
+
+
+def run_batch(base_url: str, docs: list, scheduled_at: float, poll_interval: float, timeout: float) -> dict:
+    session = _session()
+    result = {"documents": len(docs), "pages": sum(d["pages"] for d in docs), "scheduled_at": scheduled_at}
+    t_send = time.time()
+    try:
+        r = session.post(f"{base_url}/upload",
+                         files=[("files", (d["name"], d["data"], d["mime"])) for d in docs], timeout=timeout)
+    except requests.RequestException as e:
+        return dict(result, status="failed", error=str(e))
+    t_uploaded = time.time()
+    if r.status_code == 429:
+        return dict(result, status="rejected", retry_after=r.headers.get("Retry-After"))
+    if r.status_code != 200:
+        return dict(result, status="failed", error=f"/upload {r.status_code}: {r.text[:200]}")
+
+    batch_id = r.json()["batch_id"]
+    deadline = t_send + timeout
+    while time.time() < deadline:
+        time.sleep(poll_interval)
+        status = session.get(f"{base_url}/batch_status/{batch_id}", timeout=30)
+        if status.status_code != 200:
+            continue
+        files = status.json()["files"]
+        if files and all(f["status"] in FINAL_STATUSES for f in files):
+            t_done = time.time()
+            timings = next((f["timings"] for f in files if f.get("timings")), None) or {}
+            hops = {"upload": t_uploaded - t_send, "end_to_end": t_done - scheduled_at}
+            if timings.get("enqueued") and timings.get("dispatched"):
+                hops["queue"] = timings["dispatched"] - timings["enqueued"]
+            if timings.get("dispatched") and timings.get("started"):
+                hops["dispatch"] = timings["started"] - timings["dispatched"]
+            if timings.get("started") and timings.get("finished"):
+                hops["process"] = timings["finished"] - timings["started"]
+            if timings.get("finished") and timings.get("callback_received"):
+                hops["callback"] = timings["callback_received"] - timings["finished"]
+                hops["observe"] = t_done - timings["callback_received"]
+            failed = [f for f in files if f["status"] == "failed"]
+            if failed:
+                return dict(result, status="processing_failed", batch_id=batch_id, completed_at=t_done, hops=hops,
+                            failed_documents=len(failed), error=failed[0].get("error") or "unknown")
+            return dict(result, status="completed", batch_id=batch_id, completed_at=t_done, hops=hops)
+    return dict(result, status="timed_out", batch_id=batch_id)
+
+
+def _percentile(sorted_values: list, p: float) -> float:
+    """Nearest-rank percentile."""
+    k = max(0, min(len(sorted_values) - 1, int(round(p / 100.0 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[k]
+
+
+def _latency(results: list) -> dict:
+    latency = {}
+    for hop in HOPS:
+        values = sorted(r["hops"][hop] for r in results if hop in r["hops"])
+        if values:
+            latency[hop] = {
+                "p50": round(_percentile(values, 50), 3),
+                "p95": round(_percentile(values, 95), 3),
+                "p99": round(_percentile(values, 99), 3),
+                "max": round(values[-1], 3),
+                "n": len(values),
+            }
+    return latency
+
+
+def summarize(results: list, started_at: float) -> dict:
+    by_status = {}
+    errors = {}
+    for r in results:
+        by_status[r["status"]] = by_status.get(r["status"], 0) + 1
+        if r.get("error"):
+            errors[r["error"][:200]] = errors.get(r["error"][:200], 0) + 1
+    completed = [r for r in results if r["status"] == "completed"]
+    failed = [r for r in results if r["status"] == "processing_failed"]
+    elapsed = (max(r["completed_at"] for r in completed) - started_at) if completed else 0.0
+
+    documents = sum(r["documents"] for r in completed)
+    pages = sum(r["pages"] for r in completed)
+    return {
+        "batches": dict(by_status, submitted=len(results)),
+        "documents_completed": documents,
+        "pages_completed": pages,
+        "documents_failed": sum(r["failed_documents"] for r in failed),
+        "elapsed_s": round(elapsed, 2),
+        "docs_per_s": round(documents / elapsed, 3) if elapsed else 0.0,
+        "pages_per_s": round(pages / elapsed, 3) if elapsed else 0.0,
+        "latency_s": _latency(completed),
+        "failed_latency_s": _latency(failed),
+        "errors": dict(sorted(errors.items(), key=lambda kv: -kv[1])[:10]),
+    }
+
+
+def run_load(base_url: str, corpus: list, args) -> dict:
+    rng = random.Random(args.seed)
+    results = []
+    with ThreadPoolExecutor(max_workers=args.max_inflight) as pool:
+        futures = []
+        started_at = time.time()
+        next_arrival = started_at
+        for _ in range(args.batches):
+            next_arrival += rng.expovariate(args.rate)
+            docs = [corpus[rng.randrange(len(corpus))] for _ in range(rng.randint(1, args.max_files))]
+            delay = next_arrival - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            futures.append(pool.submit(run_batch, base_url, docs, next_arrival, args.poll_interval, args.timeout))
+        for f in futures:
+            results.append(f.result())
+    return summarize(results, started_at)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--target", default=f"http://localhost:{INGESTION_PORT}", help="ingestion service URL")
+    mode.add_argument("--in-process", action="store_true", help="run the whole stack in this process")
+    parser.add_argument("--preprocessing", default=f"http://localhost:{PREPROCESSING_PORT}",
+                        help="preprocessing service URL (remote mode readiness check)")
+    parser.add_argument("--rate", type=float, default=1.0, help="mean batch arrivals per second")
+    parser.add_argument("--batches", type=int, default=100)
+    parser.add_argument("--max-files", type=int, default=3, help="documents per batch: uniform 1..N")
+    parser.add_argument("--pdf-share", type=float, default=0.4, help="fraction of documents that are PDFs")
+    parser.add_argument("--pdf-pages", type=int, nargs=2, default=(2, 6), metavar=("MIN", "MAX"))
+    parser.add_argument("--corpus", type=int, default=24, help="distinct synthetic documents to generate")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-inflight", type=int, default=64, help="client threads (batches awaiting completion)")
+    parser.add_argument("--poll-interval", type=float, default=0.25)
+    parser.add_argument("--timeout", type=float, default=900, help="per-batch completion timeout (s)")
+    parser.add_argument("--workers", type=int, default=4, help="Celery worker threads (--in-process)")
+    parser.add_argument("--ready-timeout", type=float, default=600)
+    parser.add_argument("--out", help="also write the JSON report here")
+    args = parser.parse_args(argv)
+
+    corpus = build_corpus(args.corpus, args.pdf_share, tuple(args.pdf_pages), args.seed)
+    print(f"Generated {len(corpus)} documents "
+          f"({sum(d['pages'] for d in corpus)} pages, {sum(len(d['data']) for d in corpus) / 1e6:.1f} MB)",
+          file=sys.stderr)
+
+    with ExitStack() as stack:
+        if args.in_process:
+            workdir = stack.enter_context(tempfile.TemporaryDirectory(prefix="docintel_loadtest_"))
+            base_url, preprocessing_url = start_in_process(stack, args.workers, workdir)
+        else:
+            base_url, preprocessing_url = args.target.rstrip("/"), args.preprocessing.rstrip("/")
+        wait_ready(preprocessing_url, args.ready_timeout)
+
+        report = run_load(base_url, corpus, args)
+
+    report["config"] = {k: v for k, v in vars(args).items() if k != "out"}
+    print(json.dumps(report, indent=2))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
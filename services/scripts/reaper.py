@@ -0,0 +1,234 @@
+"""
+Garbage collector for local temp files and orphaned enhanced objects.
+
+temp     Removes docintel_* files in the temp directory older than REAPER_TEMP_MAX_AGE_S.
+         The preprocessing service deletes its own temp files, so these come from workers
+         that were killed mid-batch.
+
+orphans  Reconciles the enhanced/<batch_id>/ prefixes in MINIO_BUCKET against FileMetadata.
+         The listing is streamed (minio-py pages it 1000 keys at a time) and grouped by
+         batch, and the DB is checked for 500 batches at a time. An object is deleted if it
+         is older than REAPER_ORPHAN_RETENTION_S and its batch has no FileMetadata rows
+         (a failed or abandoned upload). With --unreferenced, objects of known batches that
+         no record's enhanced_path or pages (enhanced image and text layer) point at are
+         deleted too. Deletes are sent as bulk remove_objects requests of
+         REAPER_DELETE_BATCH_SIZE keys.
+
+uploads  Cleans up chunked uploads (POST /uploads) abandoned for CHUNKED_UPLOAD_TTL_S: their
+         Redis state has expired, but MinIO still holds the parts of the multipart upload
+         (aborted here) or an assembled object that never got a FileMetadata row (deleted).
+
+    python -m services.scripts.reaper --dry-run            # report only
+    python -m services.scripts.reaper --orphans --retention-days 14
+    python -m services.scripts.reaper --loop               # every REAPER_INTERVAL_S
+
+Prints a JSON summary per run.
+"""
+import argparse
+import glob
+import json
+import os
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from minio.deleteobjects import DeleteObject
+from sqlalchemy import select
+
+from common.config.settings import settings
+from common.utils.logger import get_logger
+from services.ingestion_service.db import SessionLocal
+from services.ingestion_service.minio_client import get_minio_client
+from services.ingestion_service.models import FileMetadata
+from services.ingestion_service.routers.upload_router import reap_abandoned
+from services.preprocessing_service.processor.converter import TEMP_PREFIX
+
+logger = get_logger("reaper")
+
+# written by process_batch
+ENHANCED_PREFIXES = ("enhanced/",)
+DB_LOOKUP_CHUNK = 500
+
+
+# ---------------- LOCAL TEMP FILES ----------------
+
+def sweep_temp(temp_dir: str, max_age_s: int, dry_run: bool) -> dict:
+    cutoff = time.time() - max_age_s
+    removed, freed, failed = 0, 0, 0
+    for path in glob.iglob(os.path.join(temp_dir, f"{TEMP_PREFIX}*")):
+        try:
+            st = os.stat(path)
+            if not os.path.isfile(path) or st.st_mtime >= cutoff:
+                continue
+            if not dry_run:
+                os.remove(path)
+            removed += 1
+            freed += st.st_size
+        except FileNotFoundError:
+            continue  # removed by its owner in the meantime
+        except OSError as e:
+            failed += 1
+            logger.warning("Could not remove %s: %s", path, e)
+    return {"temp_dir": temp_dir, "removed": removed, "bytes": freed, "failed": failed}
+
+
+# ---------------- ORPHANED OBJECTS ----------------
+
+class _BulkDeleter:
+    """Buffers keys and deletes them batch_size at a time with one remove_objects request."""
+
+    def __init__(self, client, bucket: str, batch_size: int, dry_run: bool):
+        self.client = client
+        self.bucket = bucket
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.pending = []
+        self.deleted = 0
+        self.failed = []
+
+    def add(self, object_name: str):
+        self.pending.append(object_name)
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        batch, self.pending = self.pending, []
+        if self.dry_run:
+            self.deleted += len(batch)
+            return
+        # remove_objects is lazy — errors are only reported while iterating
+        errors = [err.name for err in self.client.remove_objects(self.bucket, [DeleteObject(n) for n in batch])]
+        self.deleted += len(batch) - len(errors)
+        self.failed.extend(errors)
+
+
+def _iter_batches(client, bucket: str, prefixes: tuple):
+    """Yield (batch_id, [objects]) from a streamed recursive listing; keys arrive sorted."""
+    for prefix in prefixes:
+        batch_id, group = None, []
+        for obj in client.list_objects(bucket, prefix=prefix, recursive=True):
+            current = obj.object_name[len(prefix):].split("/", 1)[0]
+            if current != batch_id and group:
+                yield batch_id, group
+                group = []
+            batch_id = current
+            group.append(obj)
+        if group:
+            yield batch_id, group
+
+
+def _references(batch_ids: list) -> dict:
+    """batch_id → set of "bucket/object" enhanced images and text layers its FileMetadata rows point at."""
+    refs = {}
+    with SessionLocal() as db:
+        rows = db.execute(
+            select(FileMetadata.batch_id, FileMetadata.additional_meta).where(FileMetadata.batch_id.in_(batch_ids))
+        )
+        for batch_id, meta in rows:
+            paths = refs.setdefault(batch_id, set())
+            meta = meta or {}
+            if meta.get("enhanced_path"):
+                paths.add(meta["enhanced_path"])
+            for page in (meta.get("pages") or {}).values():
+                for key in ("enhanced_path", "text_path"):
+                    if page.get(key):
+                        paths.add(page[key])
+    return refs
+
+
+def reconcile_orphans(bucket: str, retention_s: int, batch_size: int, dry_run: bool,
+                      unreferenced: bool = False, prefixes: tuple = ENHANCED_PREFIXES) -> dict:
+    client = get_minio_client()
+    deleter = _BulkDeleter(client, bucket, batch_size, dry_run)
+    cutoff = datetime.now(timezone.utc).timestamp() - retention_s
+    stats = {"scanned_objects": 0, "scanned_batches": 0, "kept_recent": 0,
+             "orphaned_batches": 0, "orphaned_objects": 0, "orphaned_bytes": 0}
+
+    def _reap(chunk: list):
+        refs = _references([batch_id for batch_id, _ in chunk])
+        for batch_id, objects in chunk:
+            known = batch_id in refs
+            if known and not unreferenced:
+                continue
+            orphaned = [
+                o for o in objects
+                if not (known and f"{bucket}/{o.object_name}" in refs[batch_id])
+            ]
+            if not orphaned:
+                continue
+            recent = [o for o in orphaned if o.last_modified.timestamp() >= cutoff]
+            stats["kept_recent"] += len(recent)
+            orphaned = [o for o in orphaned if o.last_modified.timestamp() < cutoff]
+            if not orphaned:
+                continue
+            stats["orphaned_batches"] += 1
+            stats["orphaned_objects"] += len(orphaned)
+            stats["orphaned_bytes"] += sum(o.size or 0 for o in orphaned)
+            for o in orphaned:
+                deleter.add(o.object_name)
+
+    chunk = []
+    for batch_id, objects in _iter_batches(client, bucket, prefixes):
+        stats["scanned_batches"] += 1
+        stats["scanned_objects"] += len(objects)
+        chunk.append((batch_id, objects))
+        if len(chunk) >= DB_LOOKUP_CHUNK:
+            _reap(chunk)
+            chunk = []
+    if chunk:
+        _reap(chunk)
+    deleter.flush()
+
+    stats.update({"bucket": bucket, "deleted": deleter.deleted, "failed": len(deleter.failed),
+                  "failed_sample": deleter.failed[:20]})
+    return stats
+
+
+def run_once(args) -> dict:
+    report = {"dry_run": args.dry_run, "at": datetime.now(timezone.utc).isoformat(timespec="seconds")}
+    if args.temp:
+        report["temp"] = sweep_temp(args.temp_dir, args.temp_max_age, args.dry_run)
+    if args.orphans:
+        report["orphans"] = reconcile_orphans(args.bucket, int(args.retention_days * 86400), args.delete_batch_size,
+                                              args.dry_run, unreferenced=args.unreferenced)
+    if args.uploads:
+        report["uploads"] = reap_abandoned(dry_run=args.dry_run)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--temp", action="store_true", help="sweep local temp files")
+    parser.add_argument("--orphans", action="store_true", help="reconcile MinIO against FileMetadata")
+    parser.add_argument("--uploads", action="store_true", help="clean up abandoned chunked uploads")
+    parser.add_argument("--dry-run", action="store_true", help="report what would be deleted")
+    parser.add_argument("--unreferenced", action="store_true",
+                        help="also delete objects of known batches that no record references")
+    parser.add_argument("--temp-dir", default=tempfile.gettempdir())
+    parser.add_argument("--temp-max-age", type=int, default=settings.REAPER_TEMP_MAX_AGE_S, help="seconds")
+    parser.add_argument("--bucket", default=settings.MINIO_BUCKET)
+    parser.add_argument("--retention-days", type=float, default=settings.REAPER_ORPHAN_RETENTION_S / 86400)
+    parser.add_argument("--delete-batch-size", type=int, default=settings.REAPER_DELETE_BATCH_SIZE)
+    parser.add_argument("--loop", action="store_true", help="run every REAPER_INTERVAL_S")
+    args = parser.parse_args(argv)
+    # none selected → all
+    if not (args.temp or args.orphans or args.uploads):
+        args.temp = args.orphans = args.uploads = True
+    args.delete_batch_size = max(1, min(args.delete_batch_size, 1000))
+
+    while True:
+        try:
+            print(json.dumps(run_once(args), indent=2), flush=True)
+        except Exception:
+            if not args.loop:
+                raise
+            logger.exception("Reaper run failed")
+        if not args.loop:
+            break
+        time.sleep(settings.REAPER_INTERVAL_S)
+
+
+if __name__ == "__main__":
+    main()
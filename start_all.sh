@@ -39,8 +39,15 @@ echo "🌐 Launching backend and frontend services..."
 
 nohup uvicorn services.ingestion_service.main:app --host 0.0.0.0 --port 8000 > ingestion.log 2>&1 &
 nohup uvicorn services.preprocessing_service.main:app --host 0.0.0.0 --port 8100 > preprocessing.log 2>&1 &
-nohup celery -A services.ingestion_service.celery_app.celery worker --loglevel=info --pool=solo > celery.log 2>&1 &
+# pool and concurrency come from CELERY_WORKER_PROFILE (solo | prefork | threads), see celery_app.py
+# applies preprocessing results from the status stream to the database
+nohup python -m services.ingestion_service.outbox_consumer > outbox_consumer.log 2>&1 &
+# sends fair-share queued preprocess jobs that no upload or finished job woke up for
+nohup python -m services.ingestion_service.fair_scheduler > fair_scheduler.log 2>&1 &
+nohup celery -A services.ingestion_service.celery_app.celery worker --loglevel=info > celery.log 2>&1 &
 nohup streamlit run frontend/streamlit_app.py > streamlit.log 2>&1 &
+# hourly sweep of stale docintel_* temp files and orphaned enhanced/<batch_id>/ objects
+nohup python -m services.scripts.reaper --loop > reaper.log 2>&1 &
 
 # ------------------ FINAL STATUS ------------------
 echo "✅ All services are up and running."
@@ -50,5 +57,5 @@ echo "🌍 Preprocessing API → http://localhost:8100"
 echo "💻 Streamlit Frontend → http://localhost:8501"
 echo "---------------------------------------------"
 echo "🪵 Logs:"
-echo "   ingestion.log | preprocessing.log | celery.log | streamlit.log"
+echo "   ingestion.log | preprocessing.log | celery.log | outbox_consumer.log | fair_scheduler.log | streamlit.log | reaper.log"
 echo "---------------------------------------------"
@@ -0,0 +1,40 @@
+import os
+
+import pytest
+
+# Settings() requires the connection settings; no test talks to these services.
+for _name, _value in {
+    "DB_HOST": "localhost", "DB_PORT": "5432", "DB_NAME": "docintel", "DB_USER": "docintel",
+    "DB_PASS": "docintel", "MINIO_ENDPOINT": "localhost:9000", "MINIO_ACCESS_KEY": "minio",
+    "MINIO_SECRET_KEY": "minio123", "MINIO_BUCKET": "documents",
+    "MINIO_PUBLIC_URL": "http://localhost:9000", "REDIS_HOST": "localhost", "REDIS_PORT": "6379",
+}.items():
+    os.environ.setdefault(_name, _value)
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    """get_redis() backed by an in-memory fakeredis server (all dbs); returns the state db client."""
+    fakeredis = pytest.importorskip("fakeredis")
+    from common.config import redis_client
+    from common.config.settings import settings
+
+    server = fakeredis.FakeServer()
+    clients = {db: fakeredis.FakeRedis(server=server, db=db, decode_responses=True) for db in range(4)}
+    monkeypatch.setattr(redis_client, "_clients", clients)
+    return clients[settings.REDIS_STATE_DB]
+
+
+@pytest.fixture
+def sqlite_session():
+    """sessionmaker on an in-memory SQLite database holding the ingestion tables."""
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from sqlalchemy.pool import StaticPool
+    from services.ingestion_service import models
+    from services.ingestion_service.db import Base
+
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine, tables=[models.FileMetadata.__table__, models.PageHash.__table__])
+    yield sessionmaker(bind=engine, autoflush=False, future=True)
+    engine.dispose()
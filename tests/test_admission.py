@@ -0,0 +1,89 @@
+import pytest
+
+from common.config.settings import settings
+from services.ingestion_service import admission
+from services.ingestion_service.celery_app import LOW_PRIORITY
+
+fitz = pytest.importorskip("fitz")
+
+
+def _pdf(pages: int, **save_options) -> bytes:
+    doc = fitz.open()
+    for _ in range(pages):
+        doc.new_page()
+    data = doc.tobytes(**save_options)
+    doc.close()
+    return data
+
+
+def test_plain_pdf_page_count():
+    assert admission.estimate_pages(_pdf(3), "application/pdf") == 3
+
+
+def test_pages_in_object_streams_are_counted():
+    data = _pdf(7, use_objstms=1, garbage=1, deflate=True)
+    # the page objects are compressed, so the regex can't see them
+    assert len(admission._PDF_PAGE_RE.findall(data)) < 7
+    assert admission.estimate_pages(data, "application/pdf") == 7
+
+
+def test_regex_fallback_when_the_parser_fails(monkeypatch):
+    monkeypatch.setattr(admission, "_pdf_page_count", lambda content: None)
+    assert admission.estimate_pages(_pdf(4), "application/pdf") == 4
+    assert admission.estimate_pages(b"not a pdf", "application/pdf") == 1
+
+
+def test_images_are_one_page():
+    assert admission.estimate_pages(b"\x89PNG...", "image/png") == 1
+
+
+def test_admission_refuses_past_the_queue_limit(fake_redis, monkeypatch):
+    monkeypatch.setattr(admission, "broker_queue_depth", lambda: settings.ADMISSION_MAX_QUEUE_DEPTH)
+    decision = admission.check_admission(10)
+    assert not decision["admitted"]
+    assert decision["retry_after"] == settings.ADMISSION_RETRY_AFTER_DEFAULT_S
+
+    low = admission.check_admission(10, low_priority=True)
+    assert low["admitted"] and low["priority"] == LOW_PRIORITY
+
+
+def test_retry_after_follows_observed_throughput(fake_redis, monkeypatch):
+    monkeypatch.setattr(admission, "broker_queue_depth", lambda: 0)
+    admission.track_enqueued("b1", settings.ADMISSION_MAX_INFLIGHT_PAGES)
+    admission.track_completed("b0", 900)  # 900 pages in the window → 1 page/s
+    monkeypatch.setattr(settings, "ADMISSION_THROUGHPUT_WINDOW_S", 900)
+
+    decision = admission.check_admission(120)
+    assert not decision["admitted"]
+    assert decision["retry_after"] == 120
+
+    admission.track_completed("b1", 0)
+    assert admission.check_admission(120)["admitted"]
+
+
+def test_upload_counts_pdf_pages_off_the_event_loop(monkeypatch):
+    import asyncio
+    import io
+    import threading
+
+    from fastapi import HTTPException, UploadFile
+    from services.ingestion_service import main
+
+    counted_on = []
+
+    def estimate_pages(content, content_type):
+        counted_on.append(threading.get_ident())
+        return admission.estimate_pages(content, content_type)
+
+    monkeypatch.setattr(main, "estimate_pages", estimate_pages)
+    monkeypatch.setattr(main, "check_admission", lambda pages, low: {"admitted": False, "retry_after": pages})
+
+    async def upload():
+        files = [UploadFile(io.BytesIO(_pdf(3)), filename="a.pdf", headers={"content-type": "application/pdf"})]
+        with pytest.raises(HTTPException) as rejected:
+            await main._upload_batch("b1", files, None, None, False, None)
+        return threading.get_ident(), rejected.value
+
+    loop_thread, rejected = asyncio.run(upload())
+    assert rejected.status_code == 429 and rejected.headers["Retry-After"] == "3"
+    assert counted_on and loop_thread not in counted_on
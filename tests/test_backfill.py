@@ -0,0 +1,169 @@
+import json
+
+import pytest
+
+from services.ingestion_service.models import FileMetadata
+from services.scripts import backfill
+
+
+def _meta(*versions) -> dict:
+    return {"pages": {str(n + 1): {"pipeline_version": v} for n, v in enumerate(versions)}}
+
+
+def _stats() -> dict:
+    return {"scanned": 0, "up_to_date": 0}
+
+
+def test_is_current():
+    assert backfill.is_current(_meta("2", "2"), "2")
+    assert not backfill.is_current(_meta("2", "1"), "2")
+    assert not backfill.is_current(_meta("2", None), "2")  # pages from before versions were recorded
+    assert not backfill.is_current({}, "2")  # failed or never processed
+    assert not backfill.is_current(None, "2")
+
+
+def test_iter_jobs_groups_consecutive_documents_of_a_batch():
+    documents = [
+        (1, "b1", "d/b1/a", 2, False),
+        (2, "b1", "d/b1/b", 1, False),
+        (3, "b1", "d/b1/c", 3, False),  # over max_files: starts a second job of the batch
+        (4, "b1", "d/b1/d", 1, True),
+        (5, "b2", "d/b2/a", 4, False),
+        (6, "b3", "d/b3/a", 1, True),
+        (7, "b3", "d/b3/b", 1, True),
+    ]
+    stats = _stats()
+    jobs = list(backfill.iter_jobs(documents, 2, stats))
+    assert jobs == [
+        {"batch_id": "b1", "files": ["d/b1/a", "d/b1/b"], "pages": 3, "cursor": 2},
+        {"batch_id": "b1", "files": ["d/b1/c"], "pages": 3, "cursor": 4},  # extends over d/b1/d
+        {"batch_id": "b2", "files": ["d/b2/a"], "pages": 4, "cursor": 7},
+    ]
+    assert stats == {"scanned": 7, "up_to_date": 3}
+
+
+def test_checkpoint_advances_only_past_contiguous_finished_jobs(tmp_path):
+    path = str(tmp_path / "cp.json")
+    cp = backfill.Checkpoint(path, "k1")
+    for cursor in (10, 20, 30):
+        cp.submitted(cursor)
+    cp.finished(20)
+    assert cp.cursor is None  # 10 is still running
+    cp.finished(10)
+    assert cp.cursor == 20
+    cp.skipped_to(25)
+    assert cp.cursor == 20  # 30 is in flight
+    cp.finished(30)
+    cp.skipped_to(35)
+    assert cp.cursor == 35
+    cp.save({"jobs": 3}, force=True)
+
+    assert backfill.Checkpoint(path, "k1").cursor == 35
+    assert backfill.Checkpoint(path, "other arguments").cursor is None
+    with open(path) as f:
+        assert json.load(f)["totals"] == {"jobs": 3}
+
+
+@pytest.fixture
+def rows(sqlite_session, monkeypatch):
+    monkeypatch.setattr(backfill, "SessionLocal", sqlite_session)
+    metas = [_meta("2"), _meta("1", "2"), None, _meta("2", "2"), _meta("1"), _meta("1")]
+    batches = ["b1", "b1", "b1", "b2", "b2", "b3"]
+    with sqlite_session() as db:
+        for n, (batch, meta) in enumerate(zip(batches, metas)):
+            db.add(FileMetadata(batch_id=batch, file_name=f"f{n}.pdf", minio_path=f"documents/{batch}/f{n}.pdf",
+                                branch_id="BR-1" if n < 4 else "BR-2", file_type="application/pdf",
+                                size_bytes=1, additional_meta=meta))
+        db.commit()
+    return sqlite_session
+
+
+def _args(tmp_path, *extra):
+    """The namespace the CLI would hand to run()."""
+    captured = []
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(backfill, "run", lambda args: captured.append(args) or {})
+        backfill.main(["--checkpoint", str(tmp_path / "cp.json"), "--version", "2", "--rate", "0", *extra])
+    return captured[0]
+
+
+def test_iter_db_selects_out_of_date_rows(rows, tmp_path):
+    args = _args(tmp_path)
+    docs = list(backfill.iter_db(args, None))
+    assert [(c, b, n, current) for c, b, _, n, current in docs] == [
+        (1, "b1", 1, True), (2, "b1", 2, False), (3, "b1", 1, False),
+        (4, "b2", 2, True), (5, "b2", 1, False), (6, "b3", 1, False),
+    ]
+    assert [c for c, *_ in backfill.iter_db(args, 4)] == [5, 6]
+    assert [c for c, *_ in backfill.iter_db(_args(tmp_path, "--branch", "BR-2"), None)] == [5, 6]
+    assert backfill.count_db(args, 2) == 4
+
+
+def _reprocess(session_factory, files, version="2"):
+    """What the pipeline does to a job's rows once it has run."""
+    with session_factory() as db:
+        for record in db.query(FileMetadata).filter(FileMetadata.minio_path.in_(files)):
+            record.additional_meta = _meta(version)
+        db.commit()
+
+
+def test_run_queues_low_priority_jobs_and_resumes(rows, tmp_path, monkeypatch):
+    from services.ingestion_service.celery_app import LOW_PRIORITY
+    from services.ingestion_service.utils import file_handler
+
+    queued = []
+
+    def _enqueue(batch_id, files, pages, priority):
+        queued.append((batch_id, files, pages, priority))
+        _reprocess(rows, files)
+
+    monkeypatch.setattr(file_handler, "enqueue_preprocess", _enqueue)
+    monkeypatch.setattr(backfill, "_queue_depth", lambda: 0)
+
+    args = _args(tmp_path, "--limit", "2")
+    summary = backfill.run(args)
+    assert queued == [("b1", ["documents/b1/f1.pdf", "documents/b1/f2.pdf"], 3, LOW_PRIORITY),
+                      ("b2", ["documents/b2/f4.pdf"], 1, LOW_PRIORITY)]
+    assert summary["jobs"] == 2 and summary["cursor"] == 5
+
+    queued.clear()
+    summary = backfill.run(_args(tmp_path))  # same arguments: resumes after cursor 5
+    assert queued == [("b3", ["documents/b3/f5.pdf"], 1, LOW_PRIORITY)]
+    assert summary["total"] == 1 and summary["cursor"] == 6
+
+
+def test_celery_checkpoint_waits_for_the_rows(rows, tmp_path, monkeypatch):
+    from services.ingestion_service.utils import file_handler
+
+    queued = []
+    monkeypatch.setattr(file_handler, "enqueue_preprocess", lambda batch_id, files, *a: queued.append(files))
+    monkeypatch.setattr(backfill, "_queue_depth", lambda: 0)
+
+    summary = backfill.run(_args(tmp_path))
+    assert len(queued) == 3
+    assert summary["cursor"] is None and summary["unconfirmed_jobs"] == 3  # nothing has run yet
+
+    _reprocess(rows, queued[0])  # the first job is done, the second failed or was lost
+    queued.clear()
+    summary = backfill.run(_args(tmp_path))
+    assert queued == [["documents/b2/f4.pdf"], ["documents/b3/f5.pdf"]]
+    assert summary["up_to_date"] == 4 and summary["cursor"] is None
+
+
+def test_celery_force_never_advances_the_checkpoint(rows, tmp_path, monkeypatch):
+    from services.ingestion_service.utils import file_handler
+
+    monkeypatch.setattr(file_handler, "enqueue_preprocess", lambda batch_id, files, *a: _reprocess(rows, files))
+    monkeypatch.setattr(backfill, "_queue_depth", lambda: 0)
+
+    summary = backfill.run(_args(tmp_path, "--force"))
+    assert summary["jobs"] == 3 and summary["cursor"] is None and summary["unconfirmed_jobs"] == 3
+
+
+def test_dry_run_queues_nothing(rows, tmp_path, monkeypatch):
+    from services.ingestion_service.utils import file_handler
+
+    monkeypatch.setattr(file_handler, "enqueue_preprocess", lambda *a: pytest.fail("dry run queued a job"))
+    summary = backfill.run(_args(tmp_path, "--dry-run"))
+    assert summary["jobs"] == 3 and summary["files"] == 4 and summary["up_to_date"] == 2
+    assert not (tmp_path / "cp.json").exists()
@@ -0,0 +1,55 @@
+import cv2
+import numpy as np
+import pytest
+
+from services.preprocessing_service.processor.boundary import detect_document, warp_document, warp_size
+
+CARD = np.array([[230, 140], [1010, 190], [960, 700], [190, 620]], np.float32)  # tl, tr, br, bl
+
+
+def _photo(corners=CARD, size=(900, 1200), table=40, card=230) -> np.ndarray:
+    gray = np.full(size, table, np.uint8)
+    cv2.fillConvexPoly(gray, corners.astype(np.int32), card)
+    return gray
+
+
+def test_finds_a_tilted_card_on_a_table():
+    quad = detect_document(_photo())
+    assert quad is not None
+    assert np.abs(quad - CARD).max() < 12
+
+
+def test_corner_order_does_not_depend_on_the_contour():
+    # the same card handed over with its corners starting elsewhere and running the other way
+    quad = detect_document(_photo(CARD[[2, 1, 0, 3]]))
+    assert np.abs(quad - CARD).max() < 12
+
+
+def test_finds_a_card_with_rounded_corners():
+    gray = np.full((900, 1200), 40, np.uint8)
+    cv2.rectangle(gray, (300, 200), (900, 600), 230, -1)
+    for x, y in ((300, 200), (900, 200), (900, 600), (300, 600)):
+        cv2.rectangle(gray, (x - 30, y - 30), (x + 30, y + 30), 40, -1)
+        cv2.circle(gray, (x + (30 if x == 300 else -30), y + (30 if y == 200 else -30)), 30, 230, -1)
+    quad = detect_document(gray)
+    assert quad is not None
+    # corners land on the rounding, within its radius of the square corners
+    assert np.abs(quad - [[300, 200], [900, 200], [900, 600], [300, 600]]).max() < 30
+
+
+@pytest.mark.parametrize("gray", [
+    np.full((900, 1200), 230, np.uint8),  # a blank scan: nothing to find
+    _photo(np.array([[5, 5], [1194, 5], [1194, 894], [5, 894]], np.float32)),  # fills the frame
+    _photo(np.array([[500, 400], [600, 400], [600, 480], [500, 480]], np.float32)),  # too small to be it
+])
+def test_leaves_scans_and_small_objects_alone(gray):
+    assert detect_document(gray) is None
+
+
+def test_warp_straightens_the_card():
+    img = cv2.cvtColor(_photo(), cv2.COLOR_GRAY2BGR)
+    out = warp_document(img, CARD)
+    width, height = warp_size(CARD)
+    assert out.shape == (height, width, 3)
+    assert abs(width - 782) <= 1 and abs(height - 512) <= 1
+    assert out[5:-5, 5:-5].min() > 200  # only card left, no table
@@ -0,0 +1,77 @@
+import hashlib
+from types import SimpleNamespace
+
+import pytest
+
+from common.config.settings import settings
+from services.preprocessing_service import checkpoint
+
+DATA = b"enhanced page bytes"
+MD5 = hashlib.md5(DATA).hexdigest()
+
+
+def _result(version=None) -> dict:
+    return {"page": 1, "enhanced": "documents/enhanced/b1/doc_p1.png",
+            "pipeline_version": version or settings.PIPELINE_VERSION}
+
+
+@pytest.fixture
+def objects(monkeypatch):
+    """Enhanced objects by path, as stat_object sees them."""
+    stats = {}
+    monkeypatch.setattr(checkpoint, "stat_object", lambda path: stats.get(path))
+    return stats
+
+
+def test_saved_pages_load_back(fake_redis):
+    checkpoint.save_page("b1", "documents/doc.pdf", 1, _result(), DATA)
+    checkpoint.save_page_count("b1", "documents/doc.pdf", 3)
+    loaded = checkpoint.load("b1")
+    assert checkpoint.page_count(loaded, "documents/doc.pdf") == 3
+    assert loaded["documents/doc.pdf#1"] == {"result": _result(), "size": len(DATA), "md5": MD5}
+    assert checkpoint.load("other") == {}
+    assert 0 < fake_redis.ttl(checkpoint._key("b1")) <= settings.CHECKPOINT_TTL_S
+
+
+def test_redis_outage_costs_only_rework(monkeypatch):
+    def down():
+        raise ConnectionError("redis down")
+
+    monkeypatch.setattr(checkpoint, "get_redis", down)
+    checkpoint.save_page("b1", "documents/doc.pdf", 1, _result(), DATA)
+    assert checkpoint.load("b1") == {}
+
+
+@pytest.mark.parametrize("etag", [MD5, f'"{MD5}"', "0123abcd-2", None])
+def test_verified_page_reuses_an_intact_upload(fake_redis, objects, etag):
+    checkpoint.save_page("b1", "documents/doc.pdf", 1, _result(), DATA)
+    objects[_result()["enhanced"]] = SimpleNamespace(size=len(DATA), etag=etag)
+    assert checkpoint.verified_page(checkpoint.load("b1"), "documents/doc.pdf", 1) == _result()
+
+
+@pytest.mark.parametrize("stat", [
+    None,  # deleted since
+    SimpleNamespace(size=len(DATA) + 1, etag=MD5),  # overwritten
+    SimpleNamespace(size=len(DATA), etag="f" * 32),  # same size, different content
+])
+def test_verified_page_rejects_a_changed_upload(fake_redis, objects, stat):
+    checkpoint.save_page("b1", "documents/doc.pdf", 1, _result(), DATA)
+    objects[_result()["enhanced"]] = stat
+    assert checkpoint.verified_page(checkpoint.load("b1"), "documents/doc.pdf", 1) is None
+
+
+def test_verified_page_rejects_other_pipeline_versions_and_missing_pages(fake_redis, objects):
+    checkpoint.save_page("b1", "documents/doc.pdf", 1, _result("0-old"), DATA)
+    objects[_result()["enhanced"]] = SimpleNamespace(size=len(DATA), etag=MD5)
+    loaded = checkpoint.load("b1")
+    assert checkpoint.verified_page(loaded, "documents/doc.pdf", 1) is None
+    assert checkpoint.verified_page(loaded, "documents/doc.pdf", 2) is None
+
+
+def test_verified_page_is_none_when_storage_cannot_be_asked(fake_redis, monkeypatch):
+    def unreachable(path):
+        raise OSError("minio down")
+
+    checkpoint.save_page("b1", "documents/doc.pdf", 1, _result(), DATA)
+    monkeypatch.setattr(checkpoint, "stat_object", unreachable)
+    assert checkpoint.verified_page(checkpoint.load("b1"), "documents/doc.pdf", 1) is None
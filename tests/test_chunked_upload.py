@@ -0,0 +1,142 @@
+import json
+import time
+
+import pytest
+
+pytest.importorskip("fastapi")
+
+from fastapi import HTTPException
+
+from common.config.settings import settings
+from services.ingestion_service import minio_client
+from services.ingestion_service.models import FileMetadata
+from services.ingestion_service.routers import upload_router
+
+
+class FakeMinio:
+    """The multipart calls upload_router makes, recorded against an in-memory bucket."""
+
+    def __init__(self):
+        self.open = {}  # minio upload id → {part_number: etag}
+        self.objects = {}  # object name → size
+        self.calls = []
+
+    def create(self, object_name, content_type):
+        upload_id = f"mp-{len(self.open)}"
+        self.open[upload_id] = {}
+        return upload_id
+
+    def complete(self, object_name, upload_id, etags):
+        self.calls.append(("complete", upload_id))
+        if upload_id not in self.open:
+            err = Exception("NoSuchUpload")
+            err.code = "NoSuchUpload"
+            raise err
+        del self.open[upload_id]
+        self.objects[object_name] = self.size
+        return f"{settings.MINIO_BUCKET}/{object_name}"
+
+    def abort(self, object_name, upload_id):
+        self.calls.append(("abort", upload_id))
+        self.open.pop(upload_id, None)
+
+    def delete(self, paths):
+        for path in paths:
+            self.objects.pop(path.split("/", 1)[1], None)
+        return []
+
+
+@pytest.fixture
+def upload(fake_redis, sqlite_session, monkeypatch):
+    fake = FakeMinio()
+    enqueued = []
+    monkeypatch.setattr(upload_router, "SessionLocal", sqlite_session)
+    monkeypatch.setattr(upload_router, "create_multipart_upload", fake.create)
+    monkeypatch.setattr(upload_router, "complete_multipart_upload", fake.complete)
+    monkeypatch.setattr(upload_router, "abort_multipart_upload", fake.abort)
+    monkeypatch.setattr(upload_router, "delete_objects", fake.delete)
+    monkeypatch.setattr(upload_router, "object_size", lambda name: fake.objects.get(name))
+    monkeypatch.setattr(upload_router, "check_admission", lambda pages, low: {"admitted": True, "priority": None})
+    monkeypatch.setattr(upload_router, "enqueue_preprocess",
+                        lambda batch_id, paths, pages, priority, **kw: enqueued.append(paths) or {"job_id": "j1"})
+
+    meta = upload_router.create_upload(upload_router.CreateUploadRequest(file_name="scan.png", total_size=10))
+    upload_id = meta["upload_id"]
+    fake_redis.hset(upload_router._parts_key(upload_id), 1, json.dumps({"etag": "e1", "size": 10}))
+    fake.size = 10
+    return upload_id, fake, enqueued, sqlite_session
+
+
+def _rows(session):
+    with session() as db:
+        return db.query(FileMetadata).count()
+
+
+def test_complete_is_idempotent(upload):
+    upload_id, fake, enqueued, session = upload
+    first = upload_router.complete_upload(upload_id)
+    assert upload_router.complete_upload(upload_id) == first
+    assert fake.calls == [("complete", "mp-0")]
+    assert _rows(session) == 1 and len(enqueued) == 1
+
+
+def test_retry_after_enqueue_failure_skips_assembly_and_insert(upload, monkeypatch):
+    upload_id, fake, enqueued, session = upload
+    real_enqueue = upload_router.enqueue_preprocess
+
+    def broken(*args, **kwargs):
+        raise RuntimeError("broker down")
+
+    monkeypatch.setattr(upload_router, "enqueue_preprocess", broken)
+    with pytest.raises(HTTPException) as exc:
+        upload_router.complete_upload(upload_id)
+    assert exc.value.status_code == 500
+    assert upload_router._load(upload_id)["status"] == "registered"
+
+    monkeypatch.setattr(upload_router, "enqueue_preprocess", real_enqueue)
+    result = upload_router.complete_upload(upload_id)
+    assert result["files"][0]["minio_path"].endswith("scan.png")
+    assert fake.calls == [("complete", "mp-0")]  # not completed a second time
+    assert _rows(session) == 1 and len(enqueued) == 1
+
+
+def test_lost_complete_response_is_recovered(upload):
+    upload_id, fake, enqueued, session = upload
+    # MinIO completed it, but the response never arrived
+    meta = upload_router._load(upload_id)
+    fake.complete(meta["object_name"], meta["minio_upload_id"], {})
+    upload_router.complete_upload(upload_id)
+    assert _rows(session) == 1 and len(enqueued) == 1
+
+
+def test_abandoned_uploads_are_aborted(upload, fake_redis):
+    upload_id, fake, _, _ = upload
+    assert upload_router.reap_abandoned(max_idle_s=0)["abandoned"] == 0  # state still there
+
+    fake_redis.delete(upload_router._meta_key(upload_id))  # TTL expired
+    time.sleep(0.01)
+    assert upload_router.reap_abandoned(max_idle_s=0) == {"abandoned": 1, "cleaned": 1, "failed": 0}
+    assert ("abort", "mp-0") in fake.calls and not fake.open
+    assert fake_redis.zcard(upload_router.OPEN_KEY) == 0
+
+
+def test_assembled_but_unregistered_object_is_deleted(upload, fake_redis, monkeypatch):
+    upload_id, fake, _, _ = upload
+    def db_down(db, meta):
+        raise RuntimeError("db down")
+
+    monkeypatch.setattr(upload_router, "_register", db_down)
+    with pytest.raises(HTTPException):
+        upload_router.complete_upload(upload_id)
+    assert fake.objects
+
+    fake_redis.delete(upload_router._meta_key(upload_id))
+    assert upload_router.reap_abandoned(max_idle_s=0)["cleaned"] == 1
+    assert not fake.objects
+
+
+def test_pinned_minio_has_the_private_multipart_api():
+    minio = pytest.importorskip("minio")
+    if minio.__version__ != "7.2.7":
+        pytest.skip(f"requirements pin minio==7.2.7, installed {minio.__version__}")
+    minio_client._check_multipart_api(minio.Minio("localhost:9000"))
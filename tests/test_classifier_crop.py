@@ -0,0 +1,47 @@
+import cv2
+import numpy as np
+import pytest
+from PIL import Image
+
+from services.preprocessing_service.processor import classifier
+from services.preprocessing_service.processor.boundary import warp_document
+from services.preprocessing_service.processor.enhancer import enhance_image_with_report
+
+ORIENTATION = 0x0112
+
+
+def _photo(path, orientation: int):
+    """A card on a dark table; the pixels are stored rotated and EXIF says how to turn them."""
+    upright = np.full((600, 800, 3), 40, np.uint8)
+    cv2.rectangle(upright, (150, 120), (650, 470), (235, 235, 235), -1)
+    cv2.rectangle(upright, (180, 150), (300, 230), (20, 20, 200), -1)  # photo box, top left of the card
+    cv2.putText(upright, "IDENTITY CARD", (320, 200), cv2.FONT_HERSHEY_SIMPLEX, 1.1, (30, 30, 30), 3)
+    stored = cv2.rotate(upright, cv2.ROTATE_90_COUNTERCLOCKWISE)  # what orientation 6 turns back
+    image = Image.fromarray(cv2.cvtColor(stored, cv2.COLOR_BGR2RGB))
+    exif = image.getexif()
+    exif[ORIENTATION] = orientation
+    image.save(path, "JPEG", quality=95, exif=exif)
+    return upright
+
+
+def test_crop_quad_lines_up_with_exif_rotated_photos(tmp_path, monkeypatch):
+    path = str(tmp_path / "card.jpg")
+    upright = _photo(path, orientation=6)
+
+    _, report = enhance_image_with_report(path, stages=[], crop=True)
+    assert report["crop"] is not None
+    quad = report["crop"]["quad"]
+
+    seen = []
+    monkeypatch.setattr(classifier, "preprocess", lambda image: seen.append(np.asarray(image)) or None)
+    monkeypatch.setattr(classifier, "get_backend", lambda: type("Backend", (), {
+        "name": "fake", "predict": staticmethod(lambda _: np.array([[3.0, 1.0, 0, 0, 0]]))})())
+    assert classifier.classify_document(path, crop_quad=quad)[0] == "aadhaar"
+
+    expected = cv2.cvtColor(warp_document(upright, quad), cv2.COLOR_BGR2RGB)
+    got = seen[0]
+    assert got.shape == expected.shape
+    assert np.abs(got.astype(int) - expected.astype(int)).mean() < 8
+    # the card's photo box is still in its top-left corner
+    box = got[55:85, 60:120]
+    assert box[..., 0].mean() > 150 and box[..., 1].mean() < 80
@@ -0,0 +1,103 @@
+import random
+
+import cv2
+import numpy as np
+import pytest
+
+from common.config.settings import settings
+from services.preprocessing_service import dedup
+from services.preprocessing_service.processor import phash as ph
+
+
+def _flip(h: int, bits) -> int:
+    for b in bits:
+        h ^= 1 << b
+    return h
+
+
+def test_chunks_and_sign_round_trip():
+    rng = random.Random(1)
+    for _ in range(200):
+        h = rng.getrandbits(64)
+        c = ph.chunks(h)
+        assert all(0 <= x < 1 << ph.CHUNK_BITS for x in c)
+        assert sum(x << (ph.CHUNK_BITS * (ph.CHUNKS - 1 - i)) for i, x in enumerate(c)) == h
+        assert -(1 << 63) <= ph.to_signed(h) < 1 << 63
+        assert ph.to_unsigned(ph.to_signed(h)) == h
+
+
+def test_hashes_within_radius_share_a_chunk():
+    rng = random.Random(2)
+    for _ in range(500):
+        h = rng.getrandbits(64)
+        near = _flip(h, rng.sample(range(64), ph.CHUNKS - 1))
+        assert ph.hamming(h, near) == ph.CHUNKS - 1
+        assert any(a == b for a, b in zip(ph.chunks(h), ph.chunks(near)))
+
+
+def test_page_hashes():
+    assert ph.page_hashes(np.full((200, 150), 255, np.uint8)) is None  # blank page
+
+    rng = np.random.default_rng(0)
+    page = np.full((800, 600), 230, np.uint8)
+    for _ in range(40):
+        x, y = int(rng.integers(0, 500)), int(rng.integers(20, 780))
+        cv2.putText(page, "INVOICE 42", (x, y), cv2.FONT_HERSHEY_SIMPLEX, 0.8, 30, 2)
+    rescan = np.clip(cv2.resize(cv2.resize(page, (450, 600)), (600, 800)).astype(np.int16) + 8, 0, 255)
+    a, b = ph.page_hashes(page), ph.page_hashes(rescan.astype(np.uint8))
+    assert ph.hamming(a["phash"], b["phash"]) <= settings.DEDUP_MAX_DISTANCE
+    other = ph.page_hashes(cv2.flip(page, 0))
+    assert ph.hamming(a["phash"], other["phash"]) > settings.DEDUP_MAX_DISTANCE
+
+
+def test_candidates_query_is_one_indexed_select_per_chunk():
+    sql = str(dedup.candidates_query(0x0123456789ABCDEF))
+    assert sql.count("UNION") == ph.CHUNKS - 1
+    assert "ORDER BY" not in sql and "LIMIT" not in sql
+    assert "enhanced_path" not in sql  # the best match's full row is read on its own
+
+
+@pytest.fixture
+def index(sqlite_session, monkeypatch):
+    monkeypatch.setattr(dedup, "get_session", sqlite_session)
+    return sqlite_session
+
+
+def test_match_beyond_the_candidate_threshold_is_found(index, monkeypatch):
+    monkeypatch.setattr(settings, "DEDUP_MAX_CANDIDATES", 50)
+    query = 0xABCD_0000_0000_0000
+    rng = random.Random(3)
+    # a skewed chunk: many older pages share h0 with the query but are far from it
+    for i in range(200):
+        far = (0xABCD << 48) | rng.getrandbits(48)
+        if ph.hamming(far, query) <= settings.DEDUP_MAX_DISTANCE:
+            continue
+        dedup.record_page("old", f"documents/old/{i}.png", 1, {"phash": far, "dhash": 0}, {})
+    near = _flip(query, [1, 17])
+    dedup.record_page("b2", "documents/b2/scan.png", 1, {"phash": near, "dhash": 0b101},
+                      {"enhanced": "enhanced/b2/scan.png", "type": "pan", "confidence": 0.9})
+
+    match = dedup.find_near_duplicate({"phash": query, "dhash": 0}, "documents/b3/new.png", 1)
+    assert match["original"] == "documents/b2/scan.png"
+    assert match["distance"] == 2 and match["type"] == "pan"
+
+
+def test_same_page_and_dhash_disagreement_are_not_duplicates(index):
+    h = 0x1111_2222_3333_4444
+    dedup.record_page("b1", "documents/b1/a.png", 1, {"phash": h, "dhash": 0}, {})
+    dedup.record_page("b1", "documents/b1/a.png", 1, {"phash": h, "dhash": 0}, {})  # re-record: no-op
+
+    assert dedup.find_near_duplicate({"phash": h, "dhash": 0}, "documents/b1/a.png", 1) is None
+    assert dedup.find_near_duplicate({"phash": h, "dhash": (1 << 64) - 1}, "documents/b9/x.png", 1) is None
+    assert dedup.find_near_duplicate({"phash": h, "dhash": 0}, "documents/b9/x.png", 1)["distance"] == 0
+
+
+def test_configured_engine_is_used_for_the_index(sqlite_session, monkeypatch):
+    from services.preprocessing_service import db
+
+    monkeypatch.setattr(db, "_session_factory", None)
+    db.configure(sqlite_session.kw["bind"])
+    h = 0x5555_6666_7777_8888
+    dedup.record_page("b1", "documents/b1/a.png", 1, {"phash": h, "dhash": 0}, {"enhanced": "enhanced/b1/a.png"})
+    match = dedup.find_near_duplicate({"phash": _flip(h, [0]), "dhash": 0}, "documents/b2/b.png", 1)
+    assert match["enhanced"] == "enhanced/b1/a.png" and match["distance"] == 1
@@ -0,0 +1,45 @@
+import cv2
+import numpy as np
+import pytest
+
+pytest.importorskip("skimage")
+
+from common.config.settings import settings
+from services.scripts import enhancement_parity
+
+
+@pytest.fixture(scope="module")
+def pages(tmp_path_factory):
+    """Synthetic scans: printed text on uneven paper, some blurred, all with sensor noise."""
+    root = tmp_path_factory.mktemp("pages")
+    rng = np.random.default_rng(0)
+    paths = []
+    for k, (h, w) in enumerate([(900, 700), (1200, 850), (640, 480), (700, 900)]):
+        img = np.full((h, w), 200 + int(rng.integers(-40, 40)), np.int16) + np.linspace(-30, 30, w).astype(np.int16)
+        img = np.clip(img, 0, 255).astype(np.uint8)
+        for _ in range(150):
+            x, y = int(rng.integers(0, w - 80)), int(rng.integers(10, h - 10))
+            cv2.putText(img, "ABC123", (x, y), cv2.FONT_HERSHEY_SIMPLEX, 0.5 + rng.random(), int(rng.integers(0, 90)), 1)
+        if k % 2:
+            img = cv2.GaussianBlur(img, (0, 0), 1.2)
+        img = np.clip(img + rng.normal(0, 6, img.shape), 0, 255).astype(np.uint8)
+        path = root / f"page{k}.png"
+        cv2.imwrite(str(path), img)
+        paths.append(str(path))
+    return paths
+
+
+def test_engine_matches_the_skimage_stages_it_replaced(pages):
+    report = enhancement_parity.compare(pages)
+    assert set(report) == set(enhancement_parity.COMPARISONS)
+    for name, scores in report.items():
+        assert scores["images"] == len(pages)
+        assert scores["min"] >= 0.99, (name, scores)
+
+
+def test_tiled_stages_match_full_frame(pages, monkeypatch):
+    monkeypatch.setattr(settings, "ENHANCE_TILE_SIZE", 256)
+    report = enhancement_parity.compare(pages, enhancement_parity.TILED_COMPARISONS)
+    assert report["deblur tiled"]["max_abs_diff"] == 0
+    assert report["deskew tiled"]["max_abs_diff"] == 0
+    assert report["clahe tiled"]["min"] >= 0.99
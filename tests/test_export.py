@@ -0,0 +1,221 @@
+import io
+import zipfile
+import zlib
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+from minio.error import S3Error
+
+from services.ingestion_service import export, minio_client
+from services.ingestion_service.export import ExportChanged, ExportEntry, ZipLayout
+from services.ingestion_service.routers.export_router import _byte_range
+
+MTIME = datetime(2024, 5, 6, 7, 8, 10)
+GiB4 = 1 << 32
+
+
+class FakeBucket:
+    """iter_object over in-memory objects; "zero:<size>" objects are that many zero bytes."""
+
+    def __init__(self, objects: dict = None):
+        self.objects = objects or {}
+        self.etags = {path: f"etag-{path}" for path in self.objects}
+        self.reads = []
+
+    def iter_object(self, bucket, object_name, offset=0, length=0, chunk_size=1024 * 1024, etag=None):
+        path = f"{bucket}/{object_name}"
+        self.reads.append((path, offset, length))
+        if etag is not None and etag != self.etags.get(path, f"etag-{path}"):
+            raise S3Error("PreconditionFailed", "At least one of the pre-conditions you specified did not hold",
+                          object_name, None, None, None)
+        if path.startswith("b/zero:"):
+            size = int(path.split(":")[1])
+            length = length or size - offset
+            while length:
+                n = min(length, chunk_size)
+                yield bytes(n)
+                length -= n
+            return
+        data = self.objects[path]
+        data = data[offset:offset + length] if length else data[offset:]
+        for i in range(0, len(data), chunk_size):
+            yield data[i:i + chunk_size]
+
+
+@pytest.fixture
+def bucket(monkeypatch, fake_redis):
+    store = FakeBucket()
+    monkeypatch.setattr(export, "iter_object", store.iter_object)
+    return store
+
+
+def _entry(store: FakeBucket, name: str, data: bytes) -> ExportEntry:
+    path = f"b/{name}"
+    store.objects[path] = data
+    store.etags[path] = f"etag-{path}"
+    return ExportEntry(name, path, len(data), f"etag-{path}", MTIME)
+
+
+def _archive(entries) -> bytes:
+    return b"".join(ZipLayout(entries).iter_range())
+
+
+class _Virtual(io.RawIOBase):
+    """A seekable view of an archive that only reads the byte ranges asked for."""
+
+    def __init__(self, layout: ZipLayout):
+        self.layout = layout
+        self.pos = 0
+
+    def seekable(self):
+        return True
+
+    def readable(self):
+        return True
+
+    def seek(self, offset, whence=0):
+        self.pos = {0: offset, 1: self.pos + offset, 2: self.layout.total + offset}[whence]
+        return self.pos
+
+    def tell(self):
+        return self.pos
+
+    def readinto(self, buf):
+        end = min(self.pos + len(buf), self.layout.total)
+        data = b"".join(self.layout.iter_range(self.pos, end)) if end > self.pos else b""
+        buf[:len(data)] = data
+        self.pos += len(data)
+        return len(data)
+
+
+def test_zip_round_trips_through_zipfile(bucket):
+    entries = [ExportEntry("manifest.json", data=b'{"files": []}', mtime=MTIME),
+               _entry(bucket, "a.png", b"\x89PNG" + bytes(range(256)) * 40),
+               _entry(bucket, "b.jpg", b""),
+               _entry(bucket, "c/été.pdf", b"%PDF-1.7 " * 1000)]
+    layout = ZipLayout(entries)
+    data = _archive(entries)
+    assert len(data) == layout.total
+
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        assert zf.testzip() is None
+        infos = zf.infolist()
+        assert [i.filename for i in infos] == [e.name for e in entries]
+        assert [i.header_offset for i in infos] == [o[0] for o in layout.offsets]
+        assert all(i.compress_type == zipfile.ZIP_STORED for i in infos)
+        assert infos[1].date_time == (2024, 5, 6, 7, 8, 10)
+        for entry in entries:
+            expected = entry.data if entry.data is not None else bucket.objects[entry.path]
+            assert zf.read(entry.name) == expected
+
+
+def test_every_range_matches_the_whole_archive(bucket):
+    entries = [ExportEntry("manifest.json", data=b"{}", mtime=MTIME),
+               _entry(bucket, "a.png", bytes(range(256)) * 3),
+               _entry(bucket, "b.png", b"xyz" * 100)]
+    layout = ZipLayout(entries)
+    whole = _archive(entries)
+    for start in range(0, layout.total, 37):
+        for end in (start + 1, start + 50, layout.total):
+            end = min(end, layout.total)
+            assert b"".join(layout.iter_range(start, end)) == whole[start:end]
+
+
+def test_crcs_are_cached_so_a_resume_reads_only_its_range(bucket):
+    entries = [_entry(bucket, "a.png", b"a" * 5000), _entry(bucket, "b.png", b"b" * 5000)]
+    layout = ZipLayout(entries)
+    whole = _archive(entries)
+
+    fresh = [_entry(bucket, "a.png", b"a" * 5000), _entry(bucket, "b.png", b"b" * 5000)]
+    assert all(e.crc is None for e in fresh)
+    bucket.reads.clear()
+    start = layout.offsets[1][1] + 100  # resume in the middle of b.png's data
+    assert b"".join(ZipLayout(fresh).iter_range(start)) == whole[start:]
+    assert bucket.reads == [("b/b.png", 100, 4900)]
+    assert [e.crc for e in fresh] == [zlib.crc32(b"a" * 5000), zlib.crc32(b"b" * 5000)]
+
+
+def test_zip64_for_large_entries_and_offsets(bucket):
+    big = ExportEntry("big.bin", "b/zero:%d" % (GiB4 + 10), GiB4 + 10, "etag-b/zero:%d" % (GiB4 + 10), MTIME)
+    big.crc = 0  # known, so building the directory never streams 4 GiB
+    after = _entry(bucket, "after.png", b"after")
+    before = _entry(bucket, "before.png", b"before")
+    before.crc, after.crc = zlib.crc32(b"before"), zlib.crc32(b"after")
+    entries = [before, big, after]
+    layout = ZipLayout(entries)
+    assert layout.offsets[2][0] > GiB4  # after.png's header is past 4 GiB
+
+    with zipfile.ZipFile(_Virtual(layout)) as zf:
+        infos = zf.infolist()
+        assert [i.file_size for i in infos] == [6, GiB4 + 10, 5]
+        assert [i.header_offset for i in infos] == [o[0] for o in layout.offsets]
+        assert zf.read("before.png") == b"before"
+        assert zf.read("after.png") == b"after"  # local header located through the ZIP64 extra
+        with zf.open("big.bin") as f:
+            assert f.read(16) == bytes(16)
+
+
+def test_zip64_end_records_for_many_entries(bucket):
+    entries = [ExportEntry(f"{n}.txt", data=b"x", mtime=MTIME) for n in range(0xFFFF)]
+    layout = ZipLayout(entries)
+    assert layout._end_records()[:4] == b"PK\x06\x06"
+    with zipfile.ZipFile(_Virtual(layout)) as zf:
+        assert len(zf.infolist()) == 0xFFFF
+        assert zf.read("65534.txt") == b"x"
+
+    few = ZipLayout(entries[:10])
+    assert few._end_records()[:4] == b"PK\x05\x06"
+
+
+def test_object_changed_since_listing_fails_the_stream(bucket):
+    entries = [_entry(bucket, "a.png", b"a" * 100), _entry(bucket, "b.png", b"b" * 100)]
+    bucket.etags["b/b.png"] = "replaced"
+    with pytest.raises(ExportChanged):
+        b"".join(ZipLayout(entries).iter_range())
+    with pytest.raises(ExportChanged):
+        b"".join(export.iter_pdf(entries))
+
+
+def test_iter_object_sends_if_match(monkeypatch):
+    calls = []
+
+    class Response:
+        def stream(self, chunk_size):
+            yield b"data"
+
+        def close(self):
+            pass
+
+        def release_conn(self):
+            pass
+
+    client = SimpleNamespace(get_object=lambda *a, **k: calls.append((a, k)) or Response())
+    monkeypatch.setattr(minio_client, "get_minio_client", lambda: client)
+    assert list(minio_client.iter_object("b", "o", 5, 10, etag="abc")) == [b"data"]
+    assert list(minio_client.iter_object("b", "o")) == [b"data"]
+    assert calls[0] == (("b", "o"), {"offset": 5, "length": 10, "request_headers": {"If-Match": '"abc"'}})
+    assert calls[1][1]["request_headers"] is None
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, None),
+    ("bytes=0-99", (0, 100)),
+    ("bytes=100-", (100, 1000)),
+    ("bytes=-100", (900, 1000)),
+    ("bytes=-5000", (0, 1000)),
+    ("bytes=990-5000", (990, 1000)),
+    ("bytes=0-1,5-9", None),
+    ("items=0-9", None),
+    ("bytes=a-b", None),
+])
+def test_byte_range(header, expected):
+    assert _byte_range(header, 1000) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=1000-", "bytes=2000-3000"])
+def test_unsatisfiable_range(header):
+    with pytest.raises(HTTPException) as e:
+        _byte_range(header, 1000)
+    assert e.value.status_code == 416 and e.value.headers["Content-Range"] == "bytes */1000"
@@ -0,0 +1,91 @@
+import random
+
+import pytest
+
+from common.config.settings import settings
+from services.ingestion_service import fair_scheduler as fs
+
+
+def _drr_one_visit_at_a_time(tenants, deficits, costs):
+    """Reference deficit round-robin: move the ring one tenant at a time."""
+    n = len(tenants)
+    deficits = list(deficits)
+    credits = [0] * n
+    steps, j = 0, 0
+    while deficits[j] < costs[j]:
+        steps += 1
+        j = steps % n
+        quantum = settings.FAIR_QUANTUM_PAGES * fs.weight(tenants[j])
+        deficits[j] += quantum
+        credits[j] += quantum
+    return steps, j, credits
+
+
+@pytest.fixture
+def weights(monkeypatch):
+    monkeypatch.setattr(settings, "FAIR_TENANT_WEIGHTS", "heavy=3,light=0.5")
+    monkeypatch.setattr(fs, "_weights", None)
+
+
+def test_pick_matches_stepwise_round_robin(weights):
+    rng = random.Random(7)
+    names = ["a", "b", "heavy", "light", "c"]
+    for _ in range(2000):
+        n = rng.randint(1, 5)
+        tenants = rng.sample(names, n)
+        deficits = [rng.choice([0, 0, rng.uniform(0, 60)]) for _ in tenants]
+        costs = [rng.randint(1, 400) for _ in tenants]
+        assert fs._pick(tenants, deficits, costs) == _drr_one_visit_at_a_time(tenants, deficits, costs)
+
+
+def test_head_that_can_afford_its_job_goes_first():
+    assert fs._pick(["a", "b"], [50.0, 0.0], [30, 1]) == (0, 0, [0, 0])
+
+
+@pytest.fixture
+def sent(monkeypatch, fake_redis):
+    """Jobs handed to Celery, in order, instead of apply_async."""
+    from services.ingestion_service import tasks
+
+    calls = []
+    monkeypatch.setattr(tasks.preprocess_job, "apply_async",
+                        lambda args, kwargs, task_id, priority: calls.append((args[0], priority)))
+    monkeypatch.setattr(fs, "_weights", None)
+    return calls
+
+
+def _submit(batch_id, tenant, pages, cls=fs.BULK):
+    return fs.submit(batch_id, [f"documents/{batch_id}.pdf"], pages, {}, tenant, cls, fs.CELERY_PRIORITY[cls])
+
+
+def test_small_tenant_is_not_stuck_behind_a_backlog(sent, monkeypatch):
+    monkeypatch.setattr(settings, "FAIR_MAX_DISPATCHED", 0)  # hold everything while queueing
+    for n in range(20):
+        _submit(f"big{n}", "BR-big", 50)
+    for n in range(3):
+        _submit(f"small{n}", "BR-small", 5)
+    assert sent == [] and fs.queued_jobs() == 23
+
+    monkeypatch.setattr(settings, "FAIR_MAX_DISPATCHED", 1000)
+    monkeypatch.setattr(settings, "FAIR_INTERACTIVE_RESERVED", 0)
+    fs.dispatch()
+    order = [batch for batch, _ in sent]
+    assert len(order) == 23
+    assert max(order.index(f"small{n}") for n in range(3)) < 6
+    assert fs.queued_jobs() == 0
+
+
+def test_interactive_jobs_go_first_and_keep_reserved_slots(sent, monkeypatch):
+    monkeypatch.setattr(settings, "FAIR_MAX_DISPATCHED", 3)
+    monkeypatch.setattr(settings, "FAIR_INTERACTIVE_RESERVED", 1)
+    bulk = [_submit(f"bulk{n}", "BR-1", 40) for n in range(4)]
+    assert [b for b, _ in sent] == ["bulk0", "bulk1"]  # the third slot is kept for interactive work
+
+    kyc = _submit("kyc", "BR-2", 1, fs.INTERACTIVE)
+    assert sent[-1] == ("kyc", fs.CELERY_PRIORITY[fs.INTERACTIVE])
+
+    fs.job_finished(kyc)  # bulk is still at its limit of two
+    assert len(sent) == 3
+    fs.job_finished(bulk[0])
+    assert [b for b, _ in sent][-1] == "bulk2"
+    assert fs.metrics()["classes"][fs.BULK]["queued"] == 1
@@ -0,0 +1,70 @@
+import time
+
+import pytest
+
+from services.scripts import loadtest
+
+
+class _Response:
+    def __init__(self, status_code, body=None):
+        self.status_code = status_code
+        self._body = body
+        self.headers = {}
+        self.text = ""
+
+    def json(self):
+        return self._body
+
+
+class _Session:
+    """POST /upload returns batch b1; GET /batch_status walks through `statuses`."""
+
+    def __init__(self, statuses):
+        self.statuses = list(statuses)
+
+    def post(self, url, **_):
+        return _Response(200, {"batch_id": "b1"})
+
+    def get(self, url, **_):
+        files = self.statuses.pop(0) if len(self.statuses) > 1 else self.statuses[0]
+        return _Response(200, {"files": files})
+
+
+def _file(status, error=None):
+    return {"status": status, "error": error, "timings": {"started": 1.0, "finished": 3.0}}
+
+
+def _run(monkeypatch, *statuses):
+    monkeypatch.setattr(loadtest, "_session", lambda: _Session(statuses))
+    docs = [{"name": "a.png", "data": b"x", "mime": "image/png", "pages": 1}] * 2
+    return loadtest.run_batch("http://ingestion", docs, time.time(), poll_interval=0, timeout=5)
+
+
+def test_batch_completes_once_every_file_is_enhanced(monkeypatch):
+    result = _run(monkeypatch, [_file("enhancing"), _file("enhanced")], [_file("enhanced"), _file("enhanced")])
+    assert result["status"] == "completed" and result["hops"]["process"] == 2.0
+
+
+def test_failed_files_end_the_batch_without_waiting_for_the_timeout(monkeypatch):
+    result = _run(monkeypatch, [_file("failed", "decode error"), _file("enhanced")])
+    assert result["status"] == "processing_failed"
+    assert result["failed_documents"] == 1 and result["error"] == "decode error"
+    assert result["hops"]["end_to_end"] < 5
+
+
+def test_summary_reports_failures_apart_from_completed_batches():
+    def batch(status, end_to_end, **extra):
+        return {"status": status, "documents": 2, "pages": 3, "completed_at": 10.0,
+                "hops": {"end_to_end": end_to_end}, **extra}
+
+    summary = loadtest.summarize([
+        batch("completed", 1.0),
+        batch("processing_failed", 4.0, failed_documents=1, error="decode error"),
+        {"status": "failed", "documents": 1, "pages": 1, "error": "/upload 500: boom"},
+    ], started_at=0.0)
+    assert summary["batches"] == {"completed": 1, "processing_failed": 1, "failed": 1, "submitted": 3}
+    assert summary["documents_completed"] == 2 and summary["documents_failed"] == 1
+    assert summary["latency_s"]["end_to_end"]["max"] == 1.0
+    assert summary["failed_latency_s"]["end_to_end"]["max"] == 4.0
+    assert summary["errors"] == {"decode error": 1, "/upload 500: boom": 1}
+    assert summary["docs_per_s"] == pytest.approx(0.2)
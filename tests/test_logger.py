@@ -0,0 +1,57 @@
+import json
+import os
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+from common.utils import logger as log
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _run(code: str, log_format: str = "text") -> str:
+    """stderr of code run in a fresh interpreter (the listener is process-wide state)."""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([ROOT, *sys.path]), LOG_FORMAT=log_format)
+    proc = subprocess.run([sys.executable, "-c", textwrap.dedent(code)], env=env, cwd=ROOT,
+                          capture_output=True, text=True, timeout=60)
+    assert proc.returncode == 0, proc.stderr
+    return proc.stderr
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs fork")
+def test_forked_child_gets_its_own_listener():
+    err = _run("""
+        import os
+        from common.utils.logger import get_logger
+
+        logger = get_logger("fork_test")
+        logger.warning("from parent")
+        pid = os.fork()
+        if pid == 0:
+            logger.warning("from child")
+            raise SystemExit  # atexit flushes the child's queue
+        os.waitpid(pid, 0)
+    """)
+    lines = [line for line in err.splitlines() if "from " in line]
+    assert sorted(line.split(" - ")[-1] for line in lines) == ["from child", "from parent"]
+
+
+def test_context_and_extra_fields_reach_json_output():
+    err = _run("""
+        from common.utils.logger import get_logger, log_context
+
+        with log_context(batch_id="b1", page=3):
+            get_logger("json_test").warning("page %d done", 3, extra={"ms": 12})
+    """, log_format="json")
+    [entry] = [json.loads(line) for line in err.splitlines() if line.startswith("{")]
+    assert entry["message"] == "page 3 done"
+    assert (entry["batch_id"], entry["page"], entry["ms"], entry["level"]) == ("b1", 3, 12, "WARNING")
+
+
+def test_sampling_keeps_warnings():
+    sampling = log.SamplingFilter(0.0)
+    info = log.logging.LogRecord("x", log.logging.INFO, "", 0, "m", (), None)
+    warning = log.logging.LogRecord("x", log.logging.WARNING, "", 0, "m", (), None)
+    assert not sampling.filter(info) and sampling.filter(warning)
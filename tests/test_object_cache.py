@@ -0,0 +1,150 @@
+import os
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from services.preprocessing_service.object_cache import ObjectCache, mapped
+
+
+class FakeStore:
+    """Objects by path, with an ETag per version and a count of GETs."""
+
+    def __init__(self, objects: dict):
+        self.objects = {}
+        self.gets = {}
+        self.stats = 0
+        self.delay = 0
+        for path, data in objects.items():
+            self.write(path, data)
+
+    def write(self, path: str, data: bytes):
+        version = self.objects.get(path, (None, 0))[1] + 1
+        self.objects[path] = (data, version)
+
+    def fetch(self, path: str, f) -> str:
+        self.gets[path] = self.gets.get(path, 0) + 1
+        time.sleep(self.delay)
+        data, version = self.objects[path]
+        for i in range(0, len(data), 4):  # in pieces, like a streamed response
+            f.write(data[i:i + 4])
+        return f'"v{version}"'
+
+    def stat(self, path: str):
+        self.stats += 1
+        if path not in self.objects:
+            return None
+        return SimpleNamespace(etag=f"v{self.objects[path][1]}")
+
+
+def _cache(tmp_path, store, **kwargs):
+    options = {"memory_bytes": 64, "disk_bytes": 256, "memory_max_item": 16, "revalidate_s": 300}
+    options.update(kwargs)
+    return ObjectCache(fetch=store.fetch, stat=store.stat, directory=str(tmp_path / "pid1"), **options)
+
+
+def test_hits_are_served_without_refetching(tmp_path):
+    store = FakeStore({"b/small": b"0123456789", "b/large": b"x" * 100})
+    cache = _cache(tmp_path, store)
+    for _ in range(3):
+        assert cache.get("b/small") == b"0123456789"
+        assert cache.get("b/large") == b"x" * 100
+        with cache.local_path("b/large") as path:
+            assert open(path, "rb").read() == b"x" * 100
+    assert store.gets == {"b/small": 1, "b/large": 1}
+    stats = cache.get_stats()
+    assert stats["misses"] == 2 and stats["memory_hits"] == 2 and stats["disk_hits"] == 5
+    assert stats["memory_items"] == 1  # only the small object fits under memory_max_item
+    assert stats["network_bytes"] == 110
+
+
+def test_disk_lru_evicts_least_recently_used(tmp_path):
+    store = FakeStore({f"b/{n}": bytes([n]) * 100 for n in range(4)})
+    cache = _cache(tmp_path, store)  # 256 disk bytes: two 100-byte objects
+    cache.get("b/0")
+    cache.get("b/1")
+    cache.get("b/0")  # now b/1 is the least recently used
+    cache.get("b/2")
+    assert cache.get_stats()["disk_items"] == 2
+    cache.get("b/0")
+    cache.get("b/1")
+    assert store.gets == {"b/0": 1, "b/1": 2, "b/2": 1}
+    assert len(os.listdir(cache.directory)) == 2
+
+
+def test_pinned_files_are_not_evicted(tmp_path):
+    store = FakeStore({f"b/{n}": bytes([n]) * 100 for n in range(3)})
+    cache = _cache(tmp_path, store)
+    with cache.local_path("b/0") as pinned:
+        cache.get("b/1")
+        cache.get("b/2")
+        assert os.path.exists(pinned)  # b/1 went instead, though b/0 is older
+    cache.get("b/0")
+    assert store.gets == {"b/0": 1, "b/1": 1, "b/2": 1}
+    cache.get("b/1")
+    assert store.gets["b/1"] == 2
+
+
+def test_stale_entries_are_refetched_after_the_revalidation_window(tmp_path):
+    store = FakeStore({"b/doc": b"first version"})
+    cache = _cache(tmp_path, store, revalidate_s=0)
+    assert cache.get("b/doc") == b"first version"
+    assert cache.get("b/doc") == b"first version"  # ETag unchanged: served from cache
+    assert store.gets["b/doc"] == 1 and store.stats == 1
+
+    store.write("b/doc", b"second version")
+    assert cache.get("b/doc") == b"second version"
+    assert store.gets["b/doc"] == 2
+    assert cache.get_stats()["stale"] == 1
+    assert len(os.listdir(cache.directory)) == 1  # the old version's file is gone
+
+
+def test_entries_inside_the_window_are_not_revalidated(tmp_path):
+    store = FakeStore({"b/doc": b"x" * 50})
+    cache = _cache(tmp_path, store, revalidate_s=300)
+    cache.get("b/doc")
+    store.write("b/doc", b"y" * 50)
+    assert cache.get("b/doc") == b"x" * 50
+    assert store.stats == 0
+
+
+def test_concurrent_misses_fetch_once(tmp_path):
+    store = FakeStore({"b/doc": b"z" * 100})
+    store.delay = 0.05
+    cache = _cache(tmp_path, store)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get("b/doc"))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results == [b"z" * 100] * 8
+    assert store.gets == {"b/doc": 1}
+
+
+def test_objects_larger_than_the_disk_budget_are_not_kept(tmp_path):
+    store = FakeStore({"b/huge": b"h" * 1000})
+    cache = _cache(tmp_path, store)
+    with cache.local_path("b/huge") as path:
+        assert os.path.getsize(path) == 1000
+    assert not os.path.exists(path)
+    assert cache.get_stats()["disk_items"] == 0
+
+
+def test_failed_fetch_leaves_nothing_behind(tmp_path):
+    store = FakeStore({})
+    cache = _cache(tmp_path, store)
+    with pytest.raises(KeyError):
+        cache.get("b/missing")
+    assert os.listdir(cache.directory) == []
+
+
+def test_mapped(tmp_path):
+    small, large = tmp_path / "small", tmp_path / "large"
+    small.write_bytes(b"abc")
+    large.write_bytes(b"L" * 4096)
+    with mapped(str(small), mmap_min_bytes=1024) as buf:
+        assert isinstance(buf, bytes) and buf == b"abc"
+    with mapped(str(large), mmap_min_bytes=1024) as buf:
+        assert not isinstance(buf, bytes) and buf[:4] == b"LLLL" and len(buf) == 4096
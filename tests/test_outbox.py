@@ -0,0 +1,113 @@
+import json
+
+import pytest
+
+from common.config.settings import settings
+from services.ingestion_service import outbox_consumer, status_updates
+from services.ingestion_service.models import FileMetadata
+from services.preprocessing_service import outbox
+
+
+def _page(name: str, page: int = 1, **extra) -> dict:
+    return dict({"original": f"documents/b1/{name}", "enhanced": f"documents/enhanced/b1/{name}_p{page}.png",
+                 "page": page, "pipeline_version": settings.PIPELINE_VERSION}, **extra)
+
+
+@pytest.fixture
+def db(fake_redis, sqlite_session, monkeypatch):
+    monkeypatch.setattr(outbox_consumer, "SessionLocal", sqlite_session)
+    with sqlite_session() as session:
+        for name in ("a.pdf", "b.jpg"):
+            session.add(FileMetadata(batch_id="b1", file_name=name, minio_path=f"documents/b1/{name}",
+                                     branch_id="BR-1", file_type="application/pdf", size_bytes=1,
+                                     status="uploaded"))
+        session.commit()
+    return sqlite_session
+
+
+@pytest.fixture
+def completed(monkeypatch):
+    calls = []
+    monkeypatch.setattr(status_updates, "track_completed", lambda batch_id, pages: calls.append((batch_id, pages)))
+    return calls
+
+
+def _records(sessionmaker) -> dict:
+    with sessionmaker() as session:
+        return {r.file_name: (r.status, r.additional_meta) for r in session.query(FileMetadata)}
+
+
+def _drain():
+    outbox_consumer.run("test", once=True)
+
+
+def test_pages_then_batch_reach_the_database(db, completed, fake_redis):
+    assert outbox.publish_page("b1", _page("a.pdf", 1))
+    assert outbox.publish_page("b1", _page("a.pdf", 2))
+    _drain()
+    status, meta = _records(db)["a.pdf"]
+    assert status == "enhancing" and meta["pages_done"] == 2
+    assert completed == []
+
+    results = [_page("a.pdf", 1), _page("a.pdf", 2), {"original": "documents/b1/b.jpg", "error": "unreadable"}]
+    assert outbox.publish_batch("b1", results, {"enqueued": 1.0}, {"peak_rss_bytes": 1})
+    _drain()
+    records = _records(db)
+    assert records["a.pdf"][0] == "enhanced" and records["a.pdf"][1]["timings"]["enqueued"] == 1.0
+    assert records["b.jpg"][0] == "failed" and records["b.jpg"][1]["error"] == "unreadable"
+    assert completed == [("b1", 3)]
+    assert fake_redis.xpending(settings.STATUS_STREAM, settings.STATUS_CONSUMER_GROUP)["pending"] == 0
+
+
+def test_redelivered_events_change_nothing(db, completed, fake_redis):
+    outbox.publish_batch("b1", [_page("a.pdf")], {}, {})
+    _drain()
+    before = _records(db)
+    # the same entries again, as after a crash between commit and XACK
+    entries = fake_redis.xrange(settings.STATUS_STREAM)
+    outbox_consumer.handle(fake_redis, entries)
+    late = [{"type": "page", "batch_id": "b1", "result": _page("a.pdf")}]
+    with db() as session:
+        status_updates.apply_events(session, late)
+        session.commit()
+    after = _records(db)
+    assert after["a.pdf"][0] == before["a.pdf"][0] == "enhanced"  # never moves back to enhancing
+    assert after["a.pdf"][1]["pages"] == before["a.pdf"][1]["pages"]
+    assert completed == [("b1", 1)]
+
+
+def test_malformed_entries_are_dead_lettered_without_blocking_the_rest(db, completed, fake_redis):
+    fake_redis.xadd(settings.STATUS_STREAM, {"type": "page", "batch_id": "b1", "data": "{not json"})
+    outbox.publish_page("b1", _page("a.pdf"))
+    _drain()
+    [(_, dead)] = fake_redis.xrange(settings.STATUS_DEAD_LETTER_STREAM)
+    assert dead["reason"].startswith("malformed entry")
+    assert _records(db)["a.pdf"][1]["pages_done"] == 1
+
+
+def test_a_failing_event_is_retried_alone(db, completed, fake_redis, monkeypatch):
+    real_apply_events = outbox_consumer.apply_events
+
+    def apply_events(session, events):
+        if any(e["result"]["page"] == 2 for e in events):
+            raise ValueError("bad page")
+        return real_apply_events(session, events)
+
+    monkeypatch.setattr(outbox_consumer, "apply_events", apply_events)
+    outbox.publish_page("b1", _page("a.pdf", 1))
+    outbox.publish_page("b1", _page("a.pdf", 2))
+    outbox.publish_page("b1", _page("b.jpg", 1))
+    _drain()
+    records = _records(db)
+    assert records["a.pdf"][1]["pages_done"] == 1 and records["b.jpg"][1]["pages_done"] == 1
+    [pending] = fake_redis.xpending_range(settings.STATUS_STREAM, settings.STATUS_CONSUMER_GROUP, "-", "+", 10)
+    assert json.loads(fake_redis.xrange(settings.STATUS_STREAM, pending["message_id"],
+                                        pending["message_id"])[0][1]["data"])["result"]["page"] == 2
+
+
+def test_publish_reports_an_unreachable_stream(monkeypatch):
+    def down():
+        raise ConnectionError("redis down")
+
+    monkeypatch.setattr(outbox, "get_redis", down)
+    assert not outbox.publish_batch("b1", [], {}, {})
@@ -0,0 +1,117 @@
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+from common.config.settings import settings
+from services.preprocessing_service.processor import pdf_analyzer
+from services.preprocessing_service.processor.classifier import classify_text
+from services.preprocessing_service.processor.pdf_analyzer import DIGITAL, RENDER, SCANNED
+
+fitz = pytest.importorskip("fitz")
+
+TEXT = "Income Tax Department, Government of India. Permanent Account Number ABCDE1234F"
+
+
+def _jpeg(width=1000, height=1300) -> bytes:
+    img = np.full((height, width, 3), 245, np.uint8)
+    cv2.putText(img, "SCANNED PAGE", (100, 300), cv2.FONT_HERSHEY_SIMPLEX, 3, (20, 20, 20), 6)
+    return cv2.imencode(".jpg", img)[1].tobytes()
+
+
+def _page(doc, image: bytes = None, rect=None, text: str = None, render_mode: int = 0):
+    page = doc.new_page(width=500, height=650)
+    if image is not None:
+        page.insert_image(rect or page.rect, stream=image)
+    if text:
+        page.insert_textbox(fitz.Rect(40, 40, 460, 300), text, render_mode=render_mode)
+    return page
+
+
+def _pages(tmp_path, build) -> list:
+    """(kind, source, text, image bytes) of every page of the PDF build(doc) makes."""
+    doc = fitz.open()
+    build(doc)
+    path = str(tmp_path / "doc.pdf")
+    doc.save(path)
+    doc.close()
+    out = []
+    for _, img_path, content, _ in pdf_analyzer.iter_pdf_pages(path):
+        with open(img_path, "rb") as f:
+            out.append((content["kind"], content["source"], content["text"], f.read()))
+        os.remove(img_path)
+    return out
+
+
+def test_full_page_scan_is_extracted_as_stored(tmp_path):
+    scan = _jpeg()
+    [(kind, source, text, data)] = _pages(tmp_path, lambda doc: _page(doc, scan))
+    assert (kind, source, text) == (SCANNED, "embedded", "")
+    assert data == scan  # the JPEG stream itself, not a re-encode
+
+
+def test_scan_with_an_invisible_ocr_layer_keeps_its_text(tmp_path):
+    [(kind, source, text, _)] = _pages(tmp_path, lambda doc: _page(doc, _jpeg(), text=TEXT, render_mode=3))
+    assert (kind, source) == (SCANNED, "embedded")
+    assert "Permanent Account Number" in text
+
+
+def test_scan_with_visible_text_on_top_is_rendered(tmp_path):
+    [(kind, source, _, data)] = _pages(tmp_path, lambda doc: _page(doc, _jpeg(), text=TEXT))
+    assert (kind, source) == (DIGITAL, "rendered")
+    assert data[:8] == b"\x89PNG\r\n\x1a\n"
+
+
+def test_digital_and_mixed_pages(tmp_path):
+    def build(doc):
+        _page(doc, text=TEXT)  # text layer only
+        _page(doc, text="short")  # too little text to go by
+        _page(doc, _jpeg(), rect=fitz.Rect(50, 50, 250, 250))  # a photo on a page, not a scan
+        _page(doc, _jpeg(400, 520))  # a low-resolution scan is still taken as-is
+        _page(doc, _jpeg(6000, 7800))  # far larger than the render: rendered down
+
+    pages = _pages(tmp_path, build)
+    assert [(kind, source) for kind, source, _, _ in pages] == [
+        (DIGITAL, "rendered"), (RENDER, "rendered"), (RENDER, "rendered"),
+        (SCANNED, "embedded"), (RENDER, "rendered"),
+    ]
+
+
+def test_native_extraction_off_renders_everything(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "PDF_NATIVE_EXTRACTION", False)
+    pages = _pages(tmp_path, lambda doc: (_page(doc, _jpeg()), _page(doc, text=TEXT)))
+    assert [(kind, source) for kind, source, _, _ in pages] == [(RENDER, "rendered"), (RENDER, "rendered")]
+
+
+def test_only_requested_pages_are_produced(tmp_path):
+    doc = fitz.open()
+    for n in range(4):
+        _page(doc, text=f"Page {n}")
+    path = str(tmp_path / "doc.pdf")
+    doc.save(path)
+    doc.close()
+    got = []
+    for index, img_path, content, _ in pdf_analyzer.iter_pdf_pages(path, pages=[3, 1]):
+        got.append((index, content["text"]))
+        os.remove(img_path)
+    assert got == [(3, "Page 3"), (1, "Page 1")]
+
+
+@pytest.mark.parametrize("text, label", [
+    (TEXT, "pan"),
+    ("Unique Identification Authority of India\nAadhaar 1234 5678 9012", "aadhaar"),
+    ("ELECTION COMMISSION OF INDIA  Elector's Photo Identity Card", "voter_id"),
+    ("Transport Department — Driving Licence, DL No MH12 2011", "driving_license"),
+])
+def test_classify_text(text, label):
+    found, confidence = classify_text(text)
+    assert found == label and 0.6 < confidence <= 0.99
+
+
+@pytest.mark.parametrize("text", [
+    "Quarterly sales report",  # nothing matches
+    "Income Tax Department ... Election Commission",  # tied: the image model decides
+])
+def test_classify_text_leaves_unclear_pages_to_the_image_model(text):
+    assert classify_text(text) is None
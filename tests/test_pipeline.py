@@ -0,0 +1,164 @@
+import os
+import threading
+import time
+
+import pytest
+
+from common.config.settings import settings
+from services.preprocessing_service import pipeline
+
+
+def test_read_ahead_yields_in_order_and_discards_the_rest():
+    discarded = []
+    produced = []
+
+    def pages():
+        for n in range(10):
+            produced.append(n)
+            yield n
+
+    it = pipeline.read_ahead(pages(), 2, discard=discarded.append)
+    assert [next(it), next(it)] == [0, 1]
+    it.close()
+    assert produced[:2] == [0, 1] and len(produced) <= 5  # bounded: at most `ahead` buffered
+    assert sorted(discarded) == produced[2:]
+
+
+def test_read_ahead_reraises_producer_errors_after_the_items_before_them():
+    def pages():
+        yield 1
+        yield 2
+        raise ValueError("render failed")
+
+    got = []
+    with pytest.raises(ValueError):
+        for n in pipeline.read_ahead(pages(), 3, discard=lambda n: None):
+            got.append(n)
+    assert got == [1, 2]
+
+
+def test_prefetch_reports_errors_per_item():
+    def open_fn(n):
+        if n == 2:
+            raise OSError("fetch failed")
+        return n * 10
+
+    out = list(pipeline.prefetch([1, 2, 3], open_fn, 2, discard=lambda v: None))
+    assert [(item, value) for item, value, _ in out] == [(1, 10), (2, None), (3, 30)]
+    assert isinstance(out[1][2], OSError)
+
+
+def test_page_uploads_bound_in_flight_work_and_raise_the_first_failure(monkeypatch):
+    monkeypatch.setattr(settings, "PIPELINE_UPLOADS_IN_FLIGHT", 2)
+    running, peak, lock = [0], [0], threading.Lock()
+
+    def upload(n):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.02)
+        with lock:
+            running[0] -= 1
+        if n == 3:
+            raise IOError("upload failed")
+
+    uploads = pipeline.PageUploads()
+    for n in range(4):
+        uploads.submit(upload, n)
+    with pytest.raises(IOError):
+        uploads.wait()
+    assert peak[0] <= 2
+
+
+def _pdf(path, pages: int):
+    fitz = pytest.importorskip("fitz")
+    doc = fitz.open()
+    for n in range(pages):
+        doc.new_page().insert_text((72, 72), f"Page {n + 1}")
+    doc.save(str(path))
+    doc.close()
+
+
+def test_pdf_pages_render_under_the_fitz_lock_and_release_it_between_pages(tmp_path, monkeypatch):
+    from services.preprocessing_service.processor import converter, pdf_analyzer
+
+    _pdf(tmp_path / "doc.pdf", 3)
+    real_page_image = pdf_analyzer.page_image
+    held = []
+
+    def elsewhere_can_lock() -> bool:
+        result = []
+
+        def probe():
+            if converter.FITZ_LOCK.acquire(blocking=False):
+                converter.FITZ_LOCK.release()
+                result.append(True)
+            else:
+                result.append(False)
+
+        t = threading.Thread(target=probe)
+        t.start()
+        t.join()
+        return result[0]
+
+    def page_image(doc, page, analysis):
+        held.append(not elsewhere_can_lock())
+        return real_page_image(doc, page, analysis)
+
+    monkeypatch.setattr(pdf_analyzer, "page_image", page_image)
+    for _, img_path, _, _ in pdf_analyzer.iter_pdf_pages(str(tmp_path / "doc.pdf")):
+        assert elsewhere_can_lock()  # never held across a yield
+        os.remove(img_path)
+    assert held == [True, True, True]
+
+
+def test_concurrent_render_ahead(tmp_path):
+    from services.preprocessing_service.processor import pdf_analyzer
+
+    _pdf(tmp_path / "doc.pdf", 6)
+    results, errors = [], []
+
+    def render():
+        try:
+            pages = pipeline.read_ahead(pdf_analyzer.iter_pdf_pages(str(tmp_path / "doc.pdf")), 2,
+                                        discard=lambda item: os.remove(item[1]))
+            got = []
+            for index, img_path, content, _ in pages:
+                got.append((index, content["text"]))
+                os.remove(img_path)
+            results.append(got)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=render) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert errors == []
+    assert results == [[(n, f"Page {n + 1}") for n in range(6)]] * 4
+
+
+def test_failed_page_waits_for_the_pages_already_handed_off(tmp_path, monkeypatch):
+    from services.preprocessing_service import checkpoint, main
+
+    _pdf(tmp_path / "doc.pdf", 4)
+    finished = []
+
+    def process_page(batch_id, object_path, page, img_path, is_pdf, usage, uploads, content, reservation):
+        reservation.release()
+        if page == 3:
+            raise RuntimeError("enhance failed")
+
+        def finish():
+            time.sleep(0.1)
+            finished.append(page)
+
+        uploads.submit(finish)
+        return {"page": page}
+
+    monkeypatch.setattr(checkpoint, "save_page_count", lambda *a: None)
+    monkeypatch.setattr(main, "process_page", process_page)
+    with pytest.raises(RuntimeError):
+        main._process_downloaded("b1", "documents/doc.pdf", {}, str(tmp_path / "doc.pdf"), True)
+    assert sorted(finished) == [1, 2]  # uploads run concurrently
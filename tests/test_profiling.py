@@ -0,0 +1,57 @@
+import asyncio
+import threading
+
+import pytest
+
+from common.config import minio_client
+from common.utils import profiling
+
+
+@pytest.fixture
+def stored(monkeypatch):
+    """put_bytes calls as (object name, thread), instead of uploads to MinIO."""
+    calls = []
+    monkeypatch.setattr(minio_client, "put_bytes",
+                        lambda name, data, *a, **k: calls.append((name, threading.get_ident())))
+    return calls
+
+
+def test_async_profiles_are_sampled_and_stored_off_the_loop(stored):
+    async def upload():
+        loop_thread = threading.get_ident()
+        async with profiling.profiled_async("cprofile", "batch1", "upload_files") as profile:
+            await asyncio.sleep(0.02)
+        return loop_thread, profile
+
+    loop_thread, profile = asyncio.run(upload())
+    assert profile.mode == "sample"
+    assert [name for name, _ in stored] == [profile.object_name]
+    assert profile.object_name.startswith("batch1/profiles/upload_files-")
+    assert profile.object_name.endswith(".collapsed")
+    assert stored[0][1] != loop_thread
+
+
+def test_async_profile_is_stored_when_the_block_raises(stored):
+    async def upload():
+        async with profiling.profiled_async("sample", "batch1", "upload_files"):
+            raise ValueError
+
+    with pytest.raises(ValueError):
+        asyncio.run(upload())
+    assert len(stored) == 1
+
+
+def test_unrequested_profiles_start_nothing(stored):
+    async def upload():
+        async with profiling.profiled_async(None, "batch1", "upload_files") as profile:
+            return profile
+
+    assert asyncio.run(upload()) is None
+    assert stored == []
+
+
+def test_sync_profiles_keep_cprofile(stored):
+    with profiling.profiled("cprofile", "batch1", "process_batch") as profile:
+        sum(range(1000))
+    assert profile.mode == "cprofile"
+    assert [name.rsplit(".", 1)[1] for name, _ in stored] == ["prof", "txt"]
@@ -0,0 +1,77 @@
+import cv2
+import numpy as np
+import pytest
+
+from common.config.settings import settings
+from services.preprocessing_service.processor import engine
+from services.preprocessing_service.processor.quality import (
+    STAGE_CLAHE, STAGE_DEBLUR, STAGE_DESKEW, analyze_quality, select_stages,
+)
+
+
+def _page(seed=0, size=(600, 400)):
+    """Black text-like strokes on white paper."""
+    rng = np.random.default_rng(seed)
+    img = np.full(size, 235, np.uint8)
+    for _ in range(60):
+        x, y = int(rng.integers(10, size[1] - 60)), int(rng.integers(10, size[0] - 10))
+        cv2.line(img, (x, y), (x + int(rng.integers(10, 50)), y), 20, 2)
+    return img
+
+
+def _metrics(**overrides):
+    metrics = {"blur_laplacian_var": 500.0, "contrast_std": 80.0, "dynamic_range": 220, "skew_deg": 0.0,
+               "megapixels": 2.0}
+    metrics.update(overrides)
+    return metrics
+
+
+def test_clean_page_needs_no_stages():
+    assert select_stages(_metrics()) == []
+
+
+def test_each_metric_selects_its_stage():
+    assert select_stages(_metrics(blur_laplacian_var=10.0)) == [STAGE_DEBLUR]
+    assert select_stages(_metrics(contrast_std=5.0)) == [STAGE_CLAHE]
+    assert select_stages(_metrics(dynamic_range=40)) == [STAGE_CLAHE]
+    assert select_stages(_metrics(skew_deg=3.0)) == [STAGE_DESKEW]
+
+
+def test_large_skew_is_left_alone():
+    assert select_stages(_metrics(skew_deg=settings.QUALITY_SKEW_MAX_DEG + 5)) == []
+
+
+def test_low_resolution_page_is_not_sharpened():
+    low = settings.QUALITY_MIN_DEBLUR_MEGAPIXELS / 2
+    assert select_stages(_metrics(blur_laplacian_var=10.0, megapixels=low)) == []
+    assert select_stages(_metrics(blur_laplacian_var=10.0, contrast_std=5.0, megapixels=low)) == [STAGE_CLAHE]
+    thumbnail = cv2.GaussianBlur(_page(size=(300, 200)), (0, 0), 2.5)
+    assert STAGE_DEBLUR not in select_stages(analyze_quality(thumbnail))
+
+
+def test_blurred_page_is_gated_to_deblur_and_deblur_sharpens():
+    blurred = cv2.GaussianBlur(_page(), (0, 0), 2.5)
+    metrics = analyze_quality(blurred)
+    assert STAGE_DEBLUR in select_stages(metrics)
+
+    out = engine.stage_deblur(blurred, np.empty_like(blurred), {}).copy()
+    assert cv2.Laplacian(out, cv2.CV_32F).var() > cv2.Laplacian(blurred, cv2.CV_32F).var()
+    assert analyze_quality(out)["blur_laplacian_var"] > metrics["blur_laplacian_var"]
+
+
+def test_tiled_deblur_matches_full_frame(monkeypatch):
+    monkeypatch.setattr(settings, "ENHANCE_TILE_SIZE", 128)
+    page = cv2.GaussianBlur(_page(seed=1), (0, 0), 1.5)
+    full = engine.stage_deblur(page, np.empty_like(page), {}).copy()
+    tiled = engine.tiled_deblur(page, np.empty_like(page), {}).copy()
+    assert np.array_equal(full, tiled)
+
+
+@pytest.mark.parametrize("tile_size", [64, 100, 256, 333])
+def test_tiled_deskew_matches_full_frame(monkeypatch, tile_size):
+    monkeypatch.setattr(settings, "ENHANCE_TILE_SIZE", tile_size)
+    page = _page(seed=2, size=(700, 500))
+    ctx = {"metrics": {"skew_deg": 3.7}}
+    full = engine.stage_deskew(page, np.empty_like(page), ctx).copy()
+    tiled = engine.tiled_deskew(page, np.empty_like(page), ctx).copy()
+    assert np.array_equal(full, tiled)
@@ -0,0 +1,91 @@
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+
+from services.ingestion_service.models import FileMetadata
+from services.scripts import reaper
+
+OLD = datetime.now(timezone.utc) - timedelta(days=30)
+NEW = datetime.now(timezone.utc)
+
+
+class _Bucket:
+    """list_objects / remove_objects over a dict of object name → last modified."""
+
+    def __init__(self, objects: dict):
+        self.objects = objects
+
+    def list_objects(self, bucket, prefix, recursive):
+        for name in sorted(self.objects):
+            if name.startswith(prefix):
+                yield SimpleNamespace(object_name=name, last_modified=self.objects[name], size=10)
+
+    def remove_objects(self, bucket, delete_objects):
+        for d in delete_objects:
+            del self.objects[d._name]
+        return iter(())
+
+
+@pytest.fixture
+def bucket(sqlite_session, monkeypatch):
+    monkeypatch.setattr(reaper, "SessionLocal", sqlite_session)
+    pages = {
+        "1": {"enhanced_path": "documents/enhanced/b1/scan_page001.png",
+              "text_path": "documents/enhanced/b1/scan_page001.txt"},
+        "2": {"enhanced_path": "documents/enhanced/b1/scan_page002.png", "text_path": None},
+    }
+    with sqlite_session() as db:
+        db.add(FileMetadata(batch_id="b1", file_name="scan.pdf", minio_path="documents/b1/scan.pdf",
+                            branch_id="BR-1", file_type="application/pdf", size_bytes=1,
+                            additional_meta={"enhanced_path": pages["2"]["enhanced_path"], "pages": pages}))
+        db.commit()
+    store = _Bucket({
+        "enhanced/b1/scan_page001.png": OLD,
+        "enhanced/b1/scan_page001.txt": OLD,
+        "enhanced/b1/scan_page002.png": OLD,
+        "enhanced/b1/stale_page001.png": OLD,  # from an earlier run, no longer referenced
+        "enhanced/b1/fresh_page001.png": NEW,  # unreferenced but within the retention period
+        "enhanced/b9/lost_page001.png": OLD,  # batch without FileMetadata rows
+        "enhanced/b9/lost_page001.txt": OLD,
+    })
+    monkeypatch.setattr(reaper, "get_minio_client", lambda: store)
+    return store
+
+
+def test_orphaned_batches_are_deleted(bucket):
+    stats = reaper.reconcile_orphans("documents", 7 * 86400, 2, dry_run=False)
+    assert stats["deleted"] == 2 and stats["orphaned_batches"] == 1
+    assert not any(name.startswith("enhanced/b9/") for name in bucket.objects)
+    assert "enhanced/b1/stale_page001.png" in bucket.objects
+
+
+def test_unreferenced_keeps_page_images_and_text_layers(bucket):
+    stats = reaper.reconcile_orphans("documents", 7 * 86400, 2, dry_run=False, unreferenced=True)
+    assert sorted(bucket.objects) == [
+        "enhanced/b1/fresh_page001.png",
+        "enhanced/b1/scan_page001.png",
+        "enhanced/b1/scan_page001.txt",
+        "enhanced/b1/scan_page002.png",
+    ]
+    assert stats["kept_recent"] == 1 and stats["deleted"] == 3
+
+
+def test_dry_run_deletes_nothing(bucket):
+    before = dict(bucket.objects)
+    stats = reaper.reconcile_orphans("documents", 7 * 86400, 2, dry_run=True, unreferenced=True)
+    assert bucket.objects == before and stats["deleted"] == 3
+
+
+def test_sweep_temp_removes_only_old_docintel_files(tmp_path):
+    old, new, other = (tmp_path / f"{reaper.TEMP_PREFIX}old", tmp_path / f"{reaper.TEMP_PREFIX}new",
+                       tmp_path / "unrelated")
+    for path in (old, new, other):
+        path.write_bytes(b"x" * 5)
+    os.utime(old, (time.time() - 7200, time.time() - 7200))
+    os.utime(other, (time.time() - 7200, time.time() - 7200))
+    stats = reaper.sweep_temp(str(tmp_path), 3600, dry_run=False)
+    assert stats == {"temp_dir": str(tmp_path), "removed": 1, "bytes": 5, "failed": 0}
+    assert not old.exists() and new.exists() and other.exists()
@@ -0,0 +1,149 @@
+import os
+import threading
+import time
+
+import pytest
+
+from services.preprocessing_service import scheduler
+from services.preprocessing_service.scheduler import MemoryBudget
+
+
+def _in_background(fn):
+    done = threading.Event()
+
+    def run():
+        fn()
+        done.set()
+
+    threading.Thread(target=run, daemon=True).start()
+    return done
+
+
+def test_reservations_wait_for_room():
+    budget = MemoryBudget(100)
+    first = budget.hold(60)
+    second = budget.hold(40)
+    assert budget.snapshot() == {"budget_bytes": 100, "in_use_bytes": 100, "running_pages": 2}
+
+    admitted = _in_background(lambda: budget.hold(30))
+    assert not admitted.wait(0.1)
+    first.release()
+    assert admitted.wait(1)
+    assert budget.snapshot()["in_use_bytes"] == 70
+    second.release()
+
+
+def test_shrink_admits_waiting_pages():
+    budget = MemoryBudget(100)
+    page = budget.hold(90)
+    admitted = _in_background(lambda: budget.hold(50))
+    assert not admitted.wait(0.1)
+    page.shrink(10)  # only the encoded output is left, waiting for its upload
+    assert admitted.wait(1)
+    assert budget.snapshot()["in_use_bytes"] == 60
+    page.shrink(50)  # never grows
+    assert page.nbytes == 10
+
+
+def test_release_is_idempotent():
+    budget = MemoryBudget(100)
+    page = budget.hold(40)
+    page.release()
+    page.release()
+    page.shrink(0)
+    assert budget.snapshot() == {"budget_bytes": 100, "in_use_bytes": 0, "running_pages": 0}
+
+
+def test_oversized_page_runs_alone():
+    budget = MemoryBudget(100)
+    small = budget.hold(10)
+    usage = {}
+    admitted = _in_background(lambda: budget.hold(500, usage))
+    assert not admitted.wait(0.1)
+    small.release()
+    assert admitted.wait(1)
+    assert usage["estimated_peak_page_bytes"] == 500 and usage["budget_wait_s"] > 0
+
+
+def test_reserve_context_manager_releases_on_error():
+    budget = MemoryBudget(100)
+    with pytest.raises(RuntimeError):
+        with budget.reserve(80):
+            raise RuntimeError
+    assert budget.snapshot()["in_use_bytes"] == 0
+
+
+def test_pdf_pages_reserve_before_rendering(tmp_path, monkeypatch):
+    fitz = pytest.importorskip("fitz")
+    from services.preprocessing_service.processor import pdf_analyzer
+
+    pdf = tmp_path / "doc.pdf"
+    doc = fitz.open()
+    for width, height in ((200, 300), (400, 100)):
+        doc.new_page(width=width, height=height)
+    doc.save(str(pdf))
+    doc.close()
+
+    budget = MemoryBudget(1 << 40)
+    events = []
+    real_page_image = pdf_analyzer.page_image
+
+    def reserve(dimensions):
+        events.append(("reserve", len(events) // 2, budget.snapshot()["in_use_bytes"]))
+        return budget.hold(scheduler.estimate_page_bytes(*dimensions))
+
+    def page_image(doc, page, analysis):
+        events.append(("render", page.number, budget.snapshot()["in_use_bytes"]))
+        return real_page_image(doc, page, analysis)
+
+    monkeypatch.setattr(pdf_analyzer, "page_image", page_image)
+    pages = list(pdf_analyzer.iter_pdf_pages(str(pdf), reserve=reserve))
+
+    first = scheduler.estimate_page_bytes(400, 600, 3)
+    assert events == [("reserve", 0, 0), ("render", 0, first),
+                      ("reserve", 1, first), ("render", 1, first + scheduler.estimate_page_bytes(800, 200, 3))]
+    for _, img_path, _, reservation in pages:
+        reservation.release()
+        os.remove(img_path)
+    assert budget.snapshot()["in_use_bytes"] == 0
+
+
+def test_failed_render_releases_its_reservation(tmp_path, monkeypatch):
+    fitz = pytest.importorskip("fitz")
+    from services.preprocessing_service.processor import pdf_analyzer
+
+    pdf = tmp_path / "doc.pdf"
+    doc = fitz.open()
+    doc.new_page()
+    doc.save(str(pdf))
+    doc.close()
+
+    def page_image(doc, page, analysis):
+        raise RuntimeError("render failed")
+
+    budget = MemoryBudget(1 << 40)
+    monkeypatch.setattr(pdf_analyzer, "page_image", page_image)
+    with pytest.raises(RuntimeError):
+        list(pdf_analyzer.iter_pdf_pages(str(pdf), reserve=lambda dimensions: budget.hold(1000)))
+    assert budget.snapshot()["running_pages"] == 0
+
+
+def test_scanned_pages_reserve_for_the_embedded_image(tmp_path):
+    fitz = pytest.importorskip("fitz")
+    import cv2
+    import numpy as np
+    from services.preprocessing_service.processor import pdf_analyzer
+
+    pdf = tmp_path / "doc.pdf"
+    doc = fitz.open()
+    scan = cv2.imencode(".jpg", np.full((2600, 2000, 3), 240, np.uint8))[1].tobytes()
+    doc.new_page(width=500, height=650).insert_image(fitz.Rect(0, 0, 500, 650), stream=scan)
+    doc.new_page(width=500, height=650)
+    doc.save(str(pdf))
+    doc.close()
+
+    reserved = []
+    for _, img_path, content, _ in pdf_analyzer.iter_pdf_pages(str(pdf), reserve=reserved.append):
+        os.remove(img_path)
+    # the 2000x2600 scan is used as-is, at twice the 2x render's width and height
+    assert reserved == [(2000, 2600, 3), (1000, 1300, 3)]